@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import pickle
+from collections.abc import Mapping
+
+from . import definitions, markov
+
+CACHE_FORMAT = 1
+
+_loaded = {}
+
+
+class FrozenPathMap(Mapping):
+    """
+    Read-only view of the area path map. Observations are stored as tuples
+    so predictors sharing one instance cannot mutate it.
+    """
+
+    def __init__(self, path_map, digest, counts=None):
+        self._data = {key: tuple(value) for key, value in path_map.items()}
+        self._digest = digest
+        self._counts = counts
+        self._transitions = None
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def digest(self) -> str:
+        """
+        sha1 of the JSON file the map was parsed from
+        """
+        return self._digest
+
+    @property
+    def transitions(self) -> markov.TransitionTable:
+        if self._transitions is None:
+            if self._counts is not None:
+                self._transitions = markov.TransitionTable(self._counts)
+            else:
+                self._transitions = markov.TransitionTable.from_path_map(self)
+                self._counts = self._transitions.counts
+
+        return self._transitions
+
+
+def load(file_name=definitions.AREA_MAP,
+         cache_file_name=definitions.AREA_MAP_CACHE) -> FrozenPathMap:
+    """
+    Returns
+    -------
+    FrozenPathMap for the given JSON file. The map is parsed at most once
+    per process, and a pre-compiled copy is kept in `cache_file_name`,
+    keyed by the file's sha1, so later processes can skip JSON parsing.
+    """
+    key = os.path.realpath(file_name)
+
+    if key not in _loaded:
+        _loaded[key] = _load_uncached(file_name, cache_file_name)
+
+    return _loaded[key]
+
+
+def clear():
+    _loaded.clear()
+
+
+def _load_uncached(file_name, cache_file_name) -> FrozenPathMap:
+    stat = os.stat(file_name)
+    with open(file_name, 'rb') as f:
+        raw = f.read()
+    # hashing is cheap next to parsing, and unlike mtime and size it
+    # catches every edit
+    digest = hashlib.sha1(raw).hexdigest()
+    cached = _read_cache(cache_file_name)
+
+    if cached is not None and cached['digest'] == digest:
+        path_map = _from_cache(cached)
+        if cached['mtime_ns'] == stat.st_mtime_ns and \
+                cached['size'] == stat.st_size:
+            return path_map
+        # file was touched but not changed
+    else:
+        path_map = FrozenPathMap(json.loads(raw.decode('utf-8')), digest)
+
+    _write_cache(cache_file_name, stat, path_map)
+
+    return path_map
+
+
+def _from_cache(cached) -> FrozenPathMap:
+    return FrozenPathMap(cached['path_map'], cached['digest'],
+                         counts=cached['counts'])
+
+
+def _read_cache(cache_file_name):
+    try:
+        with open(cache_file_name, 'rb') as f:
+            cached = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+            ImportError):
+        return None
+
+    if not isinstance(cached, dict) or cached.get('format') != CACHE_FORMAT:
+        return None
+
+    return cached
+
+
+def _write_cache(cache_file_name, stat, path_map: FrozenPathMap):
+    cached = {
+        'format': CACHE_FORMAT,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'digest': path_map.digest,
+        'path_map': dict(path_map),
+        'counts': path_map.transitions.counts
+    }
+    tmp_file_name = '{}.{}.tmp'.format(cache_file_name, os.getpid())
+
+    try:
+        with open(tmp_file_name, 'wb') as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file_name, cache_file_name)
+    except OSError:
+        # read-only install; fall back to parsing JSON in every process
+        try:
+            os.remove(tmp_file_name)
+        except OSError:
+            pass
@@ -0,0 +1,270 @@
+"""
+Generate beatmaps for many songs in parallel.
+
+Usage
+-----
+python -m aisu_circles.batch manifest.json --workers 4 --timeout 600
+
+The manifest is a JSON list of songs:
+
+[
+    {
+        "song_name": "Song",
+        "song_file_name": "song.mp3",
+        "osu_file_name": "out/song [{}].osu",
+        "bpm": 120,
+        "hit_events": {"medium": "song_medium.npy", "hard": [0, 1, 0, ...]},
+        "seed": 7
+    }
+]
+
+Hit events are either inline lists or paths to .npy files, relative to the
+manifest. `seed` is optional; by default each job's seed is derived from
+the base seed, the song name and the difficulty.
+"""
+import argparse
+import hashlib
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import numpy as np
+
+from . import area_map, instrumentation, utils
+from .cache import DEFAULT_MAX_BYTES, HitObjectCache
+
+Job = namedtuple('Job', [
+    'song_name',
+    'song_file_name',
+    'osu_file_name',
+    'bpm',
+    'difficulty',
+    'hit_events',
+    'seed'
+])
+
+JobResult = namedtuple('JobResult',
+                       ['job', 'file_name', 'error', 'elapsed', 'metrics'])
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def job_seed(base_seed, song_name, difficulty) -> int:
+    """
+    Returns
+    -------
+    Seed for one job that only depends on its inputs, so reruns of a batch
+    reproduce the same maps regardless of scheduling order
+    """
+    key = '{}:{}:{}'.format(base_seed, song_name, difficulty)
+
+    return int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8],
+                          'big')
+
+
+def load_manifest(file_name) -> list:
+    with open(file_name, 'r') as f:
+        return json.load(f)
+
+
+def jobs_from_manifest(manifest, base_seed=0, base_dir='.') -> List[Job]:
+    jobs = []
+
+    for song in manifest:
+        for difficulty, hit_events in sorted(song['hit_events'].items()):
+            if difficulty not in utils.DIFFICULTIES:
+                raise ValueError('Unknown difficulty \'{}\' for {}'.format(
+                    difficulty, song['song_name']))
+
+            if isinstance(hit_events, str):
+                hit_events = os.path.join(base_dir, hit_events)
+
+            seed = song.get('seed')
+            jobs.append(Job(
+                song_name=song['song_name'],
+                song_file_name=song['song_file_name'],
+                osu_file_name=os.path.join(base_dir, song['osu_file_name']),
+                bpm=song['bpm'],
+                difficulty=difficulty,
+                hit_events=hit_events,
+                seed=job_seed(base_seed if seed is None else seed,
+                              song['song_name'], difficulty)
+            ))
+
+    return jobs
+
+
+def run_jobs(jobs, max_workers=None, timeout=None, progress=None,
+             cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES,
+             instrument=False) -> Iterator[JobResult]:
+    """
+    Run the jobs over a process pool, yielding results as they finish. A
+    worker dying (e.g. killed for using too much memory) breaks the pool;
+    the jobs that could not finish are yielded as failed results.
+
+    Params
+    ------
+    timeout: seconds a single job may run before it is abandoned. Enforced
+    with SIGALRM in the worker, so it has no effect on platforms without
+    it, such as Windows
+    progress: optional callable(n_done, n_total, JobResult)
+    cache_dir: optional directory of a cache.HitObjectCache shared by all
+    workers
+    instrument: record per-stage metrics for every job
+    """
+    # load once in the parent so forked workers share the parsed map
+    area_map.load()
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_init_worker) as executor:
+        start = time.perf_counter()
+        futures = {executor.submit(run_job, job, timeout, cache_dir,
+                                   cache_max_bytes, instrument): job
+                   for job in jobs}
+
+        for n_done, future in enumerate(as_completed(futures), 1):
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                result = JobResult(futures[future], None,
+                                   'worker process died: {!r}'.format(e),
+                                   time.perf_counter() - start, None)
+            if progress is not None:
+                progress(n_done, len(futures), result)
+            yield result
+
+
+def run_job(job: Job, timeout=None, cache_dir=None,
+            cache_max_bytes=DEFAULT_MAX_BYTES, instrument=False) -> JobResult:
+    start = time.perf_counter()
+    file_name, error, metrics = None, None, None
+    cache = None if cache_dir is None else HitObjectCache(cache_dir,
+                                                          cache_max_bytes)
+
+    try:
+        with _time_limit(timeout), _maybe_recording(instrument):
+            hit_events = job.hit_events
+            if isinstance(hit_events, str):
+                hit_events = np.load(hit_events)
+
+            file_name = utils.build_osu_file(
+                hit_events,
+                utils.DIFFICULTIES[job.difficulty](),
+                job.bpm,
+                job.song_name,
+                job.song_file_name,
+                job.osu_file_name,
+                path_map=area_map.load(),
+                random_seed=job.seed,
+                cache=cache
+            )
+    except Exception:
+        error = traceback.format_exc()
+
+    if instrument:
+        metrics = instrumentation.recorder.snapshot()
+
+    return JobResult(job, file_name, error, time.perf_counter() - start,
+                     metrics)
+
+
+def _init_worker():
+    area_map.load()
+
+
+@contextmanager
+def _time_limit(seconds):
+    """
+    Raise JobTimeout in the worker if the block runs longer than `seconds`
+    """
+    if not seconds or not hasattr(signal, 'SIGALRM'):
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise JobTimeout('job exceeded {}s'.format(seconds))
+
+    previous_handler = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+@contextmanager
+def _maybe_recording(enabled):
+    if enabled:
+        with instrumentation.recording():
+            yield
+    else:
+        yield
+
+
+def _print_progress(n_done, n_total, result: JobResult):
+    status = 'ok' if result.error is None else 'FAILED'
+    print('[{}/{}] {} ({}) {} in {:.1f}s'.format(
+        n_done, n_total, result.job.song_name, result.job.difficulty, status,
+        result.elapsed), file=sys.stderr)
+
+    if result.error is not None:
+        print(result.error, file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Generate .osu files for every song in a manifest')
+    parser.add_argument('manifest')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: cpu count)')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='seconds allowed per difficulty (not '
+                             'enforced on Windows)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='base seed for songs without their own seed')
+    parser.add_argument('--cache-dir', default=None,
+                        help='directory for cached generated files')
+    parser.add_argument('--cache-max-bytes', type=int,
+                        default=DEFAULT_MAX_BYTES)
+    parser.add_argument('--metrics', default=None,
+                        help='write per-stage metrics to this file, in '
+                             'Prometheus text format if it ends with .prom '
+                             'and JSON otherwise')
+    args = parser.parse_args(argv)
+
+    jobs = jobs_from_manifest(
+        load_manifest(args.manifest),
+        base_seed=args.seed,
+        base_dir=os.path.dirname(os.path.abspath(args.manifest))
+    )
+
+    recorder = instrumentation.Recorder()
+    failures = 0
+    for result in run_jobs(jobs, args.workers, args.timeout, _print_progress,
+                           args.cache_dir, args.cache_max_bytes,
+                           instrument=args.metrics is not None):
+        failures += result.error is not None
+        if result.metrics:
+            recorder.merge(result.metrics)
+
+    if args.metrics is not None:
+        with open(args.metrics, 'w') as f:
+            f.write(recorder.to_prometheus() if args.metrics.endswith('.prom')
+                    else recorder.to_json())
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""
+Benchmarks for every stage of hit-event-to-.osz generation.
+
+Usage
+-----
+python -m aisu_circles.benchmarks [--quick] [--filter predict]
+    [--output results.json] [--baseline results.json]
+
+Each case runs on synthetic hit events of a fixed length and density, with
+fixed seeds so runs are comparable across commits. Results are written as
+JSON. With --baseline, each case is compared against a previous results
+file, and the command exits non-zero if any case got slower than
+--max-slowdown. Timings only compare within one machine, so the baseline
+is a results file generated locally, not one kept in the repo.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from . import area_map, definitions, position, utils
+from .predictor import SectionPredictor
+from .section import ComboSection
+from .serialize import Serializer
+
+FRAMES_PER_SECOND = 22050 / definitions.hop_length
+
+SONG_MINUTES = (1, 5, 20)
+QUICK_SONG_MINUTES = (1,)
+
+# average hits per second
+DENSITIES = {
+    'easy': 1.0,
+    'normal': 2.0,
+    'hard': 3.5,
+    'insane': 5.0,
+    'extreme': 8.0
+}
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(f):
+        BENCHMARKS[name] = f
+        return f
+
+    return register
+
+
+def synthetic_hit_events(minutes, hits_per_second, seed=0) -> np.ndarray:
+    """
+    Returns
+    -------
+    Hit event array of the given length, with hits snapped to a 1/8 beat
+    grid at 120 bpm and gaps drawn so the average density matches
+    """
+    rng = np.random.RandomState(seed)
+    n_frames = int(minutes * 60 * FRAMES_PER_SECOND)
+    grid = FRAMES_PER_SECOND / 16  # 1/8 beat at 120 bpm
+
+    mean_gap = FRAMES_PER_SECOND / hits_per_second / grid
+    gaps = np.maximum(1, rng.geometric(1 / max(mean_gap, 1),
+                                       size=int(n_frames / grid) + 1))
+    hit_frames = np.round(np.cumsum(gaps) * grid).astype(int)
+
+    hit_events = np.zeros(n_frames, dtype=np.int64)
+    hit_events[hit_frames[hit_frames < n_frames]] = 1
+
+    return hit_events
+
+
+def song_cases(minutes):
+    for m in minutes:
+        for difficulty, density in DENSITIES.items():
+            yield '{}min-{}'.format(m, difficulty), m, density
+
+
+def time_call(f, repeat, setup=None) -> dict:
+    """
+    Params
+    ------
+    setup: optional callable run untimed before each repeat, whose result is
+    passed to `f`, so every repeat works on fresh inputs
+    """
+    times = []
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        f(*args)
+        times.append(time.perf_counter() - start)
+
+    return {'min': min(times), 'median': statistics.median(times),
+            'repeat': repeat}
+
+
+def _predictor(hit_events, seed=0):
+    return SectionPredictor(area_map.load(), hit_events.copy(), 500.0, 1.6,
+                            random_seed=seed)
+
+
+def _serializer(hit_objects):
+    return Serializer(hit_objects, definitions.MODEL_VERSION, 'song.mp3',
+                      'Benchmark', 500.0, utils.get_medium_diff_data())
+
+
+def _repeat_for(minutes):
+    return 5 if minutes <= 1 else 3 if minutes <= 5 else 1
+
+
+@benchmark('predict')
+def bench_predict(minutes):
+    for case, m, density in song_cases(minutes):
+        hit_events = synthetic_hit_events(m, density)
+        yield case, time_call(lambda: _predictor(hit_events).predict(),
+                              _repeat_for(m))
+
+
+@benchmark('get_hits')
+def bench_get_hits(minutes):
+    for case, m, density in song_cases(minutes):
+        hit_events = synthetic_hit_events(m, density)
+
+        def get_hits(sections):
+            for s in sections:
+                s.get_hits()
+
+        yield case, time_call(
+            get_hits, _repeat_for(m),
+            setup=lambda: _predictor(hit_events)._get_sections(None))
+
+
+@benchmark('find_valid_path')
+def bench_find_valid_path(minutes):
+    rng = random.Random(0)
+    for duration in (20, 85, 340):
+        args = []
+        for _ in range(500):
+            start = rng.uniform(64, 448), rng.uniform(64, 320)
+            end = rng.uniform(64, 448), rng.uniform(64, 320)
+            mid = (start[0] + end[0]) / 2 + rng.uniform(-40, 40), \
+                (start[1] + end[1]) / 2 + rng.uniform(-40, 40)
+            args.append((position.define_circle(start, mid, end), start,
+                         end))
+
+        def find_paths():
+            for (c_x, c_y, r), start, end in args:
+                try:
+                    position.find_valid_path(c_x, c_y, r, start, end,
+                                             duration, 1.6)
+                except position.InvalidPathException:
+                    pass
+
+        yield '500x{}frames'.format(duration), time_call(find_paths, 3)
+
+
+@benchmark('random_circle_path')
+def bench_random_circle_path(minutes):
+    rng = random.Random(0)
+    for duration in (20, 85, 340):
+        args = [((rng.uniform(64, 448), rng.uniform(64, 320)),
+                 (rng.uniform(64, 448), rng.uniform(64, 320)))
+                for _ in range(500)]
+        section = ComboSection(0, 0, args[0][0], args[0][1], [1], 500.0,
+                               1.6, rng=random.Random(0))
+
+        def circle_paths():
+            for start, end in args:
+                try:
+                    section.random_circle_path(duration, start, end)
+                except position.NoValidPathError:
+                    pass
+
+        yield '500x{}frames'.format(duration), time_call(circle_paths, 3)
+
+
+@benchmark('serializer_write')
+def bench_serializer_write(minutes):
+    for case, m, density in song_cases(minutes):
+        serializer = _serializer(
+            _predictor(synthetic_hit_events(m, density)).predict_batch())
+        yield case, time_call(lambda: serializer.write(io.BytesIO()),
+                              _repeat_for(m) * 2)
+
+
+@benchmark('zip_osz_file')
+def bench_zip_osz_file(minutes):
+    for case, m, density in song_cases(minutes):
+        serializer = _serializer(
+            _predictor(synthetic_hit_events(m, density)).predict_batch())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            osu_dir = os.path.join(tmp_dir, 'osu')
+            os.mkdir(osu_dir)
+            for name in ('Medium', 'Hard'):
+                serializer.write(
+                    os.path.join(osu_dir, 'Benchmark [{}].osu'.format(name)))
+            osz_file = os.path.join(tmp_dir, 'Benchmark.osz')
+
+            yield case, time_call(lambda: utils.zip_osz_file(osz_file,
+                                                             osu_dir),
+                                  _repeat_for(m) * 2)
+
+
+@benchmark('end_to_end')
+def bench_end_to_end(minutes):
+    audio = bytes(1024 * 1024)
+    for case, m, density in song_cases(minutes):
+        hit_events = synthetic_hit_events(m, density)
+
+        def build():
+            hit_event_set = {'medium': hit_events.copy(),
+                             'hard': hit_events.copy()}
+            utils.build_osz_file(hit_event_set, 120, 'Benchmark', 'song.mp3',
+                                 audio=audio, random_seed=0)
+
+        yield case, time_call(build, _repeat_for(m))
+
+
+def run(names=None, minutes=SONG_MINUTES, progress=None) -> dict:
+    area_map.load()
+    results = {}
+
+    for name, bench in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+
+        results[name] = {}
+        for case, timing in bench(minutes):
+            results[name][case] = timing
+            if progress is not None:
+                progress(name, case, timing)
+
+    return {
+        'model_version': definitions.MODEL_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results
+    }
+
+
+def compare(results, baseline) -> dict:
+    """
+    Returns
+    -------
+    Ratio of current to baseline min time for every case present in both
+    """
+    ratios = {}
+    for name, cases in results['results'].items():
+        for case, timing in cases.items():
+            base = baseline['results'].get(name, {}).get(case)
+            if base and base['min'] > 0:
+                ratios['{}/{}'.format(name, case)] = timing['min'] / base['min']
+
+    return ratios
+
+
+def _print_progress(name, case, timing):
+    print('{:<18} {:<16} min {:9.4f}s  median {:9.4f}s'.format(
+        name, case, timing['min'], timing['median']), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--quick', action='store_true',
+                        help='only run 1 minute songs')
+    parser.add_argument('--filter', action='append', default=[],
+                        choices=sorted(BENCHMARKS),
+                        help='benchmark to run, may be repeated')
+    parser.add_argument('--output', default=None,
+                        help='write results JSON to this file')
+    parser.add_argument('--baseline', default=None,
+                        help='results JSON to compare against')
+    parser.add_argument('--max-slowdown', type=float, default=1.25,
+                        help='fail if any case is slower than baseline by '
+                             'this factor')
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args.filter,
+                      QUICK_SONG_MINUTES if args.quick else SONG_MINUTES,
+                      progress=_print_progress)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline, 'r') as f:
+        ratios = compare(results, json.load(f))
+
+    slow = 0
+    for case, ratio in sorted(ratios.items()):
+        flag = ''
+        if ratio > args.max_slowdown:
+            flag = '  SLOWER'
+            slow += 1
+        print('{:<40} {:6.2f}x{}'.format(case, ratio, flag), file=sys.stderr)
+
+    return 1 if slow else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+On-disk, content-addressed cache for generated hit objects and .osu files.
+
+Entries are keyed on everything that determines the output of a seeded
+prediction, including definitions.MODEL_VERSION, so bumping the model
+version invalidates every entry. The store is bounded by total size and
+evicts least recently used entries first.
+"""
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+from . import definitions
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# puts between directory scans picking up other processes' entries
+RESCAN_INTERVAL = 256
+
+
+def path_map_digest(path_map) -> str:
+    digest = getattr(path_map, 'digest', None)
+    if digest is not None:
+        return digest
+
+    dump = json.dumps({k: list(v) for k, v in path_map.items()},
+                      sort_keys=True)
+
+    return hashlib.sha1(dump.encode('utf-8')).hexdigest()
+
+
+def hit_objects_key(hit_events, beat_duration_mls, slider_multiplier, seed,
+                    path_map_digest,
+                    model_version=definitions.MODEL_VERSION) -> str:
+    """
+    Returns
+    -------
+    Cache key for the hit objects predicted from the given inputs
+    """
+    hit_events = np.asarray(hit_events)
+    if hit_events.size and not np.isin(hit_events, (0, 1)).all():
+        raise ValueError('hit events must be 0 or 1')
+
+    h = hashlib.sha256()
+    h.update(hit_events.astype(np.uint8).tobytes())
+    h.update(repr((float(beat_duration_mls), float(slider_multiplier), seed,
+                   path_map_digest, model_version)).encode('utf-8'))
+
+    return 'hits-' + h.hexdigest()
+
+
+def osu_file_key(hit_events_key, model_version, song_file_name, song_name,
+                 beat_duration_mls, difficulty_data) -> str:
+    """
+    Returns
+    -------
+    Cache key for a serialized .osu file, which also depends on the header
+    """
+    h = hashlib.sha256(hit_events_key.encode('utf-8'))
+    h.update(repr((model_version, song_file_name, song_name,
+                   float(beat_duration_mls),
+                   sorted(difficulty_data.items()))).encode('utf-8'))
+
+    return 'osu-' + h.hexdigest()
+
+
+class HitObjectCache:
+    """
+    The size of the store is tracked across puts and the directory is only
+    scanned when the tracked size goes over `max_bytes`, or every
+    RESCAN_INTERVAL puts to pick up entries written by other processes
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._total_bytes = None
+        self._n_puts = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key) -> str:
+        return os.path.join(self._directory, key)
+
+    def get(self, key):
+        """
+        Returns
+        -------
+        Cached value or None. A hit marks the entry as recently used
+        """
+        path = self._path(key)
+
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = f.tell()
+
+        try:
+            replaced_size = os.stat(path).st_size
+        except OSError:
+            replaced_size = 0
+        os.replace(tmp_path, path)
+
+        self._n_puts += 1
+        if self._total_bytes is None or self._n_puts % RESCAN_INTERVAL == 0:
+            self._evict()
+        else:
+            self._total_bytes += size - replaced_size
+            if self._total_bytes > self._max_bytes:
+                self._evict()
+
+    def clear(self):
+        for entry in self._entries():
+            _remove(entry.path)
+        self._total_bytes = 0
+
+    def _entries(self) -> list:
+        return [e for e in os.scandir(self._directory)
+                if e.is_file() and not e.name.endswith('.tmp')]
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        if total > self._max_bytes:
+            for _, size, path in sorted(entries):
+                _remove(path)
+                total -= size
+                if total <= self._max_bytes:
+                    break
+
+        self._total_bytes = total
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
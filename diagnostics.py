@@ -0,0 +1,93 @@
+"""
+Handling of bad intermediate values (off-grid areas, out of bounds
+positions, ...) found while generating a beatmap.
+
+Modes
+-----
+strict - raise a DiagnosticError subclass
+repair - let the caller clamp or resample the value and count the event
+debug  - count the event and drop into pdb
+"""
+import pdb
+from collections import Counter
+from contextlib import contextmanager
+
+STRICT = 'strict'
+REPAIR = 'repair'
+DEBUG = 'debug'
+MODES = (STRICT, REPAIR, DEBUG)
+
+_mode = REPAIR
+_counters = Counter()
+
+
+class DiagnosticError(ValueError):
+    pass
+
+
+class InvalidAreaError(DiagnosticError):
+    pass
+
+
+class InvalidPositionError(DiagnosticError):
+    pass
+
+
+def get_mode() -> str:
+    return _mode
+
+
+def set_mode(mode):
+    global _mode
+
+    if mode not in MODES:
+        raise ValueError('Unknown diagnostics mode \'{}\'. Expected one of {}'
+                         .format(mode, MODES))
+
+    _mode = mode
+
+
+def counters() -> dict:
+    """
+    Returns
+    -------
+    Number of times each site reported a bad value since the last reset
+    """
+    return dict(_counters)
+
+
+def reset_counters():
+    _counters.clear()
+
+
+@contextmanager
+def run(mode=None):
+    """
+    Reset the counters and optionally switch mode for the duration of the
+    block. Yields the live counter.
+    """
+    previous_mode = _mode
+    if mode is not None:
+        set_mode(mode)
+    reset_counters()
+
+    try:
+        yield _counters
+    finally:
+        set_mode(previous_mode)
+
+
+def report(site, message, error=DiagnosticError):
+    """
+    Report a bad value found at `site`. In strict mode this raises `error`.
+    Otherwise the report is counted (and the debugger opened in debug mode)
+    and the function returns, and the caller is expected to repair the
+    value.
+    """
+    if _mode == STRICT:
+        raise error('{}: {}'.format(site, message))
+
+    _counters[site] += 1
+
+    if _mode == DEBUG:
+        pdb.set_trace()
@@ -0,0 +1,96 @@
+import numpy as np
+
+
+class Grid:
+    """
+    Precomputed geometry of the grid of areas the Markov model moves
+    through. The playfield plus its padding is split into
+    `width_squares` x `height_squares` areas, numbered row by row.
+
+    Everything is computed once from the grid constants, so area and
+    position lookups are tuple or array indexing.
+    """
+
+    def __init__(self, grid_width=512, grid_height=384, padding_x=64,
+                 padding_y=48, width_squares=5, height_squares=2):
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.padding_x = padding_x
+        self.padding_y = padding_y
+        self.width_squares = width_squares
+        self.height_squares = height_squares
+        self.n_areas = width_squares * height_squares
+
+        width_pixels = grid_width + padding_x * 2
+        height_pixels = grid_height + padding_y * 2
+        self.cell_shape = (width_pixels // width_squares,
+                           height_pixels // height_squares)
+        self.square_shape = (grid_width // width_squares,
+                             grid_height // height_squares)
+
+        # area bounds in padded pixel coordinates: (x0, y0, x1, y1)
+        areas = np.arange(self.n_areas)
+        columns = areas % width_squares
+        rows = areas // width_squares
+        self.area_bounds = np.stack([
+            columns * self.cell_shape[0] - padding_x,
+            rows * self.cell_shape[1] - padding_y,
+            (columns + 1) * self.cell_shape[0] - padding_x,
+            (rows + 1) * self.cell_shape[1] - padding_y
+        ], axis=1)
+
+        # half-open ranges random positions of each area are drawn from
+        x_starts = columns * self.square_shape[0]
+        y_starts = rows * self.square_shape[1]
+        x_stops = np.minimum(x_starts + self.square_shape[0] - padding_x,
+                             grid_width)
+        y_stops = np.minimum(y_starts + self.square_shape[1] - padding_y,
+                             grid_height)
+        self.position_ranges = tuple(
+            ((x0, x1), (y0, y1)) for x0, x1, y0, y1 in zip(
+                x_starts.tolist(), x_stops.tolist(), y_starts.tolist(),
+                y_stops.tolist()))
+
+        # columns within two of each column, and every row
+        self.neighbour_columns = tuple(
+            tuple(x for x in range(column - 2, column + 3)
+                  if 0 <= x < width_squares and x != column)
+            for column in range(width_squares))
+        self.neighbour_rows = tuple(range(height_squares))
+
+    def column(self, area: int) -> int:
+        return area % self.width_squares
+
+    def area(self, column: int, row: int) -> int:
+        return row * self.width_squares + column
+
+    def area_number(self, x: float, y: float) -> int:
+        """
+        Returns
+        -------
+        Area containing the (unpadded) position, or -1 if it is off the grid
+        """
+        column = int((x + self.padding_x) / self.cell_shape[0])
+        row = int((y + self.padding_y) / self.cell_shape[1])
+        number = row * self.width_squares + column
+
+        return number if 0 <= number < self.n_areas else -1
+
+    def area_numbers(self, positions) -> np.ndarray:
+        """
+        Array version of `area_number` for a sequence of (x, y) positions.
+        Positions equal to (-1, -1) mark missing hits and map to -1
+        """
+        points = np.asarray(positions, dtype=float).reshape(-1, 2)
+        x, y = points[:, 0], points[:, 1]
+
+        # truncate towards zero like int()
+        numbers = np.trunc((y + self.padding_y) / self.cell_shape[1]) * \
+            self.width_squares + \
+            np.trunc((x + self.padding_x) / self.cell_shape[0])
+        numbers = numbers.astype(np.int64)
+
+        numbers[(numbers < 0) | (numbers >= self.n_areas) |
+                ((x == -1) & (y == -1))] = -1
+
+        return numbers
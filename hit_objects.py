@@ -0,0 +1,217 @@
+from typing import Iterator, List
+
+import numpy as np
+
+HIT_CIRCLE = 1
+SLIDER = 2
+NEW_COMBO = 4
+
+# times fit in 32 bits for songs of up to 24 days
+DTYPE = np.int32
+
+CIRCLE_TYPES = (HIT_CIRCLE, HIT_CIRCLE | NEW_COMBO)
+SLIDER_TYPES = (SLIDER, SLIDER | NEW_COMBO)
+
+# every field not stored in a HitObjectBatch is the same for all hit objects
+_CIRCLE_LINE = '{},{},{},{},0,0:0:0:0:'.format
+_SLIDER_LINE = '{},{},{},{},0,P|{},{},{},0|0,0:0|0:0,0:0:0:0:'.format
+_CURVE_POINT = '{}:{}'.format
+
+
+class HitObjectBatch:
+    """
+    Hit objects of a map stored as columns. Row `i` is a hit circle or a
+    slider depending on `type[i]`. The curve points of slider `i` are
+    `curve_points[curve_offsets[i]:curve_offsets[i + 1]]`; hit circles have
+    none, and a `pixel_length` and `repeat` of 0
+    """
+
+    def __init__(self, x, y, time, type, pixel_length=None, repeat=None,
+                 curve_points=None, curve_offsets=None):
+        self.x = np.asarray(x, dtype=DTYPE)
+        self.y = np.asarray(y, dtype=DTYPE)
+        self.time = np.asarray(time, dtype=DTYPE)
+        self.type = np.asarray(type, dtype=DTYPE)
+
+        n = len(self.x)
+        self.pixel_length = np.zeros(n, dtype=DTYPE) \
+            if pixel_length is None \
+            else np.asarray(pixel_length, dtype=DTYPE)
+        self.repeat = np.zeros(n, dtype=DTYPE) if repeat is None \
+            else np.asarray(repeat, dtype=DTYPE)
+        self.curve_points = np.empty((0, 2), dtype=DTYPE) \
+            if curve_points is None \
+            else np.asarray(curve_points, dtype=DTYPE).reshape(-1, 2)
+        self.curve_offsets = np.zeros(n + 1, dtype=DTYPE) \
+            if curve_offsets is None \
+            else np.asarray(curve_offsets, dtype=DTYPE)
+
+        if not all(len(c) == n for c in (self.y, self.time, self.type,
+                                         self.pixel_length, self.repeat)) \
+                or len(self.curve_offsets) != n + 1:
+            raise ValueError('hit object columns must have equal lengths')
+
+    def __len__(self):
+        return len(self.x)
+
+    def __eq__(self, other):
+        if not isinstance(other, HitObjectBatch):
+            return NotImplemented
+
+        return all(np.array_equal(getattr(self, c), getattr(other, c))
+                   for c in _COLUMNS)
+
+    @property
+    def is_slider(self) -> np.ndarray:
+        return np.isin(self.type, SLIDER_TYPES)
+
+    @classmethod
+    def concatenate(cls, batches) -> 'HitObjectBatch':
+        batches = list(batches)
+        if not batches:
+            return cls([], [], [], [])
+
+        offsets = [np.zeros(1, dtype=DTYPE)]
+        n_points = 0
+        for b in batches:
+            offsets.append(b.curve_offsets[1:] + n_points)
+            n_points += len(b.curve_points)
+
+        return cls(
+            *(np.concatenate([getattr(b, c) for b in batches])
+              for c in ('x', 'y', 'time', 'type', 'pixel_length', 'repeat',
+                        'curve_points')),
+            curve_offsets=np.concatenate(offsets)
+        )
+
+    @classmethod
+    def from_dicts(cls, hit_objects: List[dict]) -> 'HitObjectBatch':
+        """
+        Returns batch of the hit objects in the dictionary format of
+        `Section.get_hits`
+        """
+        builder = HitObjectBuilder()
+
+        for obj in hit_objects:
+            if obj['type'] in SLIDER_TYPES:
+                curve_points = [tuple(map(int, p.split(':')))
+                                for p in obj['curve_points'].split('|')]
+                builder.add_slider(obj['x'], obj['y'], obj['time'],
+                                   obj['type'], curve_points,
+                                   obj['pixel_length'], obj['repeat'])
+            else:
+                builder.add_circle(obj['x'], obj['y'], obj['time'],
+                                   obj['type'])
+
+        return builder.build()
+
+    def to_dicts(self) -> List[dict]:
+        """
+        Returns the hit objects in the dictionary format of
+        `Section.get_hits`
+        """
+        hit_objects = []
+        columns = zip(*(getattr(self, c).tolist() for c in (
+            'x', 'y', 'time', 'type', 'pixel_length', 'repeat')))
+
+        for i, (x, y, time, type_, pixel_length, repeat) in \
+                enumerate(columns):
+            if type_ in SLIDER_TYPES:
+                hit_objects.append({
+                    'x': x,
+                    'y': y,
+                    'time': time,
+                    'type': type_,
+                    'hit_sound': 0,
+                    'slider_type': 'P',
+                    'curve_points': self._curve_string(i),
+                    'repeat': repeat,
+                    'pixel_length': pixel_length,
+                    'edge_hit_sounds': '0|0',
+                    'edge_additions': '0:0|0:0',
+                    'extras': '0:0:0:0:'
+                })
+            else:
+                hit_objects.append({
+                    'x': x,
+                    'y': y,
+                    'time': time,
+                    'type': type_,
+                    'hit_sound': '0',
+                    'extras': '0:0:0:0:'
+                })
+
+        return hit_objects
+
+    def to_lines(self) -> List[str]:
+        """
+        Returns the .osu [HitObjects] line of every hit circle and slider
+        """
+        return list(self.iter_lines())
+
+    def iter_lines(self) -> Iterator[str]:
+        """
+        Yields the lines of `to_lines` one at a time, so they can be written
+        without holding every line of the map in memory
+        """
+        xs, ys, times, types, pixel_lengths, repeats = (
+            getattr(self, c).tolist() for c in
+            ('x', 'y', 'time', 'type', 'pixel_length', 'repeat'))
+        is_circle = np.isin(self.type, CIRCLE_TYPES).tolist()
+        is_slider = self.is_slider.tolist()
+
+        for i in range(len(xs)):
+            if is_circle[i]:
+                yield _CIRCLE_LINE(xs[i], ys[i], times[i], types[i])
+            elif is_slider[i]:
+                yield _SLIDER_LINE(xs[i], ys[i], times[i], types[i],
+                                   self._curve_string(i), repeats[i],
+                                   pixel_lengths[i])
+
+    def _curve_string(self, i) -> str:
+        start, stop = self.curve_offsets[i:i + 2].tolist()
+        points = self.curve_points[start:stop].tolist()
+
+        return '|'.join([_CURVE_POINT(*p) for p in points])
+
+
+_COLUMNS = ('x', 'y', 'time', 'type', 'pixel_length', 'repeat',
+            'curve_points', 'curve_offsets')
+
+
+class HitObjectBuilder:
+    """
+    Collects hit objects one at a time into the columns of a HitObjectBatch
+    """
+
+    def __init__(self):
+        self._columns = tuple([] for _ in range(6))
+        self._curve_points = []
+        self._curve_offsets = [0]
+
+    def __len__(self):
+        return len(self._columns[0])
+
+    def add_circle(self, x, y, time, type_=HIT_CIRCLE):
+        self._add(x, y, time, type_, 0, 0)
+
+    def add_slider(self, x, y, time, type_, curve_points, pixel_length,
+                   repeat=1):
+        """
+        Params
+        ------
+        curve_points: sequence of (x, y) points, truncated to ints
+        """
+        self._curve_points.extend(
+            (int(p[0]), int(p[1])) for p in curve_points)
+        self._add(x, y, time, type_, pixel_length, repeat)
+
+    def _add(self, *row):
+        for column, value in zip(self._columns, row):
+            column.append(int(value))
+        self._curve_offsets.append(len(self._curve_points))
+
+    def build(self) -> HitObjectBatch:
+        return HitObjectBatch(*self._columns,
+                              curve_points=self._curve_points,
+                              curve_offsets=self._curve_offsets)
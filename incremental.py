@@ -0,0 +1,164 @@
+"""
+Regenerate only the parts of a map whose hit events changed.
+
+Usage
+-----
+predictor = IncrementalPredictor(path_map, hit_events, beat_duration_mls,
+                                 slider_multiplier, random_seed=7)
+hit_objects = predictor.predict_batch()
+...
+hit_objects = predictor.update(new_hit_events)
+
+Sections are chained: each starts from the end position, end frame and
+last areas (as many as the area model conditions on) of the one before
+it. The predictor keeps the state every section started from. After an
+update, a section is reused when its frame range, hit events and start
+state all match a section from the previous run, so regeneration stops at
+the first section after an edit whose start state converges again.
+
+A new combo starts at each section that reaches a multiple of
+COMBO_FRAMES, counting from the end of the section before it, rather than
+at every third section as in SectionPredictor. This depends only on the
+section's own frame range, so an edit that adds or removes sections does
+not shift the combos of every section after it.
+
+Each section draws from its own random.Random seeded by the song seed and
+the section's frame range, so its output depends only on its input.
+Output therefore differs from SectionPredictor for the same seed, but
+`update` always returns exactly what a fresh IncrementalPredictor would
+generate for the new hit events.
+"""
+import random
+from collections import namedtuple
+
+import numpy as np
+
+from . import hit_objects, instrumentation, markov
+from .predictor import SectionPredictor
+
+# about three sections
+COMBO_FRAMES = 2 * markov.interval_frames
+
+SectionState = namedtuple('SectionState', [
+    'start',
+    'stop',
+    'last_index',
+    'last_position',
+    'areas',
+    'new_combo'
+])
+
+SectionRecord = namedtuple('SectionRecord', [
+    'state',
+    'hit_events',
+    'hits',
+    'end_position',
+    'end_area'
+])
+
+
+def starts_combo(last_index, stop) -> bool:
+    """
+    Returns whether the section following frame `last_index` up to `stop`
+    starts a new combo, which it does when it reaches a multiple of
+    COMBO_FRAMES. Consecutive sections cover every frame between them, so
+    each multiple starts exactly one combo
+    """
+    return -(-last_index // COMBO_FRAMES) * COMBO_FRAMES < stop
+
+
+class IncrementalPredictor(SectionPredictor):
+    def __init__(self, path_map, hit_events, beat_duration_mls,
+                 slider_multiplier, random_seed=None, cache=None,
+                 area_model=None):
+        super().__init__(path_map, hit_events, beat_duration_mls,
+                         slider_multiplier, random_seed=random_seed,
+                         cache=cache, area_model=area_model)
+        self._song_seed = random_seed if random_seed is not None \
+            else self._random.getrandbits(64)
+        self._records = []
+        self.n_regenerated = 0
+
+    def cache_key(self) -> str:
+        # output differs from SectionPredictor's for the same seed
+        return None
+
+    def update(self, hit_events) -> hit_objects.HitObjectBatch:
+        """
+        Replace the hit events and return the new map, regenerating only
+        sections whose input or start state changed
+        """
+        self._hit_events = hit_events
+
+        return self.predict_batch()
+
+    def _predict_batch(self, return_areas=False):
+        if return_areas:
+            raise ValueError('IncrementalPredictor does not generate '
+                             'interval areas')
+
+        with instrumentation.stage('sections') as stage:
+            self._records = self._section_records()
+            stage.add(self.n_regenerated)
+
+        with instrumentation.stage('hit_building') as stage:
+            result = hit_objects.HitObjectBatch.concatenate(
+                r.hits for r in self._records)
+            stage.add(len(result))
+
+        return result
+
+    def _section_records(self) -> list:
+        previous = {r.state: r for r in self._records}
+        hit_events = np.asarray(self._hit_events)
+
+        r = random.Random(self._song_seed)
+        first_x = r.randrange(self._screen_width)
+        first_y = r.randrange(self._screen_height)
+        area1 = markov.get_area_number(first_x, first_y)
+        area2 = markov.random_area(area1, rng=r)
+
+        with instrumentation.stage('segmentation') as stage:
+            section_start_stops = self._get_section_start_stops()
+            stage.add(len(section_start_stops))
+
+        records = []
+        last_position = first_x, first_y
+        last_index = 0
+        areas = (area1, area2)[-self.context_len:]
+        self.n_regenerated = 0
+
+        for start, stop in section_start_stops:
+            state = SectionState(start, stop, last_index, last_position,
+                                 areas, starts_combo(last_index, stop))
+            record = previous.get(state)
+
+            if record is None or not np.array_equal(record.hit_events,
+                                                    hit_events[start:stop]):
+                record = self._generate_section(state, hit_events)
+                self.n_regenerated += 1
+
+            records.append(record)
+            last_position = record.end_position
+            last_index = stop
+            areas = (areas + (record.end_area,))[-self.context_len:]
+
+        return records
+
+    def _generate_section(self, state: SectionState,
+                          hit_events) -> SectionRecord:
+        r = random.Random('{}:{}:{}'.format(self._song_seed, state.start,
+                                            state.stop))
+        destination = self._next_area(*state.areas, rng=r)
+        section = self._get_section(state.start, state.stop, state.last_index,
+                                    state.last_position, destination,
+                                    state.new_combo, rng=r)
+        end_position = section.end_position
+
+        return SectionRecord(
+            state,
+            np.array(hit_events[state.start:state.stop]),
+            section.get_hit_batch(),
+            end_position,
+            markov.positions_to_areas([end_position])[0]
+        )
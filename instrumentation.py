@@ -0,0 +1,190 @@
+"""
+Per-stage timing and counters for the generation pipeline.
+
+Stages record wall time, number of calls and number of objects produced.
+Stage time is exclusive: time spent in a stage entered inside another one
+is counted only for the inner stage, so the seconds of all stages add up
+to the instrumented wall time. Recording is off by default, and a disabled
+stage is a shared no-op context manager, so instrumented code costs one
+function call per stage.
+
+Usage
+-----
+with instrumentation.recording() as recorder:
+    utils.build_osu_files(...)
+print(recorder.to_prometheus())
+"""
+import json
+import time
+from contextlib import contextmanager
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add(self, n=1):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('_recorder', '_name', '_start', '_objects',
+                 '_nested_seconds')
+
+    def __init__(self, recorder, name):
+        self._recorder = recorder
+        self._name = name
+        self._objects = 0
+        self._nested_seconds = 0.0
+
+    def __enter__(self):
+        self._recorder._active.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self._start
+        active = self._recorder._active
+        active.pop()
+        if active:
+            active[-1]._nested_seconds += seconds
+
+        self._recorder.record(self._name, seconds - self._nested_seconds,
+                              self._objects)
+        return False
+
+    def add(self, n=1):
+        """
+        Count `n` objects produced by this stage
+        """
+        self._objects += n
+
+
+class Recorder:
+    def __init__(self):
+        self.enabled = False
+        self._stats = {}
+        self._callbacks = []
+        self._active = []
+
+    def stage(self, name):
+        """
+        Returns
+        -------
+        Context manager timing one call of the named stage
+        """
+        return _Stage(self, name) if self.enabled else _NULL_STAGE
+
+    def count(self, name, n=1):
+        """
+        Count `n` objects for `name` without timing anything
+        """
+        if self.enabled:
+            self._stat(name)[2] += n
+
+    def record(self, name, seconds, objects=0):
+        stat = self._stat(name)
+        stat[0] += 1
+        stat[1] += seconds
+        stat[2] += objects
+
+        for callback in self._callbacks:
+            callback(name, seconds, objects)
+
+    def add_callback(self, callback):
+        """
+        Params
+        ------
+        callback: callable(stage_name, seconds, n_objects) run after each
+        recorded stage call, with the stage's exclusive seconds
+        """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self._callbacks.remove(callback)
+
+    def reset(self):
+        self._stats = {}
+
+    def snapshot(self) -> dict:
+        """
+        Returns
+        -------
+        Dict of name to calls, exclusive seconds and objects. Names only
+        ever counted, never timed, have just objects
+        """
+        snapshot = {}
+        for name, (calls, seconds, objects) in self._stats.items():
+            snapshot[name] = {'objects': objects} if calls == 0 else \
+                {'calls': calls, 'seconds': seconds, 'objects': objects}
+
+        return snapshot
+
+    def merge(self, snapshot: dict):
+        """
+        Add the counts of a snapshot, e.g. one taken in a worker process
+        """
+        for name, stat in snapshot.items():
+            totals = self._stat(name)
+            totals[0] += stat.get('calls', 0)
+            totals[1] += stat.get('seconds', 0.0)
+            totals[2] += stat['objects']
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix='aisu') -> str:
+        lines = []
+        for field, index in (('calls', 0), ('seconds', 1), ('objects', 2)):
+            metric = '{}_stage_{}_total'.format(prefix, field)
+            lines.append('# TYPE {} counter'.format(metric))
+            for name in sorted(self._stats):
+                if index < 2 and self._stats[name][0] == 0:
+                    # counted only, never timed
+                    continue
+                lines.append('{}{{stage="{}"}} {}'.format(
+                    metric, name, self._stats[name][index]))
+
+        return '\n'.join(lines) + '\n'
+
+    def _stat(self, name) -> list:
+        stat = self._stats.get(name)
+        if stat is None:
+            stat = self._stats[name] = [0, 0.0, 0]
+
+        return stat
+
+
+recorder = Recorder()
+
+
+def stage(name):
+    return recorder.stage(name)
+
+
+def count(name, n=1):
+    recorder.count(name, n)
+
+
+@contextmanager
+def recording(reset=True):
+    """
+    Enable the process-wide recorder for the duration of the block
+    """
+    previously_enabled = recorder.enabled
+    if reset:
+        recorder.reset()
+    recorder.enabled = True
+
+    try:
+        yield recorder
+    finally:
+        recorder.enabled = previously_enabled
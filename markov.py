@@ -1,6 +1,15 @@
+import bisect
+import hashlib
 import random
 from typing import List, Dict
-import pdb
+
+import numpy as np
+
+try:
+    from . import diagnostics, grid
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import diagnostics
+    import grid
 
 # grid
 grid_width = 512
@@ -13,6 +22,7 @@ height_pixels = grid_height + padding_y * 2
 width_squares = 5
 height_squares = 2
 path_len = 2
+n_areas = width_squares * height_squares
 
 # interval
 position_interval = 1.0
@@ -24,31 +34,37 @@ interval_frames = 85
 
 square_shape = (grid_width // width_squares, grid_height // height_squares)
 
+GRID = grid.Grid(grid_width, grid_height, padding_x, padding_y, width_squares,
+                 height_squares)
+
 
-def random_area(start_area, seed=None) -> int:
+def random_area(start_area, seed=None, rng=None) -> int:
     """
-    Return a random area that is close to the given area
+    Return a random area that is close to the given area. Uses `rng` if
+    given, otherwise a new random.Random seeded with `seed`
     """
-    r = random.Random(seed)
+    r = rng if rng is not None else random.Random(seed)
 
-    x_pos = start_area % width_squares
+    x_choices = GRID.neighbour_columns[GRID.column(start_area)]
 
-    y_choices = [0, 1]
-    x_choices = [x for x in range(x_pos - 2, x_pos + 3) if
-                 0 <= x < width_squares and x != x_pos]
-
-    grid_y = r.choice(y_choices)
+    grid_y = r.choice(GRID.neighbour_rows)
     grid_x = r.choice(x_choices)
 
-    new_index = grid_x, grid_y
-    new_area = new_index[1] * width_squares + new_index[0]
+    new_area = GRID.area(grid_x, grid_y)
 
-    if new_area < 0 or new_area > 9:
-        pdb.set_trace()
+    if not 0 <= new_area < n_areas:
+        diagnostics.report('random_area',
+                           'area {} is off the grid'.format(new_area),
+                           diagnostics.InvalidAreaError)
+        new_area = clamp_area(new_area)
 
     return new_area
 
 
+def clamp_area(area: int) -> int:
+    return min(max(area, 0), n_areas - 1)
+
+
 def get_area_number(
         x_pos: int,
         y_pos: int,
@@ -68,6 +84,9 @@ def get_area_number(
 
     NOTE: x,y do not include padding so could be negative
     """
+    if width == width_squares and height == height_squares:
+        return GRID.area_number(x_pos, y_pos)
+
     x = int((x_pos + padding_x) / (width_pixels // width))
     y = int((y_pos + padding_y) / (height_pixels // height))
     number = int(y * width_squares + x)
@@ -78,12 +97,15 @@ def get_area_number(
     return number
 
 
-def positions_to_areas(positions: List[tuple]):
-    return [get_area_number(*position) if position != (
-        -1, -1) else -1 for position in positions]
+def positions_to_areas(positions: List[tuple]) -> List[int]:
+    """
+    Returns area number of every position, or -1 for missing positions
+    marked (-1, -1)
+    """
+    return GRID.area_numbers(positions).tolist()
 
 
-def random_position_in_square(area_number, seed=None) -> tuple:
+def random_position_in_square(area_number, seed=None, rng=None) -> tuple:
     """
     Returns
     -------
@@ -91,23 +113,18 @@ def random_position_in_square(area_number, seed=None) -> tuple:
     padding removed so as to match .osu file coordinate scheme,
     so values might be negative.
     """
-    r = random.Random(seed)
+    r = rng if rng is not None else random.Random(seed)
 
-    x_start = (area_number % width_squares) * square_shape[0]
-    y_start = (area_number // width_squares) * square_shape[1]
+    if not 0 <= area_number < n_areas:
+        diagnostics.report('random_position_in_square',
+                           'area {} is off the grid'.format(area_number),
+                           diagnostics.InvalidAreaError)
+        area_number = clamp_area(area_number)
 
-    try:
-        x = r.randrange(x_start,
-                        min(x_start + square_shape[0] - padding_x, grid_width)
-                        )
-        y = r.randrange(y_start,
-                        min(y_start + square_shape[1] - padding_y, grid_height))
-    except Exception as e:
-        pdb.set_trace()
-        raise e
+    x_range, y_range = GRID.position_ranges[area_number]
 
-    if x < 0 or y < 0:
-        pdb.set_trace()
+    x = r.randrange(*x_range)
+    y = r.randrange(*y_range)
 
     return x, y
 
@@ -127,31 +144,335 @@ def filter_valid_paths(pm: dict) -> Dict[str, List[int]]:
 
 
 def interval_positions(positions) -> List[tuple]:
-    intervals = int(len(positions) / interval_frames)
+    """
+    Returns the position of the hit closest to the start of each interval,
+    within `leniency_frames`, or (-1, -1) if there is none. `positions`
+    holds one position per frame, (-1, -1) where there is no hit
+    """
+    points = np.asarray(positions, dtype=float).reshape(-1, 2)
+    hit_frames = np.flatnonzero((points[:, 0] != -1) | (points[:, 1] != -1))
+    closest = nearest_interval_hits(hit_frames, len(positions))
 
-    positions_at_intervals = []
+    return [tuple(positions[f]) if f >= 0 else (-1, -1)
+            for f in closest.tolist()]
 
-    for i in range(intervals):
 
-        frame = i * interval_frames
+def nearest_interval_hits(hit_frames, n_frames) -> np.ndarray:
+    """
+    Returns
+    -------
+    For each interval of a song with `n_frames` frames, the frame in sorted
+    `hit_frames` closest to the interval start, or -1 if none lies in
+    [start - leniency_frames, start + leniency_frames). Ties go to the
+    earlier frame
+    """
+    hit_frames = np.asarray(hit_frames, dtype=np.int64)
+    frames = np.arange(int(n_frames / interval_frames)) * interval_frames
+    closest = np.full(len(frames), -1, dtype=np.int64)
 
-        min_dist = leniency_frames + 1
+    if len(hit_frames) == 0:
+        return closest
 
-        closest_hit_position = (-1, -1)
+    i = np.searchsorted(hit_frames, frames)
+    before = hit_frames[np.maximum(i - 1, 0)]
+    after = hit_frames[np.minimum(i, len(hit_frames) - 1)]
 
-        for f in range(frame - leniency_frames, frame + leniency_frames):
+    before_dist = np.where(i > 0, frames - before, leniency_frames + 1)
+    after_dist = np.where(i < len(hit_frames), after - frames,
+                          leniency_frames + 1)
+    use_before = before_dist <= after_dist
 
-            if f > len(positions):
-                break
-            elif f < 0:
+    closest = np.where(use_before, before, after)
+    in_window = np.where(use_before, before_dist <= leniency_frames,
+                         after_dist < leniency_frames)
+
+    return np.where(in_window, closest, -1)
+
+
+class TransitionTable:
+    """
+    Compiled form of the area path map.
+
+    `counts[a1, a2, a3]` holds the number of times area `a3` followed the
+    pair (`a1`, `a2`). Each row is pre-normalized with `a2` excluded, since a
+    path never stays in the same area, so sampling is a single bisect over a
+    cumulative row instead of rejection sampling the raw observations.
+    """
+
+    order = path_len
+
+    def __init__(self, counts):
+        self.counts = counts
+        self._rows = {}
+
+        conditionals = []
+        for area1 in range(n_areas):
+            for area2 in range(n_areas):
+                weights = counts[area1, area2].astype(float)
+                weights[area2] = 0
+                total = weights.sum()
+
+                if total > 0:
+                    self._rows[(area1, area2)] = _cumulative_row(weights)
+                    conditionals.append((area2, weights / total))
+
+        # Fallback for unseen keys: pick a known key uniformly, then sample
+        # it with the previous area excluded. Index `n_areas` is used when
+        # the previous area is off the grid and nothing is excluded.
+        self._fallback = []
+        for excluded in range(n_areas + 1):
+            mixture = np.zeros(n_areas)
+            for _, p in conditionals:
+                if excluded < n_areas:
+                    p = p.copy()
+                    p[excluded] = 0
+                total = p.sum()
+                if total > 0:
+                    mixture += p / total
+            self._fallback.append(_cumulative_row(mixture))
+
+    @classmethod
+    def from_path_map(cls, path_map: dict) -> 'TransitionTable':
+        counts = np.zeros((n_areas, n_areas, n_areas), dtype=np.int64)
+
+        for key, next_areas in filter_valid_paths(path_map).items():
+            area1, area2 = map(int, key.split('_'))
+            for area3 in next_areas:
+                if 0 <= area3 < n_areas:
+                    counts[area1, area2, area3] += 1
+
+        return cls(counts)
+
+    def sample_path(self, areas, r: random.Random) -> int:
+        """
+        Returns
+        -------
+        Random area to follow the last two of `areas`
+        """
+        return self.sample(areas[-2], areas[-1], r)
+
+    def sample(self, area1: int, area2: int, r: random.Random) -> int:
+        """
+        Returns
+        -------
+        Random area to follow (`area1`, `area2`), never equal to `area2`
+        """
+        row = self._rows.get((area1, area2))
+
+        if row is None:
+            row = self._fallback[area2 if 0 <= area2 < n_areas else n_areas]
+
+        outcomes, cum_weights = row
+        index = bisect.bisect(cum_weights, r.random() * cum_weights[-1], 0,
+                              len(cum_weights) - 1)
+
+        return outcomes[index]
+
+
+def _cumulative_row(weights) -> tuple:
+    outcomes = tuple(int(a) for a in np.flatnonzero(weights > 0))
+    cum_weights = tuple(np.cumsum(weights[list(outcomes)]).tolist())
+
+    return outcomes, cum_weights
+
+
+class AreaModel:
+    """
+    Order-N Markov model over areas with back-off.
+
+    For every order k = 1..N, the observed contexts (runs of k areas) are
+    encoded as base-`n_areas` integers and kept in one sorted array, with
+    the cumulative counts of the areas that followed them packed into flat
+    arrays behind an offsets array. As in TransitionTable, the context's
+    last area is excluded from its row. Memory grows with the number of
+    distinct observed contexts, not with `n_areas ** order`.
+
+    Sampling uses the longest observed suffix of the context, backing off
+    one area at a time down to the unigram distribution.
+    """
+
+    def __init__(self, order, tables: dict, unigram_counts):
+        """
+        Params
+        ------
+        tables: (contexts, offsets, outcomes, cum_counts) arrays for each
+        order from 1 to `order`
+        unigram_counts: number of times each area was observed
+        """
+        self.order = order
+        self._tables = tables
+        self._unigram_counts = np.asarray(unigram_counts, dtype=np.int64)
+        self._unigram_rows = []
+        for excluded in range(n_areas + 1):
+            weights = np.array(unigram_counts, dtype=float)
+            if excluded < n_areas:
+                weights[excluded] = 0
+            if weights.sum() == 0:
+                weights = np.ones(n_areas)
+                if excluded < n_areas:
+                    weights[excluded] = 0
+            self._unigram_rows.append(_cumulative_row(weights))
+
+    @classmethod
+    def from_ngram_counts(cls, ngram_counts: dict, order) -> 'AreaModel':
+        """
+        Params
+        ------
+        ngram_counts: number of times each tuple of areas was observed, for
+        tuples of 2 to `order` + 1 areas
+        """
+        tables = {}
+        unigram_counts = np.zeros(n_areas, dtype=np.int64)
+
+        for k in range(1, order + 1):
+            rows = {}
+            for gram, count in ngram_counts.items():
+                if len(gram) != k + 1 or gram[-1] == gram[-2] or \
+                        not all(0 <= a < n_areas for a in gram):
+                    continue
+                rows.setdefault(context_id(gram[:-1]), {})[gram[-1]] = count
+                if k == 1:
+                    unigram_counts[gram[-1]] += count
+
+            tables[k] = _pack_rows(rows)
+
+        return cls(order, tables, unigram_counts)
+
+    @classmethod
+    def from_sequences(cls, sequences, order) -> 'AreaModel':
+        """
+        Returns model trained on sequences of areas, -1 marking gaps
+        """
+        return cls.from_ngram_counts(ngram_counts(sequences, order), order)
+
+    @classmethod
+    def from_path_map(cls, path_map: dict) -> 'AreaModel':
+        """
+        Returns order 2 model of the legacy area path map, with its lower
+        orders marginalized out of the area triples
+        """
+        counts = TransitionTable.from_path_map(path_map).counts
+        grams = {}
+        for a1, a2, a3 in zip(*np.nonzero(counts)):
+            n = int(counts[a1, a2, a3])
+            a1, a2, a3 = int(a1), int(a2), int(a3)
+            grams[(a1, a2, a3)] = n
+            grams[(a2, a3)] = grams.get((a2, a3), 0) + n
+
+        return cls.from_ngram_counts(grams, 2)
+
+    def save(self, file_name):
+        arrays = {'order': np.array(self.order),
+                  'unigram': self._unigram_counts}
+        for k, table in self._tables.items():
+            for name, array in zip(('contexts', 'offsets', 'outcomes',
+                                    'cum_counts'), table):
+                arrays['{}_{}'.format(name, k)] = array
+        np.savez_compressed(file_name, **arrays)
+
+    @classmethod
+    def load(cls, file_name) -> 'AreaModel':
+        with np.load(file_name) as arrays:
+            order = int(arrays['order'])
+            tables = {k: tuple(arrays['{}_{}'.format(name, k)] for name in (
+                'contexts', 'offsets', 'outcomes', 'cum_counts'))
+                for k in range(1, order + 1)}
+
+            return cls(order, tables, arrays['unigram'])
+
+    @property
+    def digest(self) -> str:
+        """
+        Hash of the model's counts, used in place of a path map digest in
+        cache keys
+        """
+        h = hashlib.sha1(str(self.order).encode('ascii'))
+        h.update(self._unigram_counts.tobytes())
+        for k in sorted(self._tables):
+            for array in self._tables[k]:
+                h.update(np.ascontiguousarray(array).tobytes())
+
+        return h.hexdigest()
+
+    @property
+    def n_contexts(self) -> int:
+        return sum(len(table[0]) for table in self._tables.values())
+
+    def sample_path(self, areas, r: random.Random) -> int:
+        """
+        Returns
+        -------
+        Random area to follow `areas`, never equal to the last of them
+        """
+        areas = tuple(areas[-self.order:])
+
+        for k in range(len(areas), 0, -1):
+            context = areas[-k:]
+            if not all(0 <= a < n_areas for a in context):
                 continue
 
-            if not positions[f] == (-1, -1):
-                dist = abs(f - frame)
-                if dist < min_dist:
-                    min_dist = dist
-                    closest_hit_position = positions[f]
+            contexts, offsets, outcomes, cum_counts = self._tables[k]
+            i = int(np.searchsorted(contexts, context_id(context)))
+            if i < len(contexts) and contexts[i] == context_id(context):
+                start, stop = int(offsets[i]), int(offsets[i + 1])
+                return _sample_row(outcomes[start:stop].tolist(),
+                                   cum_counts[start:stop].tolist(), r)
+
+        last = areas[-1] if areas and 0 <= areas[-1] < n_areas else n_areas
 
-        positions_at_intervals.append(tuple(closest_hit_position))
+        return _sample_row(*self._unigram_rows[last], r)
 
-    return positions_at_intervals
+
+def context_id(areas) -> int:
+    """
+    Returns `areas` encoded as a base-`n_areas` integer
+    """
+    number = 0
+    for area in areas:
+        number = number * n_areas + int(area)
+
+    return number
+
+
+def ngram_counts(sequences, order) -> dict:
+    """
+    Returns number of occurrences of every run of 2 to `order` + 1 areas
+    without gaps (-1) in `sequences`
+    """
+    counts = {}
+    for sequence in sequences:
+        sequence = list(sequence)
+        for n in range(2, order + 2):
+            for i in range(len(sequence) - n + 1):
+                gram = tuple(sequence[i:i + n])
+                if min(gram) >= 0:
+                    counts[gram] = counts.get(gram, 0) + 1
+
+    return counts
+
+
+def _pack_rows(rows: dict) -> tuple:
+    contexts = sorted(rows)
+    offsets = [0]
+    outcomes = []
+    cum_counts = []
+
+    for context in contexts:
+        total = 0
+        for area, count in sorted(rows[context].items()):
+            total += count
+            outcomes.append(area)
+            cum_counts.append(total)
+        offsets.append(len(outcomes))
+
+    return (np.array(contexts, dtype=np.int64),
+            np.array(offsets, dtype=np.int32),
+            np.array(outcomes, dtype=np.int8),
+            np.array(cum_counts, dtype=np.int64))
+
+
+def _sample_row(outcomes, cum_weights, r: random.Random) -> int:
+    index = bisect.bisect(cum_weights, r.random() * cum_weights[-1], 0,
+                          len(cum_weights) - 1)
+
+    return outcomes[index]
@@ -0,0 +1,163 @@
+"""
+Packaging of .osu files, audio and background assets into .osz archives,
+either on disk or in memory.
+"""
+import io
+import os
+import shutil
+import time
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+
+# formats that are already compressed and gain nothing from deflate
+STORED_EXTENSIONS = frozenset([
+    '.mp3', '.ogg', '.jpg', '.jpeg', '.png', '.mp4', '.avi', '.flv', '.osz'
+])
+
+
+def default_compress_type(arcname) -> int:
+    extension = os.path.splitext(arcname)[1].lower()
+
+    return ZIP_STORED if extension in STORED_EXTENSIONS else ZIP_DEFLATED
+
+
+class OszWriter:
+    """
+    Streams entries into a .osz archive.
+
+    Params
+    ------
+    target: file name or writable binary stream. If None, the archive is
+    built in memory and returned by `close`. A file name is only written
+    once the archive is complete: entries go to a temporary file next to
+    it, which replaces it on `close` and is removed on `abort`
+    """
+
+    def __init__(self, target=None):
+        self._buffer = None
+        self._target = None
+        self._tmp_name = None
+
+        if target is None:
+            self._buffer = io.BytesIO()
+            target = self._buffer
+        elif isinstance(target, (str, os.PathLike)):
+            self._target = target
+            self._tmp_name = '{}.{}.tmp'.format(os.fspath(target),
+                                                os.getpid())
+            target = self._tmp_name
+
+        self._zip_file = ZipFile(target, 'w', ZIP_DEFLATED)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add_beatmap(self, serializer, arcname=None, compress_type=None):
+        """
+        Write a serialize.Serializer's .osu file into the archive
+        """
+        if arcname is None:
+            arcname = serializer.default_file_name()
+
+        serializer.write_to_zip(
+            self._zip_file, arcname,
+            compress_type=_compress_type(arcname, compress_type))
+
+    def add_file(self, arcname, source, compress_type=None):
+        """
+        Params
+        ------
+        source: bytes, file name or readable binary stream
+        """
+        compress_type = _compress_type(arcname, compress_type)
+
+        if isinstance(source, (str, os.PathLike)):
+            self._zip_file.write(source, arcname, compress_type=compress_type)
+            return
+
+        info = ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.compress_type = compress_type
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._zip_file.writestr(info, source)
+        else:
+            with self._zip_file.open(info, 'w') as f:
+                shutil.copyfileobj(source, f)
+
+    def close(self):
+        """
+        Returns
+        -------
+        Archive bytes if built in memory, otherwise None
+        """
+        self._zip_file.close()
+
+        if self._tmp_name is not None:
+            os.replace(self._tmp_name, self._target)
+            self._tmp_name = None
+
+        return None if self._buffer is None else self._buffer.getvalue()
+
+    def abort(self):
+        """
+        Close the archive after a failure, removing it if it was being
+        written to a file name
+        """
+        self._zip_file.close()
+
+        if self._tmp_name is not None:
+            try:
+                os.remove(self._tmp_name)
+            except OSError:
+                pass
+            self._tmp_name = None
+
+
+def build_osz(serializers, target=None, audio=None, audio_name=None,
+              assets=None):
+    """
+    Params
+    ------
+    serializers: serialize.Serializer objects, one per difficulty
+    target: file name or binary stream, or None to build in memory
+    audio: audio file as bytes, file name or binary stream
+    audio_name: name of the audio entry. Defaults to the basename of
+    `audio` when it is a file name, and is required otherwise
+    assets: optional dict of archive name to bytes, file name or stream
+
+    Returns
+    -------
+    Archive bytes if `target` is None, otherwise None
+    """
+    if audio is not None and audio_name is None:
+        if not isinstance(audio, (str, os.PathLike)):
+            raise ValueError('audio_name is required when audio is not a '
+                             'file name')
+        audio_name = os.path.basename(audio)
+
+    writer = OszWriter(target)
+
+    try:
+        for serializer in serializers:
+            writer.add_beatmap(serializer)
+
+        if audio is not None:
+            writer.add_file(audio_name, audio)
+
+        for arcname, source in (assets or {}).items():
+            writer.add_file(arcname, source)
+    except BaseException:
+        writer.abort()
+        raise
+
+    return writer.close()
+
+
+def _compress_type(arcname, compress_type):
+    return default_compress_type(arcname) if compress_type is None \
+        else compress_type
@@ -1,11 +1,20 @@
+import copy
 import math
 from typing import List, Tuple
-import pdb
+
+import numpy as np
+
+try:
+    from . import diagnostics, instrumentation
+except ImportError:  # imported as a top-level module, e.g. by the tests
+    import diagnostics
+    import instrumentation
 
 X_LOWER_BOUND = 0
 X_UPPER_BOUND = 640
 Y_LOWER_BOUND = 48
 Y_UPPER_BOUND = 334
+TWO_PI = 2 * math.pi
 
 
 def linspace(a, b, num):
@@ -14,12 +23,23 @@ def linspace(a, b, num):
     return [a + step * i for i in range(num)]
 
 
+def linspace_array(a, b, num) -> np.ndarray:
+    """
+    Array version of `linspace`
+    """
+    diff = b - a + (1 if b > a else -1)
+    step = diff / num
+    return a + step * np.arange(num)
+
+
 def max_dist_from_edge(position: Tuple):
+    """
+    Returns 3/4 of the distance from `position` to the farthest of the
+    edges x = 0, y = 0, x = 584 and y = 364
+    """
     x, y = position
-    edges = [(0, y), (x, 0), (584, y), (x, 364)]
-    dists = [distance_between_positions(position, edge) for edge in edges]
 
-    return int(max(dists) * .75)
+    return int(max(abs(x), abs(y), abs(584 - x), abs(364 - y)) * .75)
 
 
 def distance_between_positions(a: Tuple, b: Tuple):
@@ -45,47 +65,34 @@ def arc_len(a: tuple, b: tuple, center: tuple, radius: int) -> int:
     return 2 * math.pi - angle * radius if reflex else angle * radius
 
 
-def get_quadrant(origin, point):
+def get_angle_radians(origin, point):
     """
-    Return the circle quadrant the vector lies in
+    Return angle of line connecting points 1 and 2, in the range [0, 2pi)
 
     NOTE: Y-axis is INVERTED
     """
-    if origin[0] < point[0] and origin[1] == point[1]:
-        return 0
-
-    if origin[0] >= point[0] and origin[1] > point[1]:
-        quadrant = 1
-    elif origin[0] <= point[0] and origin[1] < point[1]:
-        quadrant = 3
-    elif origin[0] <= point[0]:
-        quadrant = 0
-    else:
-        quadrant = 2
-
-    return quadrant
+    return math.atan2(origin[1] - point[1], point[0] - origin[0]) % TWO_PI
 
 
-def get_angle_radians(origin, point):
+def angles_radians(origin, points) -> np.ndarray:
     """
-    Return angle of line connecting points 1 and 2
+    Array version of `get_angle_radians` for a (n, 2) array of points
     """
-    quadrant = get_quadrant(origin, point)
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
 
-    if quadrant in (1, 3):
-        point3 = origin[0], point[1]
-    else:
-        point3 = point[0], origin[1]
+    return np.mod(np.arctan2(origin[1] - points[:, 1],
+                             points[:, 0] - origin[0]), TWO_PI)
 
-    a = distance_between(point3[0], point3[1], point[0], point[1])
-    c = distance_between(origin[0], origin[1], point[0], point[1])
 
-    sin_A = a / c  # backwards solve using law of sines (w/ C being right angle)
+def ccw_sweep(start_angle, end_angle) -> float:
+    """
+    Return radians covered moving counter-clockwise from `start_angle` to
+    `end_angle`. Equal angles are treated as a full turn
+    """
+    if end_angle > start_angle:
+        return end_angle - start_angle
 
-    try:
-        return math.asin(sin_A) + quadrant * math.pi / 2
-    except ValueError:
-        pdb.set_trace()
+    return TWO_PI - start_angle + end_angle
 
 
 def solve_x_for_circle(c_x, c_y, radius, y):
@@ -121,10 +128,63 @@ class InvalidPathException(BaseException):
     pass
 
 
+class NoValidPathError(ValueError):
+    pass
+
+
 def find_valid_path(c_x, c_y, radius, start_pos, end_pos, duration, slider_multiplier=1, osu_pixel_dist=None):
     """
     Returns list of points on a valid path from `start_pos` to `end_pos` if
-    such a path exists. Otherwise, returns None
+    such a path exists. Otherwise, returns None. Arcs leaving the grid
+    bounds are rejected from their bounding box before any points are
+    generated
+    """
+    arc = find_valid_arc_path(c_x, c_y, radius, start_pos, end_pos, duration,
+                              slider_multiplier, osu_pixel_dist)
+
+    if arc is None:
+        return None
+
+    path = np.asarray(arc)
+
+    if not valid_mask(path).all():
+        # only reachable through rounding at the exact grid edge
+        raise InvalidPathException
+
+    return _to_tuples(path)
+
+
+def find_valid_arc_path(c_x, c_y, radius, start_pos, end_pos, duration,
+                        slider_multiplier=1, osu_pixel_dist=None):
+    """
+    Lazy version of `find_valid_path`. Returns an ArcPath or None,
+    raising InvalidPathException if the arc leaves the grid bounds
+    """
+    arc = circle_arc(c_x, c_y, radius, start_pos, end_pos, osu_pixel_dist)
+
+    if arc is None:
+        return None
+
+    distance, reverse = arc
+    start_angle = get_angle_radians((c_x, c_y), start_pos)
+    start_radius = distance_between(start_pos[0], start_pos[1], c_x, c_y)
+
+    if distance == 0 or not arc_within_bounds(
+            c_x, c_y, start_radius, start_angle,
+            _arc_sweep(duration, slider_multiplier, reverse)):
+        raise InvalidPathException
+
+    return ArcPath(duration, c_x, c_y, start_radius, start_angle,
+                   distance * slider_multiplier / duration, distance, reverse)
+
+
+def circle_arc(c_x, c_y, radius, start_pos, end_pos, osu_pixel_dist=None):
+    """
+    Returns
+    -------
+    (distance, reverse) for the arc `find_valid_path` follows from
+    `start_pos`, or None if the circle leaves the grid between `start_pos`
+    and `end_pos` in both directions
     """
     intersect_pts = find_intersect_pts(c_x, c_y, radius)
     center = c_x, c_y
@@ -142,23 +202,120 @@ def find_valid_path(c_x, c_y, radius, start_pos, end_pos, duration, slider_multi
     if osu_pixel_dist and osu_pixel_dist > abs(distance):
         distance = osu_pixel_dist if distance > 0 else osu_pixel_dist * -1
 
-    step_length = distance * slider_multiplier / duration
-    path = []
+    return distance, reverse
 
-    for i in range(duration):
-        radians = i * step_length / distance
-        path.append(next_circle_point(
-            start_pos[0],
-            start_pos[1],
-            c_x,
-            c_y,
-            radians if not reverse else radians * -1
-        ))
 
-    if list(filter(lambda i: invalid_coord(*i), path)):
-        raise InvalidPathException
+def arc_bounds(c_x, c_y, radius, start_angle, sweep) -> tuple:
+    """
+    Returns
+    -------
+    (min_x, min_y, max_x, max_y) of the arc starting at `start_angle` and
+    covering `sweep` radians (negative sweeps move clockwise)
+    """
+    low, high = sorted((start_angle, start_angle + sweep))
+    angles = [low, high]
 
-    return path
+    quarter = math.pi / 2
+    k = math.ceil(low / quarter)
+    while k * quarter <= high and len(angles) < 6:
+        angles.append(k * quarter)
+        k += 1
+
+    xs = [c_x + radius * math.cos(a) for a in angles]
+    ys = [c_y - radius * math.sin(a) for a in angles]
+
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def arc_within_bounds(c_x, c_y, radius, start_angle, sweep) -> bool:
+    min_x, min_y, max_x, max_y = arc_bounds(c_x, c_y, radius, start_angle,
+                                            sweep)
+
+    return X_LOWER_BOUND <= min_x and max_x <= X_UPPER_BOUND and \
+        Y_LOWER_BOUND <= min_y and max_y <= Y_UPPER_BOUND
+
+
+def _arc_sweep(duration, slider_multiplier, reverse) -> float:
+    """
+    Radians from the first to the last point of a `find_valid_path` path.
+    The step per frame is `slider_multiplier / duration` radians whatever
+    the arc's length
+    """
+    sweep = (duration - 1) * slider_multiplier / duration
+
+    return -sweep if reverse else sweep
+
+
+def arc_center_range(start_pos, end_pos, duration, slider_multiplier,
+                     k_min, k_max):
+    """
+    Solve for the circles through `start_pos` and `end_pos` whose arc path
+    stays inside the grid bounds.
+
+    Centers lie on the perpendicular bisector, at `mid + k * (dy, -dx)`
+    where (dx, dy) = end_pos - start_pos. The path sweeps
+    `slider_multiplier / duration` radians per frame from `start_pos`,
+    towards `end_pos` (counter-clockwise for k > 0, clockwise for k < 0).
+    Rotating `start_pos` about a center is affine in the center, so every
+    point of the path is `a + k * b` for fixed a and b, and each bound is a
+    linear inequality in k. Their intersection is a single interval.
+
+    Params
+    ------
+    k_min, k_max: range of k to search, on one side of 0
+
+    Returns
+    -------
+    (low, high) interval of valid k, or None if there is none
+    """
+    start = np.asarray(start_pos, dtype=float)
+    direction = np.asarray(end_pos, dtype=float) - start
+    normal = np.array([direction[1], -direction[0]])
+    mid = start + direction / 2
+
+    if not normal.any():
+        return None
+
+    sign = 1 if k_max > 0 else -1
+    radians = sign * np.arange(duration) * slider_multiplier / duration
+    cos, sin = np.cos(radians)[:, None], np.sin(radians)[:, None]
+
+    def rotate(v):
+        # rotation by `radians` with the y-axis inverted, as in `get_point`
+        return np.hstack([cos * v[0] + sin * v[1], cos * v[1] - sin * v[0]])
+
+    a = rotate(start) + mid - rotate(mid)
+    b = normal - rotate(normal)
+    lower = np.array([X_LOWER_BOUND, Y_LOWER_BOUND]) - a
+    upper = np.array([X_UPPER_BOUND, Y_UPPER_BOUND]) - a
+
+    fixed = b == 0
+    if (lower[fixed] > 0).any() or (upper[fixed] < 0).any():
+        return None
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        low = np.where(b > 0, lower / b, upper / b)[~fixed]
+        high = np.where(b > 0, upper / b, lower / b)[~fixed]
+
+    low = max(k_min, low.max(initial=-np.inf))
+    high = min(k_max, high.min(initial=np.inf))
+
+    return (float(low), float(high)) if low <= high else None
+
+
+def arc_center_path(start_pos, end_pos, duration, slider_multiplier, k):
+    """
+    Returns the ArcPath of `arc_center_range` for the circle at `k`
+    """
+    dx, dy = end_pos[0] - start_pos[0], end_pos[1] - start_pos[1]
+    c_x = start_pos[0] + dx / 2 + k * dy
+    c_y = start_pos[1] + dy / 2 - k * dx
+    radius = distance_between(start_pos[0], start_pos[1], c_x, c_y)
+
+    return ArcPath(duration, c_x, c_y, radius,
+                   get_angle_radians((c_x, c_y), start_pos),
+                   radius * slider_multiplier / duration, radius,
+                   reverse=k < 0)
 
 
 def find_intersect_pts(c_x, c_y, radius) -> List[tuple]:
@@ -206,8 +363,8 @@ def valid_radian_range(c_x, c_y, radius) -> tuple:
     if len(intersect_pts) < 2:
         start_a, end_a = 0, 2 * math.pi
     else:
-        intersect_angles = [get_angle_radians(center, pt) for pt in intersect_pts]
-        intersect_angles = sorted(intersect_angles)
+        intersect_angles = sorted(
+            angles_radians(center, intersect_pts).tolist())
         intersect_angles.append(intersect_angles[0])
 
         max_dist = 0
@@ -216,7 +373,7 @@ def valid_radian_range(c_x, c_y, radius) -> tuple:
 
         for index, a in enumerate(intersect_angles[:-1]):
             next_a = intersect_angles[index + 1]
-            diff = next_a - a if next_a > a else math.pi * 2 - a + next_a
+            diff = ccw_sweep(a, next_a)
             mid_a = a + diff / 2
 
             pt_mid = get_point(c_x, c_y, radius, mid_a)
@@ -227,8 +384,7 @@ def valid_radian_range(c_x, c_y, radius) -> tuple:
                     max_dist = next_a - a
 
     if start_a == end_a:
-        print('warning: start_radian == end_radian: start: {}, end {}'
-              .format(start_a, end_a))
+        instrumentation.count('degenerate_radian_range')
 
     return start_a, end_a
 
@@ -279,6 +435,17 @@ def get_point(c_x, c_y, radius, angle):
     return end_x, end_y
 
 
+def circle_points(c_x, c_y, radius, angles) -> np.ndarray:
+    """
+    Array version of `get_point`. Returns (len(angles), 2) array of points
+    """
+    points = np.empty((len(angles), 2))
+    points[:, 0] = c_x + radius * np.cos(angles)
+    points[:, 1] = c_y - radius * np.sin(angles)
+
+    return points
+
+
 def next_circle_point(start_x, start_y, c_x, c_y, radians) -> tuple:
     start_angle = get_angle_radians((c_x, c_y), (start_x, start_y))
     angle = start_angle + radians
@@ -299,22 +466,242 @@ def invalid_coord(*args) -> bool:
     return not valid_coord(*args)
 
 
+def valid_mask(points: np.ndarray) -> np.ndarray:
+    """
+    Array version of `valid_coord` for a (n, 2) array of points
+    """
+    x, y = points[:, 0], points[:, 1]
+
+    return (X_LOWER_BOUND <= x) & (x <= X_UPPER_BOUND) & \
+           (Y_LOWER_BOUND <= y) & (y <= Y_UPPER_BOUND)
+
+
+def _has_negative_pos(points: np.ndarray) -> bool:
+    return bool(np.any((points[:, 0] < -64) | (points[:, 1] < -32)))
+
+
+def clip_to_bounds(points: np.ndarray) -> np.ndarray:
+    """
+    Returns copy of the (n, 2) array of points moved inside the grid bounds
+    """
+    points = np.array(points, dtype=float)
+    np.clip(points[:, 0], X_LOWER_BOUND, X_UPPER_BOUND, out=points[:, 0])
+    np.clip(points[:, 1], Y_LOWER_BOUND, Y_UPPER_BOUND, out=points[:, 1])
+
+    return points
+
+
+def _to_tuples(points: np.ndarray) -> List[tuple]:
+    return [tuple(p) for p in points.tolist()]
+
+
 def linear_positions(duration, start, end, repeats=1):
-    x1, y1 = start
-    x2, y2 = end
+    path = linear_path(duration // repeats, start, end)
+
+    return extend_positions(_to_tuples(np.asarray(path)), repeats)
+
+
+def linear_path(duration, start, end):
+    """
+    Lazy version of `linear_positions` without repeats
+    """
+    path = LinearPath(duration, start, end)
+
+    # points move monotonically, so only the ends can leave the grid
+    if duration > 0 and _has_negative_pos(path.take([0, -1])):
+        diagnostics.report('linear_positions',
+                           'path from {} to {} leaves the grid'
+                           .format(start, end),
+                           diagnostics.InvalidPositionError)
+        path = path.clipped()
+
+    return path
+
+
+class Path:
+    """
+    Path of `duration` frames whose points are computed on demand, so a
+    section only pays for the frames it samples. Indexing with an int
+    returns a (2,) array, with a slice another Path and with an index array
+    a (n, 2) array. `np.asarray(path)` materializes every point
+    """
+
+    def __init__(self, duration, frames=None, clip=False):
+        self._frames = range(duration) if frames is None else frames
+        self._clip = clip
+
+    def _points(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Returns (len(frames), 2) array of points at the given frames of the
+        whole, unsliced path
+        """
+        raise NotImplementedError
+
+    def _point(self, frame) -> np.ndarray:
+        """
+        Returns (2,) array of the point at `frame` of the whole path
+        """
+        point = self._points(np.array([frame]))[0]
+
+        return clip_to_bounds(point[None])[0] if self._clip else point
+
+    def _copy(self, **kwargs):
+        path = copy.copy(self)
+        path.__dict__.update(kwargs)
+
+        return path
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._copy(_frames=self._frames[index])
+
+        if isinstance(index, (int, np.integer)):
+            return self._point(self._frames[index])
 
-    x_coords = linspace(x1, x2, duration // repeats)
-    y_coords = linspace(y1, y2, duration // repeats)
+        return self.take(index)
 
-    positions = list(zip(x_coords, y_coords))
+    def __iter__(self):
+        return iter(np.asarray(self))
 
-    negative_pos = next((i for i in positions if i[0] < -64 or i[1] < -32),
-                        None)
+    def __array__(self, dtype=None, copy=None):
+        points = self.take(np.arange(len(self)))
 
-    if negative_pos is not None:
-        pdb.set_trace()
+        return points if dtype is None else points.astype(dtype)
 
-    return extend_positions(positions, repeats)
+    def take(self, indexes) -> np.ndarray:
+        """
+        Returns (n, 2) array of the points at `indexes`
+        """
+        indexes = np.asarray(indexes, dtype=np.int64).reshape(-1)
+        n = len(self._frames)
+        indexes = np.where(indexes < 0, indexes + n, indexes)
+
+        if indexes.size and (indexes.min() < 0 or indexes.max() >= n):
+            raise IndexError('path index out of range')
+
+        frames = self._frames.start + self._frames.step * indexes
+        points = self._points(frames)
+
+        return clip_to_bounds(points) if self._clip else points
+
+    def at(self, index) -> tuple:
+        return tuple(self[index].tolist())
+
+    def clipped(self):
+        """
+        Returns copy of the path with its points moved inside the grid bounds
+        """
+        return self._copy(_clip=True)
+
+    @property
+    def end_position(self) -> tuple:
+        return self.at(-1)
+
+    @property
+    def length(self) -> float:
+        """
+        Length in pixels from the first to the last point. Subclasses
+        compute it from their geometry; clipped paths fall back to the
+        polyline through every point
+        """
+        return polyline_length(np.asarray(self))
+
+
+class LinearPath(Path):
+    """
+    Straight path with the points of `linear_positions`
+    """
+
+    def __init__(self, duration, start, end, **kwargs):
+        super().__init__(duration, **kwargs)
+        self._start = start
+        self._step = tuple(
+            (b - a + (1 if b > a else -1)) / duration if duration else 0
+            for a, b in zip(start, end))
+
+    def _points(self, frames: np.ndarray) -> np.ndarray:
+        points = np.empty((len(frames), 2))
+        points[:, 0] = self._start[0] + self._step[0] * frames
+        points[:, 1] = self._start[1] + self._step[1] * frames
+
+        return points
+
+    def _point(self, frame) -> np.ndarray:
+        if self._clip:
+            return super()._point(frame)
+
+        return np.array([self._start[0] + self._step[0] * frame,
+                         self._start[1] + self._step[1] * frame])
+
+    @property
+    def length(self) -> float:
+        if self._clip or len(self) < 2:
+            return super().length
+
+        frames = abs(self._frames[-1] - self._frames[0])
+
+        return math.hypot(*self._step) * frames
+
+
+class ArcPath(Path):
+    """
+    Circular path with the points of `find_valid_path`, moving
+    `step_length / distance` radians per frame
+    """
+
+    def __init__(self, duration, c_x, c_y, radius, start_angle, step_length,
+                 distance, reverse=False, **kwargs):
+        super().__init__(duration, **kwargs)
+        self._center = c_x, c_y
+        self._radius = radius
+        self._start_angle = start_angle
+        self._step_length = step_length
+        self._distance = distance
+        self._reverse = reverse
+
+    def _points(self, frames: np.ndarray) -> np.ndarray:
+        radians = frames * self._step_length / self._distance
+
+        if self._reverse:
+            radians *= -1
+
+        return circle_points(self._center[0], self._center[1], self._radius,
+                             self._start_angle + radians)
+
+    def _point(self, frame) -> np.ndarray:
+        if self._clip:
+            return super()._point(frame)
+
+        radians = frame * self._step_length / self._distance
+        if self._reverse:
+            radians *= -1
+
+        return np.array(get_point(self._center[0], self._center[1],
+                                  self._radius, self._start_angle + radians))
+
+    @property
+    def length(self) -> float:
+        if self._clip or len(self) < 2:
+            return super().length
+
+        frames = abs(self._frames[-1] - self._frames[0])
+
+        return self._radius * abs(self._step_length / self._distance) * frames
+
+
+def polyline_length(points) -> float:
+    """
+    Returns summed distance between consecutive points of a (n, 2) array
+    """
+    points = np.asarray(points, dtype=float)
+
+    if len(points) < 2:
+        return 0.0
+
+    return float(np.hypot(*np.diff(points, axis=0).T).sum())
 
 
 def is_left(a, b, c):
@@ -346,19 +733,18 @@ def circle_positions(pixel_len, duration, start, pass_through, end, repeats):
     if is_left(start, pass_through, end):
         radians *= -1
 
-    steps = linspace(0, radians, duration // repeats)
-
-    positions = [next_circle_point(start[0], start[1], c_x, c_y, r) for
-                 r in
-                 steps]
-
-    negative_pos = next((i for i in positions if i[0] < -64 or i[1] < -32),
-                        None)
+    steps = linspace_array(0, radians, duration // repeats)
+    start_angle = get_angle_radians((c_x, c_y), start)
+    positions = circle_points(c_x, c_y, radius, start_angle + steps)
 
-    if negative_pos is not None:
-        pdb.set_trace()
+    if _has_negative_pos(positions):
+        diagnostics.report('circle_positions',
+                           'arc through {}, {}, {} leaves the grid'
+                           .format(start, pass_through, end),
+                           diagnostics.InvalidPositionError)
+        positions = clip_to_bounds(positions)
 
-    return extend_positions(positions, repeats)
+    return extend_positions(_to_tuples(positions), repeats)
 
 
 # def bezier_positions(duration, points, repeats):
@@ -1,9 +1,18 @@
-from typing import List
+from bisect import bisect_left, bisect_right
+from typing import Iterator, List
 
 import random
-from . import markov
+
+import numpy as np
+
+from . import cache, diagnostics, hit_objects, instrumentation, markov, \
+    timing
 from .section import ComboSection
-import pdb
+
+STACK_THRESHOLD = 20
+# frames past a section's start its end can depend on: a stack is looked
+# for up to an interval past the section's last hit
+SECTION_LOOKAHEAD = 2 * markov.interval_frames + STACK_THRESHOLD
 
 
 class HitCirclePredictor:
@@ -12,38 +21,64 @@ class HitCirclePredictor:
                  hit_events,
                  beat_duration_mls,
                  slider_multiplier,
-                 random_seed=None):
+                 random_seed=None,
+                 cache=None,
+                 area_model=None):
+        """
+        Params
+        ------
+        area_model: optional markov.AreaModel to sample areas from instead
+        of the path map's order 2 transitions
+        """
         self._path_map = path_map
+        self._area_model = area_model
+        self._transitions = area_model or \
+            getattr(path_map, 'transitions', None) or \
+            markov.TransitionTable.from_path_map(path_map)
         self._hit_events = hit_events
         self._beat_duration_mls = beat_duration_mls
         self._slider_multiplier = slider_multiplier
         self._screen_width = 512
         self._screen_height = 384
+        self._random_seed = random_seed
         self._random = random.Random(random_seed)
+        self._cache = cache
+        self._frame_times = None
         self._slider_types = ['linear', 'bezier']
 
     @property
     def len_frames(self):
         return len(self._hit_events)
 
-    def _next_area(self, area1, area2):
-        attempts = 0
-        key = 'bad_key'
-        while key not in self._path_map:
-            if attempts > 3:
-                key = self._random.choice(list(self._path_map.keys()))
-                break
+    @property
+    def frame_times(self):
+        """
+        Time in milliseconds of every frame, computed once per song
+        """
+        if self._frame_times is None or \
+                len(self._frame_times) != self.len_frames:
+            self._frame_times = timing.frame_times(self.len_frames)
 
-            key = markov.area_key(area1, area2)
-            attempts += 1
+        return self._frame_times
 
-        next_area = self._random.choice(self._path_map[key])
+    @property
+    def context_len(self) -> int:
+        """
+        Number of previous areas the next area is conditioned on
+        """
+        return self._transitions.order
 
-        while next_area == area2:
-            next_area = self._random.choice(self._path_map[key])
+    def _next_area(self, *areas, rng=None):
+        r = rng if rng is not None else self._random
+        next_area = self._transitions.sample_path(areas, r)
 
-        if next_area < 0:
-            pdb.set_trace()
+        if not 0 <= next_area < markov.n_areas:
+            diagnostics.report('next_area',
+                               'sampled area {} after {}'
+                               .format(next_area, ', '.join(map(str, areas))),
+                               diagnostics.InvalidAreaError)
+            next_area = markov.random_area(markov.clamp_area(areas[-1]),
+                                           rng=r)
 
         return next_area
 
@@ -53,27 +88,26 @@ class HitCirclePredictor:
         pass through as the song progresses.
         List length = song_length_frames // length_interval_frames
         """
-        print('generating area checkpoints...')
         first_x = self._random.randrange(self._screen_width)
         first_y = self._random.randrange(self._screen_height)
 
         area1 = markov.get_area_number(first_x, first_y)
-        area2 = markov.random_area(area1)
-        area3 = markov.random_area(area2)
+        area2 = markov.random_area(area1, rng=self._random)
+        area3 = markov.random_area(area2, rng=self._random)
 
         areas = [area1, area2, area3]
 
-        if -1 in areas or 10 in areas:
-            pdb.set_trace()
+        if not all(0 <= a < markov.n_areas for a in areas):
+            diagnostics.report('generate_areas',
+                               'initial areas {} are off the grid'
+                               .format(areas),
+                               diagnostics.InvalidAreaError)
+            areas = [markov.clamp_area(a) for a in areas]
 
         for t in range(3 * markov.interval_frames,
                        self.len_frames + markov.interval_frames,
                        markov.interval_frames):
-            next_area = self._next_area(*areas[-2:])
-
-            if next_area == -1 or next_area > 9:
-                pdb.set_trace()
-            areas.append(next_area)
+            areas.append(self._next_area(*areas[-self.context_len:]))
 
         return areas
 
@@ -85,27 +119,29 @@ class HitCirclePredictor:
 
         Return a list of tuples representing start/end of sections
         """
+        hit_events = np.asarray(self._hit_events)
         intervals = []
-        index = 1
 
-        section_start = 0
-        while index < self.len_frames:
-            value = self._hit_events[index]
-            start_value = self._hit_events[section_start]
-
-            if value == 1:
-                if start_value == 0:
-                    if index < self.len_frames - 1 and \
-                                    self._hit_events[index + 1] == 1:
-                        intervals.append((section_start, index))
-                        section_start = index
-
-            if value == 0:
-                if start_value == 1:
-                    intervals.append((section_start, index))
-                    section_start = index
+        if self.len_frames > 1:
+            # a gap section ends at the next pair of adjacent hits,
+            # a slider section ends at the next empty frame
+            pair_starts = (np.flatnonzero(
+                (hit_events[1:-1] == 1) & (hit_events[2:] == 1)) + 1).tolist()
+            empty_frames = (np.flatnonzero(hit_events[1:] == 0) + 1).tolist()
+            in_slider = hit_events[0] == 1
+
+            section_start = 0
+            while True:
+                ends = empty_frames if in_slider else pair_starts
+                i = bisect_right(ends, section_start)
+                if i == len(ends):
+                    break
 
-            index += 1
+                intervals.append((section_start, ends[i]))
+                section_start = ends[i]
+                in_slider = not in_slider
+        else:
+            section_start = 0
 
         if section_start != self.len_frames - 1:
             intervals.append((section_start, self.len_frames))
@@ -125,7 +161,6 @@ class HitCirclePredictor:
         sections = []
         last_hit_index = 0
         last_hit_position = interval_checkpoints[0]
-        print('building sections list...')
         for start, end in interval_sections:
             destination = end // markov.interval_frames
             destination_position = interval_checkpoints[destination]
@@ -147,28 +182,100 @@ class HitCirclePredictor:
     def _get_sections(self, checkpoints):
         raise NotImplementedError
 
+    def cache_key(self) -> str:
+        """
+        Returns
+        -------
+        Key identifying this prediction's output, or None if the output is
+        not reproducible (no random seed)
+        """
+        if self._random_seed is None:
+            return None
+
+        return cache.hit_objects_key(
+            self._hit_events,
+            self._beat_duration_mls,
+            self._slider_multiplier,
+            self._random_seed,
+            cache.path_map_digest(self._area_model or self._path_map)
+        )
+
     def predict(self, return_areas=False):
         """
         Returns
         -------
         List of dictionaries representing hit/slider events
         """
-        areas = self._generate_areas()
-        print('translating areas to random positions...')
-        interval_checkpoints = [markov.random_position_in_square(n) for n in
-                                areas]
+        if return_areas:
+            batch, areas = self._predict_batch(return_areas=True)
+            return batch.to_dicts(), areas
+
+        return self.predict_batch().to_dicts()
+
+    def predict_batch(self) -> hit_objects.HitObjectBatch:
+        """
+        Returns
+        -------
+        hit_objects.HitObjectBatch of the hit/slider events
+        """
+        return self._predict_batch()
+
+    def _predict_batch(self, return_areas=False):
+        key = None
+        if self._cache is not None and not return_areas:
+            key = self.cache_key()
+            result = None if key is None else self._cache.get(key)
+            if result is not None:
+                instrumentation.count('cache_hits')
+                return result
 
-        print('getting section start/end times...')
-        sections = self._get_sections(interval_checkpoints)
+        result, areas = self._generate_hit_objects(return_areas)
 
-        print('building list of hit objects...')
-        result = [h for s in sections for h in s.get_hits()]
+        if key is not None:
+            self._cache.put(key, result)
 
         if return_areas:
-            return result, (areas, interval_checkpoints)
+            return result, areas
         else:
             return result
 
+    def _generate_hit_objects(self, return_areas=False) -> tuple:
+        """
+        Returns
+        -------
+        (hit_objects.HitObjectBatch, (areas, interval_checkpoints)) of a
+        new prediction
+        """
+        areas, interval_checkpoints = self._generate_checkpoints()
+
+        with instrumentation.stage('sections') as stage:
+            sections = self._get_sections(interval_checkpoints)
+            stage.add(len(sections))
+
+        with instrumentation.stage('hit_building') as stage:
+            builder = hit_objects.HitObjectBuilder()
+            for s in sections:
+                s.add_hits(builder)
+            result = builder.build()
+            stage.add(len(result))
+
+        return result, (areas, interval_checkpoints)
+
+    def _generate_checkpoints(self) -> tuple:
+        """
+        Returns
+        -------
+        (areas, interval_checkpoints) with a random position in each area
+        """
+        with instrumentation.stage('area_generation') as stage:
+            areas = self._generate_areas()
+            interval_checkpoints = [
+                markov.random_position_in_square(n, rng=self._random)
+                for n in areas]
+            stage.add(len(areas))
+
+        return areas, interval_checkpoints
+
 
 class SectionPredictor(HitCirclePredictor):
     """
@@ -176,98 +283,228 @@ class SectionPredictor(HitCirclePredictor):
     Start each interval from the end of the previous section.
     """
 
-    def _divides_stack(self, section_start, index) -> bool:
+    def _divides_stack(self, hit_indexes, position, section_start,
+                       n_frames) -> bool:
+        """
+        Returns whether ending a section at hit `hit_indexes[position]` would
+        split a stack of hits near the end of the section's interval
+        """
+        index = hit_indexes[position]
 
-        stack_threshold = 20
-        if section_start + markov.interval_frames > index + stack_threshold:
+        if section_start + markov.interval_frames > index + STACK_THRESHOLD:
             return False
 
-        closest_left = 1
-
-        left_start = index - closest_left
-        left_end = min(section_start, index - stack_threshold)
-        left_index = left_start
-
-        for i in range(left_start, left_end, -1):
-            if self._hit_events[i] == 1:
-                left_index = i
-                break
+        left_end = min(section_start, index - STACK_THRESHOLD)
+        if position > 0 and hit_indexes[position - 1] > left_end:
+            left_index = hit_indexes[position - 1]
+        else:
+            left_index = index - 1
 
-        end_range = min(len(self._hit_events), index + stack_threshold - (
+        end_range = min(n_frames, index + STACK_THRESHOLD - (
                     section_start - left_index) - 1)
-        for i in range(index + 1, end_range):
-            if self._hit_events[i] == 1:
-                return True
 
-        return False
+        return position + 1 < len(hit_indexes) and \
+            hit_indexes[position + 1] < end_range
 
     def _get_section(self, start, end, last_hit_index, last_hit_position,
-                     destination_area, new_combo=False):
+                     destination_area, new_combo=False, rng=None,
+                     hit_events=None, frame_times=None):
         """
         Returns a ComboSection containing all the hits
-        occuring inside this section
+        occuring inside this section. Random choices are drawn from `rng`,
+        or the predictor's generator. `hit_events` and `frame_times` default
+        to the song's frames `start` to `end`
         """
+        rng = rng if rng is not None else self._random
         destination_position = markov.random_position_in_square(
-            destination_area)
+            destination_area, rng=rng)
 
         return ComboSection(
             start,
             last_hit_index,
             last_hit_position,
             destination_position,
-            self._hit_events[start:end],
+            self._hit_events[start:end] if hit_events is None
+            else hit_events,
             self._beat_duration_mls,
             self._slider_multiplier,
-            new_combo
+            new_combo,
+            rng=rng,
+            frame_times=self.frame_times[start:end] if frame_times is None
+            else frame_times
         )
 
-    def __get_section_start_stops(self):
-        section_start_stops = []
-        index = 0
+    def _next_section_start_stop(self, hit_indexes, section_start,
+                                 n_frames) -> tuple:
+        """
+        Returns
+        -------
+        (start, stop) of the section starting at `section_start`, or None if
+        its interval has no hits, and the frame the next section starts at.
+        Only hits before `section_start + SECTION_LOOKAHEAD` are looked at
+        """
+        interval_end = min(n_frames, section_start + markov.interval_frames)
+        first = bisect_left(hit_indexes, section_start)
+        position = bisect_left(hit_indexes, interval_end) - 1
 
-        while index < self.len_frames:
+        while position >= first and self._divides_stack(
+                hit_indexes, position, section_start, n_frames):
+            position -= 1
 
-            section_start = section_end = index
-            while index < self.len_frames and index < section_start +\
-                    markov.interval_frames:
-                if self._hit_events[index] == 1 and not self._divides_stack(
-                        section_start, index):
-                    section_end = index + 1
+        if position >= first:
+            section_end = hit_indexes[position] + 1
+            return (section_start, section_end), section_end + 1
 
-                index += 1
+        return None, interval_end + 1
 
-            if section_start != section_end:
-                section_start_stops.append((section_start, section_end))
-                index = section_end + 1
-            else:
-                index += 1
+    def _get_section_start_stops(self):
+        """
+        Split the song into sections of at most `markov.interval_frames`
+        frames, each ending on its last hit that does not divide a stack
+        """
+        hit_indexes = np.flatnonzero(
+            np.asarray(self._hit_events) == 1).tolist()
+        section_start_stops = []
+        index = 0
+
+        while index < self.len_frames:
+            start_stop, index = self._next_section_start_stop(
+                hit_indexes, index, self.len_frames)
+            if start_stop is not None:
+                section_start_stops.append(start_stop)
 
         return section_start_stops
 
-    def _get_sections(self, checkpoints):
+    def _chain_sections(self, section_windows):
+        """
+        Yields the section of each (start, stop, hit_events, frame_times) in
+        `section_windows`, each starting from the end of the one before and
+        heading for an area sampled after the previous sections' areas.
+        `hit_events` and `frame_times` may be None to use the song's
+        """
         first_x = self._random.randrange(self._screen_width)
         first_y = self._random.randrange(self._screen_height)
 
         area1 = markov.get_area_number(first_x, first_y)
-        area2 = markov.random_area(area1)
-        section_start_stops = self.__get_section_start_stops()
+        area2 = markov.random_area(area1, rng=self._random)
 
-        sections = []
         last_pos = first_x, first_y
         last_index = 0
         previous_areas = [area1, area2]
 
-        for section_index, start_stop in enumerate(section_start_stops):
+        for section_index, window in enumerate(section_windows):
             new_combo = section_index % 3 == 0
             # new_combo = True  # DEBUG
-            start, stop = start_stop
-            next_destination = self._next_area(*previous_areas[-2:])
+            start, stop, hit_events, frame_times = window
+            next_destination = self._next_area(
+                *previous_areas[-self.context_len:])
             section = self._get_section(start, stop, last_index, last_pos,
-                                        next_destination, new_combo)
-            sections.append(section)
+                                        next_destination, new_combo,
+                                        hit_events=hit_events,
+                                        frame_times=frame_times)
+            yield section
             last_pos = section.end_position
 
             last_index = stop
-            previous_areas.extend(markov.positions_to_areas([last_pos]))
+            previous_areas = (previous_areas + markov.positions_to_areas(
+                [last_pos]))[-self.context_len:]
 
-        return sections
+    def _get_sections(self, checkpoints):
+        with instrumentation.stage('segmentation') as stage:
+            section_start_stops = self._get_section_start_stops()
+            stage.add(len(section_start_stops))
+
+        return list(self._chain_sections(
+            (start, stop, None, None) for start, stop in section_start_stops))
+
+    def _generate_hit_objects(self, return_areas=False) -> tuple:
+        """
+        Sections are chained from the song's frames and each section's hits
+        are built before the next section is generated, exactly as in
+        `predict_stream`, so both give the same hit objects for the same
+        seed. Sections do not use the interval checkpoints, so they are
+        only drawn, after the hits, if `return_areas` is set
+        """
+        with instrumentation.stage('segmentation') as stage:
+            section_start_stops = self._get_section_start_stops()
+            stage.add(len(section_start_stops))
+
+        with instrumentation.stage('sections') as stage:
+            batches = list(self._section_hit_batches(
+                (start, stop, None, None)
+                for start, stop in section_start_stops))
+            stage.add(len(batches))
+
+        result = hit_objects.HitObjectBatch.concatenate(batches)
+
+        return result, self._generate_checkpoints() if return_areas else None
+
+    def _section_hit_batches(self, section_windows) -> \
+            Iterator[hit_objects.HitObjectBatch]:
+        """
+        Yields the hits of each section of `_chain_sections`
+        """
+        for section in self._chain_sections(section_windows):
+            with instrumentation.stage('hit_building') as stage:
+                batch = section.get_hit_batch()
+                stage.add(len(batch))
+
+            yield batch
+
+    def predict_stream(self, hit_event_chunks) -> \
+            Iterator[hit_objects.HitObjectBatch]:
+        """
+        Generate hit objects from hit events arriving in chunks, e.g. from a
+        model running in real time, in bounded memory. The predictor's own
+        hit events are ignored.
+
+        A section is final once `SECTION_LOOKAHEAD` frames past its start
+        have arrived, or the chunks run out. Only the frames from the
+        pending section on, the last position and the last areas are kept
+        between sections.
+
+        Sections are split, chained and built as in `predict_batch`, so for
+        the same seed the batches concatenate to its output, however the
+        hit events are chunked.
+
+        Returns
+        -------
+        Generator of a hit_objects.HitObjectBatch per section
+        """
+        return self._section_hit_batches(
+            self._stream_section_windows(hit_event_chunks))
+
+    def _stream_section_windows(self, hit_event_chunks):
+        """
+        Yields (start, stop, hit_events, frame_times) of each section as
+        soon as enough frames have arrived to end it
+        """
+        buffer = np.zeros(0, dtype=np.int64)
+        offset = 0  # frame index of buffer[0]
+        index = 0
+        chunks = iter(hit_event_chunks)
+        done = False
+
+        while not done:
+            chunk = next(chunks, None)
+            if chunk is None:
+                done = True
+            else:
+                drop = min(index - offset, len(buffer))
+                buffer = np.concatenate([buffer[drop:],
+                                         np.asarray(chunk, dtype=np.int64)])
+                offset += drop
+
+            n_frames = offset + len(buffer)
+            hit_indexes = (np.flatnonzero(buffer == 1) + offset).tolist()
+
+            while index < n_frames and (
+                    done or index + SECTION_LOOKAHEAD <= n_frames):
+                start_stop, index = self._next_section_start_stop(
+                    hit_indexes, index, n_frames)
+
+                if start_stop is not None:
+                    start, stop = start_stop
+                    yield (start, stop,
+                           buffer[start - offset:stop - offset],
+                           timing.frames_to_mls(np.arange(start, stop)))
@@ -2,9 +2,24 @@ from typing import List
 import random
 
 import math
-import pdb
 
-from . import definitions, position, timing
+from . import definitions, diagnostics, hit_objects, instrumentation, \
+    position, timing
+
+
+def _circle_center(bulge) -> float:
+    """
+    Returns the `position.arc_center_range` k of the circle through two
+    points that bulges by `bulge` times their distance
+    """
+    return (bulge ** 2 - 0.25) / (2 * bulge)
+
+
+# circles bulging by 1/32 to 1/4 of the distance, on either side
+CIRCLE_CENTER_RANGES = (
+    (_circle_center(1 / 32), _circle_center(1 / 4)),
+    (-_circle_center(1 / 4), -_circle_center(1 / 32)),
+)
 
 
 def mid_point(p1, p2) -> tuple:
@@ -19,11 +34,14 @@ def random_bezier_path(duration, start_pos, end_pos, repeats=1, seed=None):
 
 
 def get_pixel_length(frame_duration, slider_multiplier, beat_duration_mls,
-                     **kwargs):
+                     hop_length=definitions.hop_length,
+                     n_fft=definitions.n_fft):
     """
-    Reverse solve for pixel length given duration_frames
+    Reverse solve for pixel length given duration_frames. The duration is
+    not truncated to whole milliseconds like `timing.frames_to_mls`
     """
-    mls_duration = timing.frames_to_mls(frame_duration, **kwargs)
+    mls_duration = timing.frame_to_time(frame_duration, hop_length=hop_length,
+                                        n_fft=n_fft) * 1000
     velocity = 100.0 * slider_multiplier
     n_beats = mls_duration / float(beat_duration_mls)
 
@@ -51,7 +69,9 @@ class Section:
             hit_events,
             beat_duration_mls,
             slider_multiplier,
-            new_combo_section=False
+            new_combo_section=False,
+            rng=None,
+            frame_times=None
     ):
 
         if last_hit_index > section_start:
@@ -67,89 +87,67 @@ class Section:
         self._path = None
         self._slider_multiplier = slider_multiplier
         self._beat_duration_mls = beat_duration_mls
+        self._random = rng if rng is not None else random.Random()
+        self._frame_times = frame_times
 
     @property
     def len_frames(self):
         return len(self.hit_events)
 
-    def define_circle(self, start_pos, end_pos, offset):
-
-        direction = end_pos[0] - start_pos[0], end_pos[1] - start_pos[1]
-        midpt = start_pos[0] + direction[0] / 2, start_pos[1] + direction[
-            1] / 2
-        ctrl_pt = midpt[0] + direction[1] / offset, midpt[1] - direction[
-            0] / offset
-
-        if not position.valid_coord(*ctrl_pt):
-            ctrl_pt = midpt[0] - direction[1] / 2, midpt[1] + direction[
-                0] / 2
-
-        return position.define_circle(start_pos, ctrl_pt, end_pos)
-
     def random_circle_path(self, duration, start_pos, end_pos, repeats=1):
-        offset = 4
-        iteration = 0
-        ii = 0
-
-        while True:
-            if iteration > 3:
-                if ii > 5:
-                    raise ValueError(
-                        "Unable to find valid path from {} to {} in {} time"
-                            .format(start_pos, end_pos, duration))
-                iteration = 0
-                offset = 4
-                end_pos = self.random_next_stop()
-                ii += 1
-
-            c_x, c_y, r = self.define_circle(start_pos, end_pos, offset)
+        """
+        Returns an ArcPath from `start_pos` towards `end_pos` along a random
+        circle through both, bulging by between 1/32 and 1/4 of their
+        distance to either side. The circles whose path stays inside the
+        grid are solved for directly and one of them is drawn uniformly
+        """
+        ranges = [r for r in (
+            position.arc_center_range(start_pos, end_pos, duration,
+                                      self._slider_multiplier, *k_range)
+            for k_range in CIRCLE_CENTER_RANGES) if r is not None]
+
+        if not ranges:
+            raise position.NoValidPathError(
+                "Unable to find valid path from {} to {} in {} time"
+                    .format(start_pos, end_pos, duration))
+
+        # uniform over the union of the ranges, with a single draw
+        total = sum(high - low for low, high in ranges)
+        k = self._random.random() * total
+        for low, high in ranges:
+            if k <= high - low:
+                break
+            k -= high - low
+
+        return position.arc_center_path(start_pos, end_pos, duration,
+                                         self._slider_multiplier, low + k)
 
-            try:
-                osu_pixel_dist = (timing.frames_to_mls(
-                    duration) / self._beat_duration_mls) * 100 * self._slider_multiplier
-                path = position.find_valid_path(
-                    c_x,
-                    c_y,
-                    r,
-                    start_pos,
-                    end_pos,
-                    duration,
-                    slider_multiplier=self._slider_multiplier,
-                    osu_pixel_dist=osu_pixel_dist
-                )
-            except position.InvalidPathException:
-                pass
-            else:
-                if path:
-                    break
+    def _pick_path_type(self) -> str:
+        raise NotImplementedError
 
-            offset *= 2
-            iteration += 1
+    def get_hits(self) -> List[dict]:
+        return self.get_hit_batch().to_dicts()
 
-        return path
+    def get_hit_batch(self) -> hit_objects.HitObjectBatch:
+        builder = hit_objects.HitObjectBuilder()
+        self.add_hits(builder)
 
-    def _pick_path_type(self) -> str:
-        raise NotImplementedError
+        return builder.build()
 
-    def get_hits(self, ) -> List[dict]:
+    def add_hits(self, builder: hit_objects.HitObjectBuilder):
+        """
+        Append the section's hit objects to `builder`
+        """
         raise NotImplementedError
 
     def random_angle(self, start_radians, end_radians) -> float:
         """
-        Returns random angle (in radians) occurring in the given range
+        Returns random angle (in radians) occurring in the given range,
+        moving counter-clockwise from `start_radians`
         """
-        start = int(min(start_radians, end_radians) * 100)
-        end = int(max(start_radians, end_radians) * 100)
+        sweep = position.ccw_sweep(start_radians, end_radians)
 
-        if start_radians < end_radians:
-            angle = random.choice(list(range(start, end))) / 100
-        else:
-            range1 = list(range(end, int(200 * math.pi)))
-            range2 = list(range(0, start))
-
-            angle = random.choice(range1 + range2) / 100
-
-        return angle
+        return (start_radians + self._random.random() * sweep) % position.TWO_PI
 
     def random_next_stop(self):
         max_radius = position.max_dist_from_edge(self.last_hit_position)
@@ -171,81 +169,92 @@ class Section:
         )
 
         if not position.valid_coord(*pos):
-            print('Invalid position reached in random_next_stop: {}'.format(pos))
+            instrumentation.count('invalid_next_stop')
 
         return pos
 
     @property
     def path(self):
-        if self._path is not None:
-            return self._path
-        else:
-            path_type = self._pick_path_type()
-            frames_since_last = self.section_start - self.last_hit_index
-            duration = self.len_frames + frames_since_last
-
-            if path_type == 'linear':
-                path = position.linear_positions(
+        if self._path is None:
+            with instrumentation.stage('path_building') as stage:
+                self._path = self._build_path()
+                stage.add(len(self._path))
+
+        return self._path
+
+    def _build_path(self):
+        path_type = self._pick_path_type()
+        frames_since_last = self.section_start - self.last_hit_index
+        duration = self.len_frames + frames_since_last
+
+        if path_type == 'linear':
+            path = position.linear_path(
+                duration,
+                self.random_next_stop(),
+                self.destination_position
+            )
+            if not position.valid_coord(*path[-1]):
+                diagnostics.report('section_path',
+                                   'linear path ends off the grid at {}'
+                                   .format(path.end_position),
+                                   diagnostics.InvalidPositionError)
+                path = path.clipped()
+        elif path_type == 'bezier':
+            path = random_bezier_path(
+                duration,
+                self.last_hit_position,
+                self.destination_position
+            )
+        elif path_type == 'circle':
+            try:
+                path = self.random_circle_path(
                     duration,
                     self.random_next_stop(),
-                    self.destination_position
+                    self.destination_position,
                 )
-                if not position.valid_coord(*path[-1]):
-                    pdb.set_trace()
-            elif path_type == 'bezier':
-                path = random_bezier_path(
+            except position.NoValidPathError:
+                instrumentation.count('circle_path_fallback')
+                path = position.linear_path(
                     duration,
-                    self.last_hit_position,
+                    self.random_next_stop(),
                     self.destination_position
                 )
-            elif path_type == 'circle':
-                try:
-                    path = self.random_circle_path(
-                        duration,
-                        self.random_next_stop(),
-                        self.destination_position,
-                    )
-                except:
-                    path = position.linear_positions(
-                        duration,
-                        self.random_next_stop(),
-                        self.destination_position
-                    )
-            else:
-                raise ValueError('Unknown path type \'{}\''.format(path_type))
-
-            self._path = path[frames_since_last:]
+        else:
+            raise ValueError('Unknown path type \'{}\''.format(path_type))
 
-            return self._path
+        return path[frames_since_last:]
 
     @property
     def end_position(self):
-        return self.path[-1]
+        return self.path.end_position
 
-    def _get_hit_circle(self, frame_index):
-        pos = self.path[frame_index]
-        time = timing.frames_to_mls(
+    def _time(self, frame_index):
+        """
+        Returns time in milliseconds of frame `frame_index` of the section,
+        from the song's `timing.frame_times` table if one was given
+        """
+        if self._frame_times is not None:
+            return self._frame_times[frame_index]
+
+        return timing.frames_to_mls(
             frame_index + self.section_start,
             hop_length=definitions.hop_length,
             n_fft=definitions.n_fft
         )
 
+    def _add_hit_circle(self, builder, frame_index):
+        pos = self.path[frame_index]
+        time = self._time(frame_index)
+
         if self.new_combo_section:
             hit_type = 5
             self.new_combo_section = False
         else:
             hit_type = 1
 
-        return {
-            'x': int(pos[0]),
-            'y': int(pos[1]),
-            'time': int(time),
-            'type': hit_type,
-            'hit_sound': '0',
-            'extras': '0:0:0:0:'
-        }
+        builder.add_circle(pos[0], pos[1], time, hit_type)
 
-    def _get_slider(self, start_pos, time, curve_pts, pixel_length):
+    def _add_slider(self, builder, start_pos, time, curve_pts, pixel_length):
 
         if self.new_combo_section:
             hit_type = 6
@@ -253,44 +262,29 @@ class Section:
         else:
             hit_type = 2
 
-        return {
-            'x': int(start_pos[0]),
-            'y': int(start_pos[1]),
-            'time': int(time),
-            'type': hit_type,
-            'hit_sound': 0,
-            'slider_type': 'P',
-            'curve_points': '|'.join(
-                ['{}:{}'.format(*map(int, c)) for c in curve_pts]),
-            'repeat': 1,
-            'pixel_length': int(pixel_length),
-            'edge_hit_sounds': '0|0',
-            'edge_additions': '0:0|0:0',
-            'extras': '0:0:0:0:'
-        }
+        builder.add_slider(start_pos[0], start_pos[1], time, hit_type,
+                           curve_pts, pixel_length)
 
 
 class HitCircleSection(Section):
     def _pick_path_type(self) -> str:
-        return random.choice(self._path_types, weights=[0.2, 0.8])
+        return self._random.choices(self._path_types, weights=[0.2, 0.8])[0]
 
-    def get_hits(self) -> List[dict]:
-        return [self._get_hit_circle(0, self.random_next_stop())]
+    def add_hits(self, builder):
+        self._add_hit_circle(builder, 0)
 
 
 class SliderSection(Section):
     def _pick_path_type(self) -> str:
-        return random.choice(self._path_types, weights=[0.3, 0.7])
+        return self._random.choices(self._path_types, weights=[0.3, 0.7])[0]
 
-    def get_hits(self) -> List[dict]:
+    def add_hits(self, builder):
         '''
         need to finish
         :return:
         '''
         duration = self.len_frames
-        time = timing.frames_to_mls(self.section_start,
-                                    hop_length=definitions.hop_length,
-                                    n_fft=definitions.n_fft)
+        time = self._time(0)
 
         pixel_length = get_pixel_length(
             duration,
@@ -300,12 +294,12 @@ class SliderSection(Section):
             n_fft=definitions.n_fft
         )
 
-        ctrl_pt_indexes = random.choice(range(0, duration), k=2)
+        ctrl_pt_indexes = self._random.choices(range(0, duration), k=2)
         ctrl_pt_positions = [self.path[i] for i in ctrl_pt_indexes]
         curve_points = [(int(p[0]), int(p[1])) for p in ctrl_pt_positions]
 
-        return [
-            self._get_slider(self.path[0], time, curve_points, pixel_length)]
+        self._add_slider(builder, self.path[0], time, curve_points,
+                         pixel_length)
 
 
 class ComboSection(Section):
@@ -317,48 +311,39 @@ class ComboSection(Section):
         # return 'circle' if bool(random.randint(0, 1)) else 'linear'
         return 'circle'
 
-    def _pixel_len_path(self, start, stop):
-        pts = self.path[start:stop]
-        total_len = 0
-        for i, pt in enumerate(pts[1:]):
-            prev_x, prev_y = pts[i - 1]
-            d = position.distance_between(prev_x, prev_y, pt[0], pt[1])
-            total_len += d
-
-        return total_len
-
-    def get_slider(self, start_index, end_index):
+    def add_slider(self, builder, start_index, end_index):
         mid_index = start_index + int((end_index - start_index) / 2)
         start_pos = self.path[start_index]
         curve_pts = self.path[mid_index], self.path[end_index]
 
-        time = timing.frames_to_mls(self.section_start + start_index)
+        time = self._time(start_index)
 
+        # osu! derives the slider's duration from its pixel length, so it
+        # comes from the slider velocity rather than the drawn path's length
         osu_pixel_len = get_pixel_length(
             end_index - start_index,
             self._slider_multiplier,
             self._beat_duration_mls
         )
 
-        return self._get_slider(start_pos, time, curve_pts, osu_pixel_len)
+        self._add_slider(builder, start_pos, time, curve_pts, osu_pixel_len)
 
-    def get_hits(self) -> List[dict]:
+    def add_hits(self, builder):
         hit_indexes = [i for i, x in enumerate(self.hit_events) if x == 1]
         n_hits = len(hit_indexes)
-        hit_objects = []
 
         if n_hits == 0:
             raise ValueError('Section must contain at least 1 hit')
         elif n_hits == 1:
             index = hit_indexes[0]
-            hit_objects.append(self._get_hit_circle(index))
+            self._add_hit_circle(builder, index)
         elif n_hits == 2:
-            if bool(random.choices([0, 1], [0.4, 0.6])):
-                hit_objects.append(self.get_slider(*hit_indexes))
+            if self._random.choices([0, 1], [0.4, 0.6])[0]:
+                self.add_slider(builder, *hit_indexes)
             else:
                 index1, index2 = hit_indexes
-                hit_objects.append(self._get_hit_circle(index1))
-                hit_objects.append(self._get_hit_circle(index2))
+                self._add_hit_circle(builder, index1)
+                self._add_hit_circle(builder, index2)
         else:
             min_slider_threshold = 15  # min frame dist to use slider
             i = 0
@@ -366,15 +351,14 @@ class ComboSection(Section):
                 hit_index = hit_indexes[i]
                 last_hit_in_section = i < n_hits - 1
                 if last_hit_in_section and hit_indexes[i + 1] - hit_index >= min_slider_threshold:
-                    hit_objects.append(self.get_slider(*hit_indexes[i:i + 2]))
+                    self.add_slider(builder, *hit_indexes[i:i + 2])
                     i += 2
                 else:
-                    hit_circles, new_i = self.clean_stack(hit_indexes, i)
-                    hit_objects.extend(hit_circles)
+                    stack_indexes, new_i = self.clean_stack(hit_indexes, i)
+                    for index in stack_indexes:
+                        self._add_hit_circle(builder, index)
                     i = new_i
 
-        return hit_objects
-
     def clean_stack(self, hit_indexes, i, min_slider_threshold=15):
         '''
         If a stack exists in the hit indexes with length >= 4,
@@ -382,7 +366,8 @@ class ComboSection(Section):
         and evenly intersperse that number of hit events
         between stack_Start and stack_end.
 
-        Return stack and next section index to continue at
+        Return frame indexes of the stack's hit circles and next section
+        index to continue at
 
         If no stack exists, return empty list and first index
         '''
@@ -390,7 +375,7 @@ class ComboSection(Section):
         remaining_hit_indexes = hit_indexes[i:]
 
         if len(remaining_hit_indexes) < 4:
-            stack = [self._get_hit_circle(hit_index)]
+            stack = [hit_index]
             new_i = i + 1
         else:
             j = 0
@@ -407,7 +392,7 @@ class ComboSection(Section):
                     j += 1
                 stack_indexes = intersperse(stack_indexes)
 
-            stack = [self._get_hit_circle(index) for index in stack_indexes]
+            stack = stack_indexes
             j += 1
 
             new_i = i + j
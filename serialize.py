@@ -1,4 +1,10 @@
-from . import definitions
+import functools
+import io
+import os
+import time
+from zipfile import ZipInfo
+
+from . import definitions, hit_objects, instrumentation
 
 
 def serialize_hit_circle(hit_circle):
@@ -17,6 +23,21 @@ def serialize_slider(slider):
     return template.format(**slider)
 
 
+def serialize_hit_object(obj):
+    if obj['type'] in (1, 5):
+        return serialize_hit_circle(obj)
+    elif obj['type'] in (2, 6):
+        return serialize_slider(obj)
+
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def load_header_template(file_name=definitions.FILE_HEADER) -> str:
+    with open(file_name, 'r') as f:
+        return f.read()
+
+
 def get_colors(colors=None):
     '''
     Desired format
@@ -36,6 +57,13 @@ def get_colors(colors=None):
 
 
 class Serializer:
+    """
+    Writes .osu files. `hit_objects` is either a list of hit object
+    dictionaries, a hit_objects.HitObjectBatch, or an iterable of batches
+    such as `SectionPredictor.predict_stream`'s, which is written as it is
+    generated and can only be written once
+    """
+
     def __init__(self, hit_objects, model_version, song_path, song_name,
                  beat_duration_mls, difficulty_settings):
         self._hit_objects = hit_objects
@@ -51,40 +79,93 @@ class Serializer:
         self._slider_multiplier = difficulty_settings['slider_multiplier']
         self._difficulty_name = difficulty_settings['name']
 
-    def write(self, file_name):
-        file_contents = self._file_contents()
-
-        with open(file_name, 'w') as f:
-            f.write(file_contents)
-
-    def _file_contents(self) -> str:
-        file_contents = self._file_header_sections()
-
-        hit_object_lines = []
-
-        for obj in self._hit_objects:
-
-            if obj['type'] in (1, 5):
-                hit_object_lines.append(serialize_hit_circle(obj))
-            elif obj['type'] in (2, 6):
-                hit_object_lines.append(serialize_slider(obj))
-
-        hit_object_lines = '\n'.join(hit_object_lines)
-
-        return '{}\n{}\n'.format(file_contents, hit_object_lines)
+    def default_file_name(self) -> str:
+        return '{} [{}].osu'.format(self._song_name, self._difficulty_name)
+
+    def contents(self) -> str:
+        f = io.StringIO()
+        self._write_text(f)
+
+        return f.getvalue()
+
+    def to_bytes(self) -> bytes:
+        f = io.BytesIO()
+        self.write(f)
+
+        return f.getvalue()
+
+    def write(self, target):
+        """
+        Write the .osu file to `target`, either a file name or an open text
+        or binary stream. Streams are left open
+        """
+        if isinstance(target, (str, bytes, os.PathLike)):
+            with open(target, 'w', encoding='utf-8', newline='\n') as f:
+                self._write_text(f)
+        elif isinstance(target, io.TextIOBase):
+            self._write_text(target)
+        else:
+            f = io.TextIOWrapper(target, encoding='utf-8', newline='\n')
+            try:
+                self._write_text(f)
+                f.flush()
+            finally:
+                f.detach()
+
+    def write_to_zip(self, zip_file, arcname, compress_type=None):
+        """
+        Stream the .osu file into a new entry of an open ZipFile
+        """
+        info = ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.compress_type = zip_file.compression if compress_type is None \
+            else compress_type
+
+        with zip_file.open(info, 'w') as f:
+            self.write(f)
+
+    def _write_text(self, f):
+        with instrumentation.stage('serialization') as stage:
+            f.write(self._file_header_sections())
+            f.write('\n')
+
+            n_lines = 0
+            for line in self._hit_object_lines():
+                f.write(line)
+                f.write('\n')
+                n_lines += 1
+
+            if n_lines == 0:
+                f.write('\n')
+
+            stage.add(n_lines)
+
+    def _hit_object_lines(self):
+        if isinstance(self._hit_objects, hit_objects.HitObjectBatch):
+            return self._hit_objects.iter_lines()
+
+        return _iter_hit_object_lines(self._hit_objects)
 
     def _file_header_sections(self):
-        with open(self._file_header, 'r') as f:
-            return f.read().format(
-                title=self._song_name,
-                version=self._version,
-                song_path=self._song_path,
-                song_name=self._song_name,
-                beat_duration_mls=self._beat_duration_mls,
-                colors=self._colors,
-                hp_drain_rate=self._hp_drain_rate,
-                slider_multiplier=self._slider_multiplier,
-                approach_rate=self._approach_rate,
-                overall_difficulty=self._overall_difficulty,
-                difficulty_name=self._difficulty_name
-            )
+        return load_header_template(self._file_header).format(
+            title=self._song_name,
+            version=self._version,
+            song_path=self._song_path,
+            song_name=self._song_name,
+            beat_duration_mls=self._beat_duration_mls,
+            colors=self._colors,
+            hp_drain_rate=self._hp_drain_rate,
+            slider_multiplier=self._slider_multiplier,
+            approach_rate=self._approach_rate,
+            overall_difficulty=self._overall_difficulty,
+            difficulty_name=self._difficulty_name
+        )
+
+
+def _iter_hit_object_lines(objects):
+    for obj in objects:
+        if isinstance(obj, hit_objects.HitObjectBatch):
+            yield from obj.iter_lines()
+        else:
+            line = serialize_hit_object(obj)
+            if line is not None:
+                yield line
@@ -0,0 +1,410 @@
+"""
+Generate beatmaps over HTTP.
+
+Usage
+-----
+python -m aisu_circles.service --port 8000 --workers 4
+python -m aisu_circles.service --unix-socket /tmp/aisu.sock
+
+POST /osz with a JSON body:
+
+{
+    "song_name": "Song",
+    "song_file_name": "song.mp3",
+    "bpm": 120,
+    "hit_events": {"medium": [0, 1, 0, ...], "hard": [0, 1, 0, ...]},
+    "seed": 7,
+    "audio": "<base64 encoded audio>"
+}
+
+generates every difficulty over a process pool and streams the .osz
+archive back with chunked transfer encoding. `seed` and `audio` are
+optional. Identical seeded requests arriving while one is being generated
+share its result; requests without a seed are always generated on their
+own, since each should get a different map. Once --max-pending
+generations are queued or running, new requests are answered with 503
+until one finishes.
+
+GET /health returns the request counters and the number of pending
+generations as JSON.
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import math
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+
+from . import area_map, utils
+
+DEFAULT_MAX_PENDING = 64
+DEFAULT_MAX_BODY_BYTES = 64 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+MAX_HEADER_LINES = 100
+
+OSZ_CONTENT_TYPE = 'application/x-osu-beatmap-archive'
+
+
+class RequestError(Exception):
+    def __init__(self, status: HTTPStatus, message=None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+def parse_job(body: bytes) -> dict:
+    """
+    Returns
+    -------
+    Validated generation request decoded from a JSON request body
+    """
+    try:
+        job = json.loads(body.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError):
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'body is not valid JSON')
+
+    if not isinstance(job, dict):
+        raise RequestError(HTTPStatus.BAD_REQUEST, 'body must be an object')
+
+    missing = [k for k in ('song_name', 'song_file_name', 'bpm',
+                           'hit_events') if k not in job]
+    if missing:
+        raise RequestError(HTTPStatus.BAD_REQUEST,
+                           'missing fields: {}'.format(', '.join(missing)))
+
+    for field in ('song_name', 'song_file_name'):
+        if not isinstance(job[field], str):
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                               '{} must be a string'.format(field))
+
+    # utils.bpm_to_beat_duration_mls truncates the bpm to an int
+    bpm = job['bpm']
+    if not _is_number(bpm) or not math.isfinite(bpm) or bpm < 1:
+        raise RequestError(HTTPStatus.BAD_REQUEST,
+                           'bpm must be a number of at least 1')
+
+    seed = job.get('seed')
+    if seed is not None and (not isinstance(seed, int) or
+                             isinstance(seed, bool)):
+        raise RequestError(HTTPStatus.BAD_REQUEST,
+                           'seed must be an integer or null')
+
+    hit_events = job['hit_events']
+    if not isinstance(hit_events, dict) or \
+            set(hit_events) != set(utils.DIFFICULTIES):
+        raise RequestError(
+            HTTPStatus.BAD_REQUEST,
+            'hit_events must hold exactly the difficulties {}'.format(
+                ', '.join(sorted(utils.DIFFICULTIES))))
+
+    for difficulty, events in hit_events.items():
+        try:
+            array = np.asarray(events) if isinstance(events, list) else None
+        except ValueError:  # ragged nested lists
+            array = None
+
+        if array is None or array.ndim != 1 or \
+                not np.isin(array, (0, 1)).all():
+            raise RequestError(
+                HTTPStatus.BAD_REQUEST,
+                'hit_events[\'{}\'] must be a list of 0s and 1s'.format(
+                    difficulty))
+
+    if job.get('audio') is not None:
+        try:
+            base64.b64decode(job['audio'], validate=True)
+        except (TypeError, binascii.Error):
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                               'audio must be base64 encoded')
+
+    return job
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def job_key(job: dict) -> str:
+    """
+    Returns
+    -------
+    Key shared by requests that would generate the same archive
+    """
+    canonical = json.dumps(job, sort_keys=True, separators=(',', ':'))
+
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def prepare_job(body: bytes) -> tuple:
+    """
+    Returns
+    -------
+    (job, key) of `parse_job` and `job_key`, with a key of None for jobs
+    without a seed, which are never shared. Decoding and hashing a large
+    body takes a while, so the service runs this off the event loop
+    """
+    job = parse_job(body)
+
+    return job, None if job.get('seed') is None else job_key(job)
+
+
+def generate_osz(job: dict) -> bytes:
+    """
+    Build the .osz archive for a request. Runs in a worker process
+    """
+    hit_event_set = {difficulty: np.asarray(events, dtype=np.int64)
+                     for difficulty, events in job['hit_events'].items()}
+    audio = job.get('audio')
+
+    return utils.build_osz_file(
+        hit_event_set,
+        job['bpm'],
+        job['song_name'],
+        job['song_file_name'],
+        audio=None if audio is None else base64.b64decode(audio),
+        random_seed=job.get('seed')
+    )
+
+
+class BeatmapService:
+    """
+    HTTP front end for `generate_osz`. Connections are handled on the event
+    loop, request bodies are decoded on the loop's default executor and
+    generation runs on `executor`
+    """
+
+    def __init__(self, executor, max_pending=DEFAULT_MAX_PENDING,
+                 max_body_bytes=DEFAULT_MAX_BODY_BYTES, loop=None):
+        self._executor = executor
+        self._max_pending = max_pending
+        self._max_body_bytes = max_body_bytes
+        self._loop = loop
+        self._pending = {}
+        self.stats = dict.fromkeys(
+            ('requests', 'coalesced', 'rejected', 'completed', 'failed'), 0)
+
+    @property
+    def n_pending(self) -> int:
+        return len(self._pending)
+
+    async def generate(self, job: dict, key=None) -> bytes:
+        """
+        Returns the archive for `job`. A seeded job joins an identical
+        generation that is already pending instead of starting a new one
+
+        Params
+        ------
+        key: `job_key(job)` if already computed
+        """
+        if job.get('seed') is None:
+            # unseeded jobs are never shared, so any unique key will do
+            key = object()
+        elif key is None:
+            key = job_key(job)
+
+        future = self._pending.get(key)
+
+        if future is not None:
+            self.stats['coalesced'] += 1
+        elif len(self._pending) >= self._max_pending:
+            self.stats['rejected'] += 1
+            raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE,
+                               'too many pending generations')
+        else:
+            future = self._get_loop().run_in_executor(self._executor,
+                                                      generate_osz, job)
+            self._pending[key] = future
+            future.add_done_callback(
+                lambda f: self._pending.pop(key, None))
+
+        # a client disconnecting must not cancel the shared generation
+        return await asyncio.shield(future)
+
+    def _get_loop(self):
+        return self._loop or _running_loop()
+
+    async def handle(self, reader, writer):
+        try:
+            await self._respond(reader, writer)
+        except RequestError as e:
+            await self._send(writer, e.status,
+                             json.dumps({'error': str(e)}).encode('utf-8'),
+                             'application/json')
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, reader, writer):
+        method, path, headers = await self._read_head(reader)
+
+        if path == '/health':
+            if method != 'GET':
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED)
+            body = dict(self.stats, pending=self.n_pending)
+            await self._send(writer, HTTPStatus.OK,
+                             json.dumps(body).encode('utf-8'),
+                             'application/json')
+            return
+
+        if path != '/osz':
+            raise RequestError(HTTPStatus.NOT_FOUND)
+        if method != 'POST':
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+        self.stats['requests'] += 1
+        try:
+            length = int(headers.get('content-length', ''))
+        except ValueError:
+            raise RequestError(HTTPStatus.LENGTH_REQUIRED)
+        if length < 0:
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                               'negative content-length')
+        if length > self._max_body_bytes:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+        body = await reader.readexactly(length)
+        job, key = await self._get_loop().run_in_executor(None, prepare_job,
+                                                          body)
+
+        try:
+            osz = await self.generate(job, key)
+        except RequestError:
+            raise
+        except Exception as e:
+            self.stats['failed'] += 1
+            raise RequestError(HTTPStatus.INTERNAL_SERVER_ERROR,
+                               'generation failed: {!r}'.format(e))
+
+        await self._stream(writer, osz, OSZ_CONTENT_TYPE)
+        self.stats['completed'] += 1
+
+    async def _read_head(self, reader) -> tuple:
+        try:
+            request_line = (await reader.readline()).decode('latin-1')
+            method, path, _ = request_line.split()
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'malformed request')
+
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                return method, path.split('?', 1)[0], headers
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        raise RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+
+    async def _send(self, writer, status, body, content_type):
+        writer.write(_head(status, content_type,
+                           [('Content-Length', str(len(body)))]))
+        writer.write(body)
+        await writer.drain()
+
+    async def _stream(self, writer, data, content_type):
+        """
+        Send `data` with chunked transfer encoding, waiting for the client
+        to drain each chunk so slow readers do not buffer whole archives
+        """
+        writer.write(_head(HTTPStatus.OK, content_type,
+                           [('Transfer-Encoding', 'chunked')]))
+        view = memoryview(data)
+
+        for start in range(0, len(view), CHUNK_SIZE):
+            chunk = view[start:start + CHUNK_SIZE]
+            writer.write('{:x}\r\n'.format(len(chunk)).encode('ascii'))
+            writer.write(chunk)
+            writer.write(b'\r\n')
+            await writer.drain()
+
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+
+def _running_loop():
+    # asyncio.get_running_loop is new in Python 3.7. Inside a coroutine
+    # get_event_loop returns the running loop on older versions
+    get_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+    return get_loop()
+
+
+def _head(status: HTTPStatus, content_type, headers) -> bytes:
+    lines = ['HTTP/1.1 {} {}'.format(status.value, status.phrase),
+             'Content-Type: {}'.format(content_type),
+             'Connection: close']
+    if status == HTTPStatus.SERVICE_UNAVAILABLE:
+        lines.append('Retry-After: 1')
+    lines.extend('{}: {}'.format(name, value) for name, value in headers)
+
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def serve(host='127.0.0.1', port=8000, unix_socket=None, max_workers=None,
+          max_pending=DEFAULT_MAX_PENDING,
+          max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+    """
+    Run the service until interrupted
+    """
+    # load once in the parent so forked workers share the parsed map
+    area_map.load()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=area_map.load) as executor:
+        service = BeatmapService(executor, max_pending, max_body_bytes,
+                                 loop=loop)
+
+        if unix_socket is not None:
+            server = loop.run_until_complete(
+                asyncio.start_unix_server(service.handle, unix_socket))
+        else:
+            server = loop.run_until_complete(
+                asyncio.start_server(service.handle, host, port))
+
+        for sock in server.sockets:
+            print('Serving on {}'.format(sock.getsockname()),
+                  file=sys.stderr)
+
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve beatmap generation over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix-socket', default=None,
+                        help='listen on this unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: cpu count)')
+    parser.add_argument('--max-pending', type=int,
+                        default=DEFAULT_MAX_PENDING,
+                        help='generations queued or running before new '
+                             'requests are rejected with 503')
+    parser.add_argument('--max-body-bytes', type=int,
+                        default=DEFAULT_MAX_BODY_BYTES)
+    args = parser.parse_args(argv)
+
+    serve(args.host, args.port, args.unix_socket, args.workers,
+          args.max_pending, args.max_body_bytes)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import unittest
+
+from aisu_circles import area_map
+
+
+class AreaMapTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self._dir.name, 'map.json')
+        self.cache_file_name = os.path.join(self._dir.name, 'map.pickle')
+        area_map.clear()
+
+    def tearDown(self):
+        area_map.clear()
+        self._dir.cleanup()
+
+    def _write(self, path_map, mtime_ns=None):
+        with open(self.file_name, 'w') as f:
+            json.dump(path_map, f)
+        if mtime_ns is not None:
+            os.utime(self.file_name, ns=(mtime_ns, mtime_ns))
+
+    def _load(self):
+        area_map.clear()
+        return area_map.load(self.file_name, self.cache_file_name)
+
+    def test_frozen_path_map(self):
+        self._write({'0_1': [2, 3], '1_2': [3]})
+        path_map = self._load()
+
+        self.assertEqual((2, 3), path_map['0_1'])
+        self.assertEqual(2, len(path_map))
+        self.assertIs(path_map, area_map.load(self.file_name,
+                                              self.cache_file_name))
+        self.assertEqual(1, path_map.transitions.counts[0, 1, 2])
+        with self.assertRaises(TypeError):
+            path_map['0_1'] = [4]
+
+    def test_cache_written_and_used(self):
+        self._write({'0_1': [2, 3]})
+        first = self._load()
+        self.assertTrue(os.path.exists(self.cache_file_name))
+
+        second = self._load()
+        self.assertIsNot(first, second)
+        self.assertEqual(dict(first), dict(second))
+        self.assertEqual(first.digest, second.digest)
+
+    def test_edit_keeping_mtime_and_size(self):
+        self._write({'0_1': [2, 3]}, mtime_ns=10 ** 18)
+        self.assertEqual((2, 3), self._load()['0_1'])
+
+        self._write({'0_1': [4, 3]}, mtime_ns=10 ** 18)
+        path_map = self._load()
+
+        self.assertEqual((4, 3), path_map['0_1'])
+        self.assertEqual(1, path_map.transitions.counts[0, 1, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
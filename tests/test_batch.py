@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from aisu_circles import batch
+
+
+def _crash(*args):
+    os._exit(1)
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.manifest = [{
+            'song_name': 'Song',
+            'song_file_name': 'song.mp3',
+            'osu_file_name': 'song [{}].osu',
+            'bpm': 120,
+            'hit_events': {'medium': ([0] * 30 + [1]) * 20,
+                           'hard': 'song_hard.npy'},
+        }, {
+            'song_name': 'Other',
+            'song_file_name': 'other.mp3',
+            'osu_file_name': 'other [{}].osu',
+            'bpm': 180,
+            'hit_events': {'hard': ([0] * 20 + [1]) * 20},
+            'seed': 5
+        }]
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_job_seed(self):
+        seed = batch.job_seed(0, 'Song', 'hard')
+
+        self.assertEqual(seed, batch.job_seed(0, 'Song', 'hard'))
+        self.assertNotEqual(seed, batch.job_seed(1, 'Song', 'hard'))
+        self.assertNotEqual(seed, batch.job_seed(0, 'Other', 'hard'))
+        self.assertNotEqual(seed, batch.job_seed(0, 'Song', 'medium'))
+        self.assertTrue(0 <= seed < 2 ** 64)
+
+    def test_jobs_from_manifest(self):
+        jobs = batch.jobs_from_manifest(self.manifest, base_seed=3,
+                                        base_dir='maps')
+
+        self.assertEqual([('Song', 'hard'), ('Song', 'medium'),
+                          ('Other', 'hard')],
+                         [(j.song_name, j.difficulty) for j in jobs])
+        self.assertEqual(os.path.join('maps', 'song_hard.npy'),
+                         jobs[0].hit_events)
+        self.assertEqual(os.path.join('maps', 'song [{}].osu'),
+                         jobs[0].osu_file_name)
+        self.assertEqual(batch.job_seed(3, 'Song', 'hard'), jobs[0].seed)
+        self.assertEqual(batch.job_seed(5, 'Other', 'hard'), jobs[2].seed)
+
+    def test_jobs_from_manifest_unknown_difficulty(self):
+        self.manifest[1]['hit_events'] = {'expert': [1]}
+
+        with self.assertRaises(ValueError):
+            batch.jobs_from_manifest(self.manifest)
+
+    def _jobs(self):
+        del self.manifest[0]['hit_events']['hard']
+        return batch.jobs_from_manifest(self.manifest,
+                                        base_dir=self._dir.name)
+
+    def test_run_jobs(self):
+        jobs = self._jobs()
+        progress = []
+
+        results = list(batch.run_jobs(
+            jobs, max_workers=2,
+            progress=lambda n, total, r: progress.append((n, total))))
+
+        self.assertEqual([(1, 2), (2, 2)], progress)
+        self.assertEqual({j.song_name for j in jobs},
+                         {r.job.song_name for r in results})
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertTrue(os.path.exists(result.file_name))
+
+    def test_run_jobs_worker_crash(self):
+        jobs = self._jobs()
+
+        with mock.patch.object(batch, 'run_job', _crash):
+            results = list(batch.run_jobs(jobs, max_workers=1))
+
+        self.assertEqual(len(jobs), len(results))
+        for result in results:
+            self.assertIsNone(result.file_name)
+            self.assertIn('worker process died', result.error)
+
+
+if __name__ == '__main__':
+    unittest.main()
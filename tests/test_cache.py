@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from aisu_circles import cache
+
+
+class HitObjectCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.directory = self._dir.name
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _put(self, c, key, mtime):
+        c.put(key, b'x' * 1000)
+        os.utime(os.path.join(self.directory, key), (mtime, mtime))
+
+    def test_get_put(self):
+        c = cache.HitObjectCache(self.directory)
+        value = [{'x': 1, 'y': 2}]
+
+        self.assertIsNone(c.get('missing'))
+        c.put('key', value)
+        self.assertEqual(value, c.get('key'))
+        self.assertEqual(value,
+                         cache.HitObjectCache(self.directory).get('key'))
+
+        c.clear()
+        self.assertIsNone(c.get('key'))
+
+    def test_evicts_least_recently_used(self):
+        c = cache.HitObjectCache(self.directory, max_bytes=2500)
+        self._put(c, 'a', 1000)
+        self._put(c, 'b', 2000)
+        # reading 'a' makes 'b' the least recently used
+        self.assertIsNotNone(c.get('a'))
+
+        c.put('c', b'x' * 1000)
+
+        self.assertIsNone(c.get('b'))
+        self.assertIsNotNone(c.get('a'))
+        self.assertIsNotNone(c.get('c'))
+
+    def test_replacing_entry_does_not_evict(self):
+        c = cache.HitObjectCache(self.directory, max_bytes=2500)
+        self._put(c, 'a', 1000)
+        self._put(c, 'b', 2000)
+
+        for _ in range(5):
+            c.put('b', b'x' * 1000)
+
+        self.assertIsNotNone(c.get('a'))
+        self.assertIsNotNone(c.get('b'))
+
+    def test_put_scans_directory_once(self):
+        c = cache.HitObjectCache(self.directory)
+
+        with mock.patch.object(cache.os, 'scandir',
+                               wraps=cache.os.scandir) as scandir:
+            for i in range(10):
+                c.put(str(i), i)
+
+        self.assertEqual(1, scandir.call_count)
+
+
+class KeyTest(unittest.TestCase):
+    def _key(self, **kwargs):
+        args = dict(hit_events=[0, 1, 0, 1], beat_duration_mls=500,
+                    slider_multiplier=1.4, seed=7, path_map_digest='abc')
+        args.update(kwargs)
+
+        return cache.hit_objects_key(**args)
+
+    def test_hit_objects_key(self):
+        key = self._key()
+
+        self.assertEqual(key, self._key())
+        self.assertEqual(key, self._key(hit_events=(0, 1, 0, 1)))
+        self.assertNotEqual(key, self._key(seed=8))
+        self.assertNotEqual(key, self._key(beat_duration_mls=400))
+        self.assertNotEqual(key, self._key(hit_events=[0, 1, 1, 1]))
+        self.assertNotEqual(key, self._key(slider_multiplier=1.8))
+        self.assertNotEqual(key, self._key(path_map_digest='abd'))
+        self.assertNotEqual(key, self._key(model_version='other'))
+
+    def test_hit_objects_key_rejects_other_values(self):
+        for hit_events in ([0, 2], [0, -1], [0.5], [256]):
+            with self.assertRaises(ValueError):
+                self._key(hit_events=hit_events)
+
+    def test_osu_file_key(self):
+        difficulty = {'name': 'Hard', 'slider_multiplier': 1.8}
+        args = (self._key(), 'v1', 'song.mp3', 'Song', 500, difficulty)
+        key = cache.osu_file_key(*args)
+
+        self.assertEqual(key, cache.osu_file_key(*args))
+        self.assertNotEqual(key, cache.osu_file_key(self._key(seed=8),
+                                                    *args[1:]))
+        self.assertNotEqual(key, cache.osu_file_key(*args[:3], 'Other',
+                                                    *args[4:]))
+        self.assertNotEqual(key, cache.osu_file_key(
+            *args[:5], dict(difficulty, name='Medium')))
+
+
+if __name__ == '__main__':
+    unittest.main()
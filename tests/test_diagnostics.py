@@ -0,0 +1,33 @@
+import unittest
+import diagnostics
+import markov
+
+
+class DiagnosticsTest(unittest.TestCase):
+    def tearDown(self):
+        diagnostics.set_mode(diagnostics.REPAIR)
+        diagnostics.reset_counters()
+
+    def test_strict_raises(self):
+        with diagnostics.run(diagnostics.STRICT):
+            with self.assertRaises(diagnostics.InvalidAreaError):
+                markov.random_position_in_square(-1, seed=0)
+
+    def test_repair_counts(self):
+        with diagnostics.run(diagnostics.REPAIR) as counters:
+            x, y = markov.random_position_in_square(10, seed=0)
+            markov.random_position_in_square(-1, seed=0)
+
+        self.assertGreaterEqual(x, 0)
+        self.assertGreaterEqual(y, 0)
+        self.assertEqual(counters['random_position_in_square'], 2)
+
+    def test_run_restores_mode(self):
+        with diagnostics.run(diagnostics.STRICT):
+            self.assertEqual(diagnostics.get_mode(), diagnostics.STRICT)
+
+        self.assertEqual(diagnostics.get_mode(), diagnostics.REPAIR)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            diagnostics.set_mode('lenient')
@@ -0,0 +1,34 @@
+import unittest
+
+from aisu_circles import grid, markov
+
+
+class GridTest(unittest.TestCase):
+    def test_default_grid(self):
+        g = grid.Grid()
+
+        self.assertEqual(10, g.n_areas)
+        self.assertEqual((128, 240), g.cell_shape)
+        self.assertEqual((1, 2), g.neighbour_columns[0])
+        self.assertEqual((0, 1, 3, 4), g.neighbour_columns[2])
+        self.assertEqual(((408, 446), (192, 336)), g.position_ranges[9])
+        self.assertEqual([-64, -48, 64, 192], g.area_bounds[0].tolist())
+
+    def test_area_numbers(self):
+        g = grid.Grid()
+        positions = [(0, 0), (511, 383), (64, 64), (63, 64), (-1, -1),
+                     (-100, 0), (511, 600)]
+
+        expected = [0, 9, 1, 0, -1, 0, -1]
+
+        self.assertEqual(expected, g.area_numbers(positions).tolist())
+        self.assertEqual(expected, markov.positions_to_areas(positions))
+
+    def test_custom_grid(self):
+        g = grid.Grid(width_squares=8, height_squares=4)
+
+        self.assertEqual(32, g.n_areas)
+        self.assertEqual(4, len(g.neighbour_columns[4]))
+        self.assertEqual(31, g.area_number(511, 383))
+        self.assertEqual([0, 31], g.area_numbers([(-64, -48),
+                                                  (511, 383)]).tolist())
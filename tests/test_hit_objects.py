@@ -0,0 +1,46 @@
+import unittest
+
+from aisu_circles import hit_objects
+
+
+class HitObjectBatchTest(unittest.TestCase):
+    def setUp(self):
+        builder = hit_objects.HitObjectBuilder()
+        builder.add_circle(10.7, 20.2, 1000.9, 5)
+        builder.add_slider(30, 40, 1500, 2, [(31.5, 41.5), (50, 60)], 120.8)
+        builder.add_circle(70, 80, 2000)
+        self.batch = builder.build()
+
+    def test_builder(self):
+        self.assertEqual(3, len(self.batch))
+        self.assertEqual([10, 30, 70], self.batch.x.tolist())
+        self.assertEqual([1000, 1500, 2000], self.batch.time.tolist())
+        self.assertEqual([False, True, False], self.batch.is_slider.tolist())
+        self.assertEqual([0, 0, 2, 2], self.batch.curve_offsets.tolist())
+
+    def test_to_lines(self):
+        expected = [
+            '10,20,1000,5,0,0:0:0:0:',
+            '30,40,1500,2,0,P|31:41|50:60,1,120,0|0,0:0|0:0,0:0:0:0:',
+            '70,80,2000,1,0,0:0:0:0:'
+        ]
+
+        self.assertEqual(expected, self.batch.to_lines())
+
+        lines = self.batch.iter_lines()
+        self.assertEqual(expected[0], next(lines))
+        self.assertEqual(expected[1:], list(lines))
+
+    def test_dicts_round_trip(self):
+        dicts = self.batch.to_dicts()
+
+        self.assertEqual('31:41|50:60', dicts[1]['curve_points'])
+        self.assertEqual(self.batch,
+                         hit_objects.HitObjectBatch.from_dicts(dicts))
+
+    def test_concatenate(self):
+        batch = hit_objects.HitObjectBatch.concatenate(
+            [self.batch, self.batch])
+
+        self.assertEqual(6, len(batch))
+        self.assertEqual(self.batch.to_lines() * 2, batch.to_lines())
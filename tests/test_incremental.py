@@ -0,0 +1,79 @@
+import random
+import unittest
+
+import numpy as np
+
+from aisu_circles import area_map, incremental
+
+
+def song_hit_events(n_frames=3000, seed=0):
+    r = random.Random(seed)
+
+    return np.array([int(r.random() < 0.06) for _ in range(n_frames)])
+
+
+def incremental_predictor(hit_events):
+    return incremental.IncrementalPredictor(area_map.load(), hit_events, 500,
+                                            1.4, random_seed=5)
+
+
+class IncrementalPredictorTest(unittest.TestCase):
+    def setUp(self):
+        self.hit_events = song_hit_events()
+        self.predictor = incremental_predictor(self.hit_events)
+        self.first = self.predictor.predict_batch()
+        self.n_sections = len(self.predictor._get_section_start_stops())
+
+    def assert_matches_fresh(self, hit_events):
+        updated = self.predictor.update(hit_events)
+        fresh = incremental_predictor(hit_events.copy()).predict_batch()
+
+        self.assertEqual(fresh, updated)
+
+    def test_first_run_generates_every_section(self):
+        self.assertEqual(self.n_sections, self.predictor.n_regenerated)
+
+    def test_replace_unchanged(self):
+        self.assert_matches_fresh(self.hit_events.copy())
+        self.assertEqual(0, self.predictor.n_regenerated)
+
+    def test_flip_in_last_section(self):
+        hit_events = self.hit_events.copy()
+        start, stop = self.predictor._get_section_start_stops()[-1]
+        # a hit between two existing ones keeps the section boundaries
+        hits = np.flatnonzero(hit_events[start:stop]) + start
+        frame = next(i for i in range(hits[0] + 1, hits[-1])
+                     if hit_events[i] == 0)
+        hit_events[frame] = 1
+
+        self.assert_matches_fresh(hit_events)
+        self.assertEqual(1, self.predictor.n_regenerated)
+
+    def test_flip_events(self):
+        hit_events = self.hit_events.copy()
+        hit_events[[400, 1500, 1501]] ^= 1
+
+        self.assert_matches_fresh(hit_events)
+        self.assertLess(self.predictor.n_regenerated, self.n_sections)
+
+    def test_combos_follow_frames(self):
+        """
+        Removing a section early in the song leaves the combos of the
+        later sections where they were
+        """
+        records = self.predictor._records
+        hit_events = self.hit_events.copy()
+        start, stop = records[1].state.start, records[1].state.stop
+        hit_events[start:stop] = 0
+
+        self.assert_matches_fresh(hit_events)
+        new_records = self.predictor._records
+
+        self.assertEqual(len(records) - 1, len(new_records))
+        self.assertListEqual(
+            [r.state.new_combo for r in records[-10:]],
+            [r.state.new_combo for r in new_records[-10:]])
+
+
+if __name__ == '__main__':
+    unittest.main()
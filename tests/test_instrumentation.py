@@ -0,0 +1,75 @@
+import json
+import time
+import unittest
+
+from aisu_circles import instrumentation
+
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.recorder = instrumentation.Recorder()
+        self.recorder.enabled = True
+
+    def test_disabled_stage_records_nothing(self):
+        self.recorder.enabled = False
+
+        with self.recorder.stage('a') as stage:
+            stage.add(3)
+        self.recorder.count('b')
+
+        self.assertDictEqual({}, self.recorder.snapshot())
+
+    def test_nested_stages_are_exclusive(self):
+        with self.recorder.stage('outer'):
+            with self.recorder.stage('inner') as stage:
+                time.sleep(0.05)
+                stage.add(2)
+
+        snapshot = self.recorder.snapshot()
+
+        self.assertGreaterEqual(snapshot['inner']['seconds'], 0.05)
+        self.assertLess(snapshot['outer']['seconds'], 0.02)
+        self.assertEqual(2, snapshot['inner']['objects'])
+        self.assertEqual(1, snapshot['outer']['calls'])
+
+    def test_to_json(self):
+        self.recorder.record('sections', 1.5, 10)
+        self.recorder.record('sections', 0.5, 5)
+        self.recorder.count('cache_hits', 3)
+
+        self.assertDictEqual({
+            'sections': {'calls': 2, 'seconds': 2.0, 'objects': 15},
+            'cache_hits': {'objects': 3}
+        }, json.loads(self.recorder.to_json()))
+
+    def test_to_prometheus(self):
+        self.recorder.record('sections', 1.5, 10)
+        self.recorder.count('cache_hits', 3)
+
+        self.assertEqual(
+            '# TYPE aisu_stage_calls_total counter\n'
+            'aisu_stage_calls_total{stage="sections"} 1\n'
+            '# TYPE aisu_stage_seconds_total counter\n'
+            'aisu_stage_seconds_total{stage="sections"} 1.5\n'
+            '# TYPE aisu_stage_objects_total counter\n'
+            'aisu_stage_objects_total{stage="cache_hits"} 3\n'
+            'aisu_stage_objects_total{stage="sections"} 10\n',
+            self.recorder.to_prometheus())
+
+    def test_merge(self):
+        other = instrumentation.Recorder()
+        other.enabled = True
+        other.record('sections', 1.0, 4)
+        other.count('cache_hits')
+        self.recorder.record('sections', 0.5, 1)
+
+        self.recorder.merge(other.snapshot())
+
+        self.assertDictEqual({
+            'sections': {'calls': 2, 'seconds': 1.5, 'objects': 5},
+            'cache_hits': {'objects': 1}
+        }, self.recorder.snapshot())
+
+
+if __name__ == '__main__':
+    unittest.main()
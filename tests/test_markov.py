@@ -73,9 +73,103 @@ class MarkovTest(unittest.TestCase):
         self.assertListEqual(markov.interval_positions(positions1), expected1)
         self.assertListEqual(markov.interval_positions(positions2), expected2)
 
+    def test_nearest_interval_hits(self):
+        f = markov.interval_frames
+        l = markov.leniency_frames
+        hit_frames = [f - 3, f + 3, 2 * f + l - 1, 3 * f + l, 4 * f - l]
+
+        expected = [-1, f - 3, 2 * f + l - 1, -1, 4 * f - l]
+
+        self.assertListEqual(
+            markov.nearest_interval_hits(hit_frames, 5 * f).tolist(),
+            expected)
+        self.assertListEqual(
+            markov.nearest_interval_hits([], 5 * f).tolist(), [-1] * 5)
+
     def test_positions_to_areas(self):
         positions1 = [(0, 0), (511, 383), (127, 127), (127, 128), (128, 128)]
 
         expected1 = [0, 11, 0, 4, 5]
 
         self.assertListEqual(markov.positions_to_areas(positions1), expected1)
+
+    def test_transition_table_excludes_previous_area(self):
+        path_map = {'0_1': [1, 1, 1, 2], '1_2': [2, 3]}
+        table = markov.TransitionTable.from_path_map(path_map)
+        r = markov.random.Random(0)
+
+        samples1 = {table.sample(0, 1, r) for _ in range(50)}
+        samples2 = {table.sample(1, 2, r) for _ in range(50)}
+
+        self.assertSetEqual(samples1, {2})
+        self.assertSetEqual(samples2, {3})
+        self.assertEqual(table.counts[0, 1, 1], 3)
+
+    def test_transition_table_fallback(self):
+        path_map = {'0_1': [1, 2], '1_2': [2, 3], '-1_2': [4]}
+        table = markov.TransitionTable.from_path_map(path_map)
+        r = markov.random.Random(0)
+
+        samples1 = {table.sample(5, 2, r) for _ in range(100)}
+        samples2 = {table.sample(5, -1, r) for _ in range(100)}
+
+        self.assertSetEqual(samples1, {3})
+        self.assertSetEqual(samples2, {2, 3})
+
+    def test_area_model_matches_transition_table(self):
+        path_map = {'0_1': [1, 2, 2, 3], '1_2': [2, 3, 4], '2_3': [0]}
+        table = markov.TransitionTable.from_path_map(path_map)
+        model = markov.AreaModel.from_path_map(path_map)
+        r1 = markov.random.Random(0)
+        r2 = markov.random.Random(0)
+
+        for key in path_map:
+            area1, area2 = map(int, key.split('_'))
+            samples1 = [table.sample(area1, area2, r1) for _ in range(50)]
+            samples2 = [model.sample_path([area1, area2], r2)
+                        for _ in range(50)]
+            self.assertListEqual(samples1, samples2)
+
+    def test_area_model_back_off(self):
+        sequences = [[0, 1, 2, 3], [5, 1, 2, 4], [7, 8, -1, 9, 6]]
+        model = markov.AreaModel.from_sequences(sequences, 3)
+        r = markov.random.Random(0)
+
+        samples1 = {model.sample_path([0, 1, 2], r) for _ in range(50)}
+        samples2 = {model.sample_path([6, 1, 2], r) for _ in range(50)}
+        samples3 = {model.sample_path([7, 8], r) for _ in range(200)}
+        samples4 = {model.sample_path([8, -1], r) for _ in range(200)}
+
+        self.assertEqual(model.order, 3)
+        self.assertSetEqual(samples1, {3})
+        self.assertSetEqual(samples2, {3, 4})
+        # 8 is only followed by a gap: back off to the unigram counts,
+        # excluding the previous area
+        self.assertSetEqual(samples3, {1, 2, 3, 4, 6})
+        self.assertSetEqual(samples4, {1, 2, 3, 4, 6, 8})
+
+    def test_area_model_save_load(self):
+        import os
+        import tempfile
+
+        model = markov.AreaModel.from_sequences([[0, 1, 2, 3, 1, 2, 4]], 2)
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'model.npz')
+            model.save(file_name)
+            loaded = markov.AreaModel.load(file_name)
+
+        self.assertEqual(loaded.order, model.order)
+        self.assertEqual(loaded.digest, model.digest)
+        self.assertEqual(loaded.n_contexts, model.n_contexts)
+
+    def test_shared_rng(self):
+        r1 = markov.random.Random(3)
+        r2 = markov.random.Random(3)
+
+        areas1 = [markov.random_area(4, rng=r1) for _ in range(10)]
+        areas2 = [markov.random_area(4, rng=r2) for _ in range(10)]
+        position1 = markov.random_position_in_square(2, rng=r1)
+        position2 = markov.random_position_in_square(2, rng=r2)
+
+        self.assertListEqual(areas1, areas2)
+        self.assertTupleEqual(position1, position2)
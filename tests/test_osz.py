@@ -0,0 +1,85 @@
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+from aisu_circles import hit_objects, osz, serialize
+
+DIFFICULTY = {
+    'slider_multiplier': 1.8,
+    'overall_difficulty': 7,
+    'approach_rate': 8,
+    'hp_drain_rate': 7,
+    'name': 'Hard'
+}
+
+
+class OszTest(unittest.TestCase):
+    def setUp(self):
+        builder = hit_objects.HitObjectBuilder()
+        builder.add_circle(10, 20, 1000)
+        self.serializer = serialize.Serializer(
+            builder.build(), 'v1', 'song.mp3', 'Song', 500, DIFFICULTY)
+        self._dir = tempfile.TemporaryDirectory()
+        self.directory = self._dir.name
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_round_trip(self):
+        audio_file = os.path.join(self.directory, 'song.mp3')
+        with open(audio_file, 'wb') as f:
+            f.write(b'ID3' + bytes(100))
+
+        with osz.OszWriter() as writer:
+            writer.add_beatmap(self.serializer)
+            writer.add_file('song.mp3', audio_file)
+            writer.add_file('bg.JPG', b'\xff\xd8' + bytes(100))
+            writer.add_file('notes.txt', io.BytesIO(b'notes ' * 20))
+            data = writer.close()
+
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            compress_types = {info.filename: info.compress_type
+                              for info in archive.infolist()}
+            self.assertEqual(self.serializer.to_bytes(),
+                             archive.read('Song [Hard].osu'))
+            self.assertEqual(b'notes ' * 20, archive.read('notes.txt'))
+
+        self.assertDictEqual({
+            'Song [Hard].osu': zipfile.ZIP_DEFLATED,
+            'song.mp3': zipfile.ZIP_STORED,
+            'bg.JPG': zipfile.ZIP_STORED,
+            'notes.txt': zipfile.ZIP_DEFLATED
+        }, compress_types)
+
+    def test_build_osz_to_file(self):
+        target = os.path.join(self.directory, 'song.osz')
+
+        osz.build_osz([self.serializer], target=target, audio=b'audio',
+                      audio_name='song.mp3')
+
+        with zipfile.ZipFile(target) as archive:
+            self.assertEqual(['Song [Hard].osu', 'song.mp3'],
+                             archive.namelist())
+        self.assertEqual(['song.osz'], os.listdir(self.directory))
+
+    def test_audio_name_required(self):
+        with self.assertRaises(ValueError):
+            osz.build_osz([self.serializer], audio=b'audio')
+        with self.assertRaises(ValueError):
+            osz.build_osz([self.serializer], audio=io.BytesIO(b'audio'))
+
+    def test_failure_leaves_no_archive(self):
+        target = os.path.join(self.directory, 'song.osz')
+        missing = os.path.join(self.directory, 'missing.png')
+
+        with self.assertRaises(OSError):
+            osz.build_osz([self.serializer], target=target,
+                          assets={'bg.png': missing})
+
+        self.assertEqual([], os.listdir(self.directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
 import unittest
 import math
+
+import numpy as np
+
 import position
 
 
@@ -93,38 +96,6 @@ class PositionTest(unittest.TestCase):
         self.assertTrue(position.is_between(*pts1))
         self.assertTrue(position.is_between(*pts2))
 
-    def test_get_quadrant(self):
-        """
-        NOTE: Y-axis is INVERTED
-        """
-        origin = (0, 0)
-        pt1 = (1, 0)
-        pt2 = ((2 ** 0.5) / 2, (2 ** 0.5) / -2)
-        pt3 = (0, -1)
-        pt4 = ((2 ** 0.5) / -2, (2 ** 0.5) / -2)
-        pt5 = (-1, 0)
-        pt6 = ((2 ** 0.5) / -2, (2 ** 0.5) / 2)
-        pt7 = (0, 1)
-        pt8 = ((2 ** 0.5) / 2, (2 ** 0.5) / 2)
-
-        expected1 = 0
-        expected2 = 0
-        expected3 = 1
-        expected4 = 1
-        expected5 = 2
-        expected6 = 2
-        expected7 = 3
-        expected8 = 3
-
-        self.assertEqual(expected1, position.get_quadrant(origin, pt1))
-        self.assertEqual(expected2, position.get_quadrant(origin, pt2))
-        self.assertEqual(expected3, position.get_quadrant(origin, pt3))
-        self.assertEqual(expected4, position.get_quadrant(origin, pt4))
-        self.assertEqual(expected5, position.get_quadrant(origin, pt5))
-        self.assertEqual(expected6, position.get_quadrant(origin, pt6))
-        self.assertEqual(expected7, position.get_quadrant(origin, pt7))
-        self.assertEqual(expected8, position.get_quadrant(origin, pt8))
-
     def test_arc_len(self):
         center = 0, 0
         radius = 1
@@ -153,3 +124,139 @@ class PositionTest(unittest.TestCase):
             position.arc_len(pts3[0], pts3[1], center, radius),
             delta=0.001
         )
+
+    def test_linear_positions(self):
+        start, end = (10, 20), (100, 60)
+
+        # per-element linspace of the original implementation, then the
+        # same points reversed for the repeat
+        forward = [(10, 20), (32.75, 30.25), (55.5, 40.5), (78.25, 50.75)]
+        expected = forward + forward[::-1]
+
+        self.assertListEqual(expected,
+                             position.linear_positions(8, start, end, 2))
+
+    def test_circle_points(self):
+        angles = [0, math.pi / 2, math.pi]
+
+        expected = [position.get_point(256, 192, 128, a) for a in angles]
+        actual = position.circle_points(256, 192, 128, angles)
+
+        for e, a in zip(expected, actual):
+            self.assertAlmostEqual(e[0], a[0], places=7)
+            self.assertAlmostEqual(e[1], a[1], places=7)
+
+    def test_valid_mask(self):
+        pts = position.np.array([(0, 48), (640, 334), (-1, 100), (100, 335)])
+
+        self.assertListEqual(position.valid_mask(pts).tolist(),
+                             [True, True, False, False])
+
+    def test_angles_radians(self):
+        """
+        NOTE: Y-axis is INVERTED
+        """
+        origin = (0, 0)
+        pts = [(90, 0), (0, 90), (-90, 90), (-90, 0), (0, 0)]
+
+        expected = [position.get_angle_radians(origin, pt) for pt in pts]
+        actual = position.angles_radians(origin, pts)
+
+        self.assertEqual(0, position.get_angle_radians(origin, origin))
+        for e, a in zip(expected, actual):
+            self.assertAlmostEqual(e, a, places=10)
+
+    def test_ccw_sweep(self):
+        self.assertAlmostEqual(math.pi / 2, position.ccw_sweep(0, math.pi / 2))
+        self.assertAlmostEqual(3 * math.pi / 2,
+                               position.ccw_sweep(math.pi / 2, 0))
+        self.assertAlmostEqual(2 * math.pi, position.ccw_sweep(1, 1))
+
+    def test_arc_bounds(self):
+        quarter = position.arc_bounds(0, 0, 1, 0, math.pi / 2)
+        half_clockwise = position.arc_bounds(0, 0, 1, math.pi / 2, -math.pi)
+
+        expected_quarter = (0, -1, 1, 0)
+        expected_half_clockwise = (0, -1, 1, 1)
+
+        for e, a in zip(expected_quarter, quarter):
+            self.assertAlmostEqual(e, a, places=7)
+        for e, a in zip(expected_half_clockwise, half_clockwise):
+            self.assertAlmostEqual(e, a, places=7)
+
+    def test_find_valid_path_out_of_bounds(self):
+        start, end = (600, 200), (600, 100)
+        c_x, c_y, radius = position.define_circle(start, (610, 150), end)
+
+        with self.assertRaises(position.InvalidPathException):
+            position.find_valid_path(c_x, c_y, radius, start, end, 85, 1.8)
+
+    def test_polyline_length(self):
+        points = [(0, 0), (3, 4), (3, 10), (3, 10)]
+
+        self.assertEqual(11, position.polyline_length(points))
+        self.assertEqual(0, position.polyline_length(points[:1]))
+
+    def test_linear_path(self):
+        path = position.linear_path(30, (100, 100), (200, 150))
+        expected = np.array(
+            position.linear_positions(30, (100, 100), (200, 150)))
+
+        self.assertTrue(np.array_equal(expected, np.asarray(path)))
+        self.assertTrue(np.array_equal(expected[7], path[7]))
+        self.assertTrue(np.array_equal(expected[[2, -1]], path[[2, -1]]))
+        self.assertTrue(np.array_equal(expected[10:], np.asarray(path[10:])))
+        self.assertEqual(tuple(expected[-1]), path.end_position)
+        self.assertAlmostEqual(position.polyline_length(expected[5:]),
+                               path[5:].length, places=7)
+
+    def test_arc_path(self):
+        start, end = (200, 200), (300, 200)
+        c_x, c_y, radius = position.define_circle(start, (250, 180), end)
+        args = (c_x, c_y, radius, start, end, 85, 1.8)
+
+        path = position.find_valid_arc_path(*args)
+
+        # point by point loop of the original find_valid_path, which moves
+        # counter-clockwise from start here
+        distance = position.arc_len(start, end, (c_x, c_y), radius)
+        step_length = distance * 1.8 / 85
+        expected = np.array([
+            position.next_circle_point(start[0], start[1], c_x, c_y,
+                                       i * step_length / distance)
+            for i in range(85)])
+
+        np.testing.assert_allclose(expected, np.asarray(path), atol=1e-9)
+        np.testing.assert_allclose(expected[40], path[40], atol=1e-9)
+        np.testing.assert_allclose(expected[20:], np.asarray(path[20:]),
+                                   atol=1e-9)
+        np.testing.assert_allclose(expected[-1], path[20:].end_position,
+                                   atol=1e-9)
+        self.assertListEqual(position.find_valid_path(*args),
+                             [tuple(p) for p in np.asarray(path).tolist()])
+        self.assertAlmostEqual(position.polyline_length(expected[20:]),
+                               path[20:].length, places=2)
+
+    def test_arc_center_range(self):
+        """
+        Circles inside the solved range give paths inside the grid and
+        circles outside it do not
+        """
+        start, end = (600, 300), (620, 100)
+
+        for k_min, k_max in ((-4, -0.375), (0.375, 4)):
+            low, high = position.arc_center_range(start, end, 40, 1.4,
+                                                  k_min, k_max)
+            self.assertTrue(k_min <= low < high <= k_max)
+
+            for k in np.linspace(k_min, k_max, 50):
+                path = position.arc_center_path(start, end, 40, 1.4, k)
+                inside = bool(position.valid_mask(np.asarray(path)).all())
+                self.assertEqual(low <= k <= high, inside)
+
+    def test_arc_center_range_infeasible(self):
+        self.assertIsNone(position.arc_center_range(
+            (200, 200), (200, 200), 40, 1.4, 0.375, 4))
+        # starts outside the grid
+        self.assertIsNone(position.arc_center_range(
+            (-10, 200), (100, 200), 40, 1.4, 0.375, 4))
@@ -0,0 +1,84 @@
+import random
+import unittest
+
+import numpy as np
+
+from aisu_circles import area_map, hit_objects, predictor, utils
+
+HIT_FRAMES = (3, 30, 60, 75, 80, 84, 88, 92, 130, 131, 132, 170, 200, 250,
+              262, 268, 274, 280, 300, 301, 360, 399)
+
+
+def hit_events(n_frames=400, hit_frames=HIT_FRAMES):
+    events = [0] * n_frames
+    for i in hit_frames:
+        events[i] = 1
+
+    return events
+
+
+class SegmentationTest(unittest.TestCase):
+    """
+    Expected values are the output of the original frame-by-frame
+    implementation for the same hit events
+    """
+
+    def setUp(self):
+        self.predictor = predictor.SectionPredictor(
+            area_map.load(), hit_events(), 500, 1.4, random_seed=1)
+
+    def test_section_start_stops(self):
+        expected = [(0, 61), (62, 93), (94, 133), (134, 171), (172, 201),
+                    (202, 263), (264, 302), (303, 361), (362, 400)]
+
+        self.assertListEqual(expected,
+                             self.predictor._get_section_start_stops())
+
+    def test_interval_sections(self):
+        expected = [(0, 130), (130, 133), (133, 300), (300, 302),
+                    (302, 400)]
+
+        self.assertListEqual(expected,
+                             self.predictor._get_interval_sections())
+
+
+def chunked(events, size):
+    return [events[i:i + size] for i in range(0, len(events), size)]
+
+
+class StreamTest(unittest.TestCase):
+    CHUNK_SIZES = (1, predictor.SECTION_LOOKAHEAD - 1, 10 ** 6)
+
+    def setUp(self):
+        r = random.Random(0)
+        self.hit_events = np.array([int(r.random() < 0.08)
+                                    for _ in range(3000)])
+
+    def test_stream_matches_predict(self):
+        expected = predictor.SectionPredictor(
+            area_map.load(), self.hit_events, 500, 1.4,
+            random_seed=4).predict()
+
+        for size in self.CHUNK_SIZES:
+            stream = predictor.SectionPredictor(
+                area_map.load(), [], 500, 1.4, random_seed=4).predict_stream(
+                chunked(self.hit_events, size))
+            actual = hit_objects.HitObjectBatch.concatenate(stream)
+
+            self.assertEqual(expected, actual.to_dicts(), size)
+
+    def test_stream_serializer_matches(self):
+        difficulty = utils.get_hard_diff_data()
+        args = (difficulty, 120, 'Song', 'song.mp3', area_map.load())
+        expected = utils.build_serializer(self.hit_events, *args,
+                                          random_seed=4).contents()
+
+        for size in self.CHUNK_SIZES:
+            serializer = utils.build_stream_serializer(
+                chunked(self.hit_events, size), *args, random_seed=4)
+
+            self.assertEqual(expected, serializer.contents(), size)
+
+
+if __name__ == '__main__':
+    unittest.main()
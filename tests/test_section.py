@@ -0,0 +1,82 @@
+import math
+import random
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from aisu_circles import position, section
+
+
+def combo_section(hit_events, rng=None, last_hit_position=(256, 192)):
+    return section.ComboSection(0, 0, last_hit_position, (300, 200),
+                                hit_events, 500, 1.4,
+                                rng=rng or random.Random(0))
+
+
+class SectionTest(unittest.TestCase):
+    def test_random_angle(self):
+        s = combo_section([1, 0, 0, 1])
+
+        angles = [s.random_angle(1, 2) for _ in range(200)]
+
+        self.assertTrue(all(1 <= a < 2 for a in angles))
+
+    def test_random_angle_wraps_around(self):
+        """
+        A range whose end is below its start wraps through 0
+        """
+        s = combo_section([1, 0, 0, 1])
+        start, end = 3 * math.pi / 2, math.pi / 4
+
+        angles = [s.random_angle(start, end) for _ in range(500)]
+
+        self.assertTrue(all(0 <= a < position.TWO_PI for a in angles))
+        self.assertTrue(all(a >= start or a < end for a in angles))
+        self.assertTrue(any(a >= start for a in angles))
+        self.assertTrue(any(a < end for a in angles))
+
+    def test_two_hits_make_slider_or_circles(self):
+        hit_events = [1] + [0] * 20 + [1]
+        n_objects = set()
+
+        for seed in range(20):
+            s = combo_section(hit_events, rng=random.Random(seed))
+            n_objects.add(len(s.get_hit_batch()))
+
+        # one slider or two hit circles
+        self.assertSetEqual({1, 2}, n_objects)
+
+    def test_random_circle_path_single_pass(self):
+        """
+        The valid circles are solved for once per side and one is drawn,
+        without retrying offsets or end positions
+        """
+        rng = random.Random(0)
+        s = combo_section([1, 0, 0, 1], rng=rng)
+        start, end = (600, 300), (620, 100)
+
+        with mock.patch.object(s, 'random_next_stop') as next_stop, \
+                mock.patch.object(position, 'arc_center_range',
+                                  wraps=position.arc_center_range) as solve, \
+                mock.patch.object(rng, 'random', wraps=rng.random) as draw:
+            path = s.random_circle_path(40, start, end)
+
+        next_stop.assert_not_called()
+        self.assertEqual(len(section.CIRCLE_CENTER_RANGES), solve.call_count)
+        self.assertEqual(1, draw.call_count)
+
+        points = np.asarray(path)
+        self.assertEqual((40, 2), points.shape)
+        np.testing.assert_allclose(start, points[0])
+        self.assertTrue(position.valid_mask(points).all())
+
+    def test_random_circle_path_infeasible(self):
+        s = combo_section([1, 0, 0, 1])
+
+        with self.assertRaises(position.NoValidPathError):
+            s.random_circle_path(40, (300, 200), (300, 200))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+from aisu_circles import area_map, hit_objects, serialize, utils
+
+DIFFICULTY = {
+    'slider_multiplier': 1.8,
+    'overall_difficulty': 7,
+    'approach_rate': 8,
+    'hp_drain_rate': 7,
+    'name': 'Hard'
+}
+
+
+class SerializerTest(unittest.TestCase):
+    def setUp(self):
+        builder = hit_objects.HitObjectBuilder()
+        builder.add_circle(10, 20, 1000, 5)
+        builder.add_slider(30, 40, 1500, 2, [(31, 41), (50, 60)], 120)
+        builder.add_circle(70, 80, 2000)
+        self.batch = builder.build()
+        # non-ASCII title, so the encoding matters
+        self.serializer = serialize.Serializer(
+            self.batch, 'v1', 'sóng.mp3', 'Sóng ☆', 500, DIFFICULTY)
+
+    def test_outputs_identical(self):
+        expected = self.serializer.contents().encode('utf-8')
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'song.osu')
+            self.serializer.write(file_name)
+            with open(file_name, 'rb') as f:
+                from_path = f.read()
+
+        text = io.StringIO()
+        self.serializer.write(text)
+        binary = io.BytesIO()
+        self.serializer.write(binary)
+
+        self.assertEqual(expected, from_path)
+        self.assertEqual(expected, text.getvalue().encode('utf-8'))
+        self.assertEqual(expected, binary.getvalue())
+        self.assertEqual(expected, self.serializer.to_bytes())
+        self.assertFalse(binary.closed)
+
+    def test_write_to_zip(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            self.serializer.write_to_zip(archive, 'song.osu')
+
+        with zipfile.ZipFile(buffer) as archive:
+            info = archive.getinfo('song.osu')
+            self.assertEqual(zipfile.ZIP_DEFLATED, info.compress_type)
+            self.assertEqual(self.serializer.to_bytes(),
+                             archive.read('song.osu'))
+
+    def test_hit_object_dicts(self):
+        expected = self.serializer.contents()
+        serializer = serialize.Serializer(
+            self.batch.to_dicts(), 'v1', 'sóng.mp3', 'Sóng ☆', 500,
+            DIFFICULTY)
+
+        self.assertEqual(expected, serializer.contents())
+        self.assertTrue(expected.endswith('10,20,1000,5,0,0:0:0:0:\n'
+                                          '30,40,1500,2,0,P|31:41|50:60,1,'
+                                          '120,0|0,0:0|0:0,0:0:0:0:\n'
+                                          '70,80,2000,1,0,0:0:0:0:\n'))
+
+    def test_build_serializer_keeps_hit_events(self):
+        hit_events = [0, 1, 1, 1, 0] * 40 + [1, 1]
+        original = list(hit_events)
+
+        contents = utils.build_serializer(
+            hit_events, DIFFICULTY, 120, 'Song', 'song.mp3', area_map.load(),
+            random_seed=3).contents()
+
+        self.assertEqual(original, hit_events)
+        # the adjacent hit events are still removed from the generated map
+        cleaned = [0, 1, 0, 0, 0] * 40 + [1, 0]
+        self.assertEqual(contents, utils.build_serializer(
+            cleaned, DIFFICULTY, 120, 'Song', 'song.mp3', area_map.load(),
+            random_seed=3).contents())
+
+
+if __name__ == '__main__':
+    unittest.main()
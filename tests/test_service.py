@@ -0,0 +1,277 @@
+import asyncio
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from aisu_circles import service
+
+
+def job_body(seed=7, **fields):
+    job = {
+        'song_name': 'Song',
+        'song_file_name': 'song.mp3',
+        'bpm': 120,
+        'hit_events': {'medium': [0, 1, 0, 1], 'hard': [1, 0, 1, 1]},
+        'seed': seed
+    }
+    job.update(fields)
+
+    return json.dumps(job).encode('utf-8')
+
+
+class ParseJobTest(unittest.TestCase):
+    def test_parse_job(self):
+        job = service.parse_job(job_body())
+
+        self.assertEqual('Song', job['song_name'])
+        self.assertEqual([1, 0, 1, 1], job['hit_events']['hard'])
+
+        self.assertEqual(90.5, service.parse_job(job_body(bpm=90.5))['bpm'])
+        self.assertIsNone(service.parse_job(job_body(seed=None))['seed'])
+
+    def test_parse_job_invalid(self):
+        bodies = [
+            b'{not json',
+            b'[1, 2]',
+            json.dumps({'song_name': 'Song'}).encode('utf-8'),
+            job_body(hit_events={'medium': [0, 1]}),
+            job_body(hit_events={'medium': [0, 2], 'hard': [1]}),
+            job_body(hit_events={'medium': ['0', '1'], 'hard': [1]}),
+            job_body(hit_events={'medium': [[0], [1]], 'hard': [1]}),
+            job_body(hit_events={'medium': [[0], 1], 'hard': [1]}),
+            job_body(hit_events={'medium': '0101', 'hard': [1]}),
+            job_body(audio='not base64!'),
+            job_body(bpm=0),
+            job_body(bpm=-60),
+            job_body(bpm=0.5),
+            job_body(bpm='fast'),
+            job_body(bpm=True),
+            job_body(bpm=None),
+            job_body(bpm=120).replace(b'120', b'Infinity'),
+            job_body(seed=[1, 2]),
+            job_body(seed=1.5),
+            job_body(seed='7'),
+            job_body(seed=True),
+            job_body(song_name=5),
+            job_body(song_file_name=None)
+        ]
+
+        for body in bodies:
+            with self.subTest(body=body):
+                with self.assertRaises(service.RequestError) as context:
+                    service.parse_job(body)
+                self.assertEqual(400, context.exception.status)
+
+    def test_job_key(self):
+        job = service.parse_job(job_body())
+        reordered = dict(reversed(list(job.items())))
+
+        self.assertEqual(service.job_key(job), service.job_key(reordered))
+        self.assertNotEqual(service.job_key(job),
+                            service.job_key(dict(job, seed=8)))
+
+    def test_prepare_job(self):
+        job, key = service.prepare_job(job_body())
+        self.assertEqual(service.job_key(job), key)
+
+        _, key = service.prepare_job(job_body(seed=None))
+        self.assertIsNone(key)
+
+
+class BlockingGenerator:
+    """
+    Stands in for `service.generate_osz`, holding every generation until
+    `release` is called
+    """
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._released = threading.Event()
+
+    def __call__(self, job):
+        with self._lock:
+            self.calls += 1
+        self._released.wait(5)
+
+        return self.result
+
+    def release(self):
+        self._released.set()
+
+
+class ServiceTest(unittest.TestCase):
+    def setUp(self):
+        # cleanups run last in, first out, so the server closes first
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown)
+
+    def serve(self, generator, max_pending=4):
+        """
+        Returns the service, running on an ephemeral port with `generator`
+        in place of `generate_osz`
+        """
+        patcher = mock.patch.object(service, 'generate_osz', generator)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        beatmap_service = service.BeatmapService(
+            self.executor, max_pending=max_pending)
+        server = self.loop.run_until_complete(asyncio.start_server(
+            beatmap_service.handle, '127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+
+        def close():
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+
+        self.addCleanup(close)
+
+        return beatmap_service
+
+    async def request(self, body, method='POST', path='/osz',
+                      content_length=None):
+        """
+        Returns
+        -------
+        (status, headers, body) of the response, with chunked bodies
+        decoded
+        """
+        reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                       self.port)
+        if content_length is None:
+            content_length = len(body)
+        writer.write('{} {} HTTP/1.1\r\nContent-Length: {}\r\n\r\n'.format(
+            method, path, content_length).encode('latin-1') + body)
+
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int(await reader.readline(), 16)
+                chunks.append(await reader.readexactly(size + 2))
+                if size == 0:
+                    break
+            response = b''.join(c[:-2] for c in chunks)
+        else:
+            response = await reader.read()
+
+        writer.close()
+
+        return status, headers, response
+
+    async def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+
+        self.fail('timed out')
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(
+            asyncio.wait_for(coroutine, 10))
+
+    def test_chunked_output(self):
+        osz = bytes(range(256)) * 1000
+        generator = BlockingGenerator(osz)
+        generator.release()
+        beatmap_service = self.serve(generator)
+
+        status, headers, body = self.run_async(self.request(job_body()))
+
+        self.assertEqual(200, status)
+        self.assertEqual('chunked', headers['transfer-encoding'])
+        self.assertEqual(service.OSZ_CONTENT_TYPE, headers['content-type'])
+        self.assertEqual(osz, body)
+        self.assertEqual(1, beatmap_service.stats['completed'])
+
+    def test_coalescing(self):
+        generator = BlockingGenerator(b'osz')
+        beatmap_service = self.serve(generator)
+
+        async def run():
+            requests = [asyncio.ensure_future(self.request(job_body()))
+                        for _ in range(3)]
+            await self.wait_for(
+                lambda: beatmap_service.stats['coalesced'] == 2)
+            generator.release()
+
+            return await asyncio.gather(*requests)
+
+        responses = self.run_async(run())
+
+        self.assertEqual(1, generator.calls)
+        self.assertEqual([(200, b'osz')] * 3,
+                         [(status, body) for status, _, body in responses])
+
+    def test_unseeded_jobs_not_coalesced(self):
+        generator = BlockingGenerator(b'osz')
+        beatmap_service = self.serve(generator)
+
+        async def run():
+            requests = [
+                asyncio.ensure_future(self.request(job_body(seed=None)))
+                for _ in range(2)]
+            await self.wait_for(lambda: beatmap_service.n_pending == 2)
+            generator.release()
+
+            return await asyncio.gather(*requests)
+
+        responses = self.run_async(run())
+
+        self.assertEqual(2, generator.calls)
+        self.assertEqual(0, beatmap_service.stats['coalesced'])
+        self.assertEqual([200, 200], [status for status, _, _ in responses])
+
+    def test_over_max_pending(self):
+        generator = BlockingGenerator(b'osz')
+        beatmap_service = self.serve(generator, max_pending=1)
+
+        async def run():
+            first = asyncio.ensure_future(self.request(job_body(seed=1)))
+            await self.wait_for(lambda: beatmap_service.n_pending == 1)
+            rejected = await self.request(job_body(seed=2))
+            generator.release()
+
+            return await first, rejected
+
+        first, rejected = self.run_async(run())
+
+        self.assertEqual(200, first[0])
+        self.assertEqual(503, rejected[0])
+        self.assertEqual('1', rejected[1]['retry-after'])
+        self.assertEqual(1, beatmap_service.stats['rejected'])
+
+    def test_negative_content_length(self):
+        self.serve(BlockingGenerator(b'osz'))
+
+        status, _, body = self.run_async(
+            self.request(b'', content_length=-1))
+
+        self.assertEqual(400, status)
+        self.assertIn('content-length', json.loads(body.decode())['error'])
+
+    def test_invalid_body(self):
+        self.serve(BlockingGenerator(b'osz'))
+
+        status, _, _ = self.run_async(self.request(b'{not json'))
+
+        self.assertEqual(400, status)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+import numpy as np
+
+from aisu_circles import timing
+
+
+class TimingTest(unittest.TestCase):
+    def test_frames_to_mls_scalar(self):
+        # 11.6 and 23.2 milliseconds, truncated
+        self.assertEqual(11, timing.frames_to_mls(0))
+        self.assertEqual(23, timing.frames_to_mls(1.0))
+        self.assertIsInstance(timing.frames_to_mls(1.0), int)
+
+    def test_frames_to_mls_array(self):
+        frames = [0, 1, 7, 1000, 123456]
+        expected = [timing.frames_to_mls(f) for f in frames]
+
+        for actual in (timing.frames_to_mls(frames),
+                       timing.frames_to_mls(np.array(frames))):
+            self.assertIsInstance(actual, np.ndarray)
+            self.assertEqual(np.int64, actual.dtype)
+            self.assertEqual(expected, actual.tolist())
+
+    def test_frames_to_mls_rounding(self):
+        frames = [0.3, 2.7, 10.999]
+        expected = [timing.frames_to_mls(f) for f in frames]
+
+        self.assertEqual(expected, timing.frames_to_mls(frames).tolist())
+
+    def test_frames_to_mls_invalid(self):
+        with self.assertRaises(ValueError):
+            timing.frames_to_mls('1')
+        with self.assertRaises(ValueError):
+            timing.frames_to_mls(['a', 'b'])
+
+    def test_frame_times(self):
+        times = timing.frame_times(50)
+
+        self.assertEqual(50, len(times))
+        self.assertEqual(timing.frames_to_mls(17), times[17])
+
+    def test_mls_to_frames(self):
+        frames = [0, 1, 7, 1000, 123456]
+
+        self.assertEqual(
+            frames, timing.mls_to_frames(timing.frames_to_mls(frames)).tolist())
+        self.assertEqual(7, timing.mls_to_frames(timing.frames_to_mls(7)))
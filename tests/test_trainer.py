@@ -0,0 +1,222 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+
+from aisu_circles import markov, timing, trainer
+
+# positions in areas 1, 7, 8 and 2
+POSITIONS = [(100, 100), (300, 200), (400, 300), (200, 150)]
+AREAS = [markov.get_area_number(*p) for p in POSITIONS]
+
+
+def interval_time(interval):
+    return timing.frames_to_mls(interval * markov.interval_frames)
+
+
+def osu_text(hit_objects):
+    lines = ['osu file format v14', '', '[General]',
+             'AudioFilename: song.mp3', '', '[TimingPoints]',
+             '0,500,4,2,0,100,1,0', '', '[HitObjects]']
+    lines.extend('{},{},{},1,0,0:0:0:0:'.format(*h) for h in hit_objects)
+
+    return '\n'.join(lines) + '\n'
+
+
+def song(positions):
+    """
+    Returns hit objects with one hit on the start of each interval
+    """
+    return [(x, y, interval_time(i)) for i, (x, y) in enumerate(positions)]
+
+
+class IterHitObjectsTest(unittest.TestCase):
+    def test_hit_objects_section_only(self):
+        lines = osu_text([(10, 20, 100)]).splitlines() + [
+            '10.5,20.7,200,2,0,B|30:40,1,100',
+            '256,192,300,12,0,400,0:0:0:0:',  # spinner
+            '256,192,350,8,0,400',  # spinner without new combo
+            'garbage',
+            '1,2',
+            'a,b,c,d',
+            '',
+            '30,40,500,5,0,0:0:0:0:',
+            '[Colours]',
+            '50,60,700,1,0,0:0:0:0:'
+        ]
+
+        self.assertListEqual([(10, 20, 100), (10, 20, 200), (30, 40, 500)],
+                             list(trainer.iter_hit_objects(lines)))
+
+    def test_no_hit_objects(self):
+        lines = ['[General]', '1,2,3,1,0']
+
+        self.assertListEqual([], list(trainer.iter_hit_objects(lines)))
+
+
+class SongAreasTest(unittest.TestCase):
+    def test_song_areas(self):
+        self.assertListEqual(AREAS, trainer.song_areas(song(POSITIONS)))
+
+    def test_gap(self):
+        hits = song(POSITIONS)
+        del hits[1]
+
+        self.assertListEqual([AREAS[0], -1] + AREAS[2:],
+                             trainer.song_areas(hits))
+
+    def test_hits_on_one_frame(self):
+        """
+        The last of several hits on a frame is used
+        """
+        hits = song(POSITIONS)
+        hits.insert(2, (100, 100, hits[1][2]))
+        hits.insert(1, (400, 300, hits[0][2]))
+
+        self.assertListEqual([AREAS[2], AREAS[0]] + AREAS[2:],
+                             trainer.song_areas(hits))
+
+    def test_empty(self):
+        self.assertListEqual([], trainer.song_areas([]))
+        # hits before the first frame are dropped
+        self.assertListEqual([], trainer.song_areas([(100, 100, 0)]))
+
+
+class TransitionCountsTest(unittest.TestCase):
+    def test_add_areas(self):
+        counts = trainer.TransitionCounts()
+        counts.add_areas([1, 7, 8, -1, 2, 1, 7, 2])
+
+        self.assertDictEqual({'1_7': [8, 2], '2_1': [7]},
+                             counts.to_path_map())
+        self.assertDictEqual({}, counts.ngrams)
+
+    def test_add_areas_higher_order(self):
+        counts = trainer.TransitionCounts(order=3)
+        counts.add_areas([1, 7, 8, 2])
+
+        self.assertEqual(1, counts.ngrams[(1, 7, 8, 2)])
+        self.assertEqual(1, counts.ngrams[(7, 8)])
+        self.assertListEqual([8], counts.to_path_map()['1_7'])
+
+    def test_merge(self):
+        first, second = trainer.TransitionCounts(3), \
+            trainer.TransitionCounts(3)
+        first.add_areas([1, 7, 8])
+        first.n_files = 1
+        second.add_areas([1, 7, 2])
+        second.n_files = 2
+        second.errors.append('bad.osz: error')
+
+        first.merge(second)
+
+        self.assertListEqual([8, 2], first.to_path_map()['1_7'])
+        self.assertEqual(2, first.ngrams[(1, 7)])
+        self.assertEqual(3, first.n_files)
+        self.assertListEqual(['bad.osz: error'], first.errors)
+
+    def test_to_area_model(self):
+        sequence = [1, 7, 8, 2, 1, 7, 8]
+        counts = trainer.TransitionCounts()
+        counts.add_areas(sequence)
+        higher_counts = trainer.TransitionCounts(order=3)
+        higher_counts.add_areas(sequence)
+
+        model = counts.to_area_model()
+        higher_model = higher_counts.to_area_model()
+
+        self.assertEqual(2, model.order)
+        self.assertEqual(
+            markov.AreaModel.from_path_map(counts.to_path_map()).digest,
+            model.digest)
+        self.assertEqual(3, higher_model.order)
+        self.assertEqual(
+            markov.AreaModel.from_sequences([sequence], 3).digest,
+            higher_model.digest)
+
+
+class CorpusTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        self.songs = [POSITIONS, POSITIONS[::-1], POSITIONS[1:] * 2]
+        self.osu = self.path('one.osu')
+        with open(self.osu, 'w', encoding='utf-8') as f:
+            f.write(osu_text(song(self.songs[0])))
+
+        self.osz = self.path('maps', 'two.osz')
+        os.makedirs(os.path.dirname(self.osz))
+        with zipfile.ZipFile(self.osz, 'w') as archive:
+            archive.writestr('a.osu', osu_text(song(self.songs[1])))
+            archive.writestr('b.osu', osu_text(song(self.songs[2])))
+            archive.writestr('song.mp3', b'not audio')
+
+    def path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    def expected_counts(self, order=markov.path_len):
+        counts = trainer.TransitionCounts(order)
+        for positions in self.songs:
+            counts.add_areas([markov.get_area_number(*p) for p in positions])
+
+        return counts
+
+    def test_count_files(self):
+        counts = trainer.count_files([self.osu, self.osz])
+
+        self.assertEqual(3, counts.n_files)
+        self.assertListEqual([], counts.errors)
+        self.assertDictEqual(self.expected_counts().to_path_map(),
+                             counts.to_path_map())
+
+    def test_count_files_errors(self):
+        not_a_zip = self.path('broken.osz')
+        with open(not_a_zip, 'w') as f:
+            f.write('not a zip')
+        missing = self.path('missing.osu')
+
+        counts = trainer.count_files([not_a_zip, self.osu, missing])
+
+        self.assertEqual(1, counts.n_files)
+        self.assertEqual(2, len(counts.errors))
+        self.assertTrue(counts.errors[0].startswith(not_a_zip + ': '))
+        self.assertTrue(counts.errors[1].startswith(missing + ': '))
+
+    def test_main(self):
+        output = self.path('area_path_map.json')
+        table = self.path('transitions.npy')
+        model = self.path('areas.npz')
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            status = trainer.main([self.directory, '--output', output,
+                                   '--table', table, '--model', model,
+                                   '--order', '3', '--workers', '1'])
+
+        expected = self.expected_counts(order=3)
+        self.assertEqual(0, status)
+        with open(output) as f:
+            self.assertDictEqual(expected.to_path_map(), json.load(f))
+        self.assertTrue(np.array_equal(expected.counts(), np.load(table)))
+        self.assertEqual(expected.to_area_model().digest,
+                         markov.AreaModel.load(model).digest)
+
+    def test_main_empty_corpus(self):
+        empty = self.path('empty')
+        os.makedirs(empty)
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            status = trainer.main([empty, '--output', self.path('out.json'),
+                                   '--workers', '1'])
+
+        self.assertEqual(1, status)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,15 @@
 from numbers import Number
+
+import numpy as np
+
 from .definitions import hop_length, n_fft
 
 
 def frames_to_mls(frames, hop_length=hop_length, n_fft=n_fft):
     """
-    Convert list of frame indices to list of milliseconds
+    Convert a frame index, or a list or array of frame indices, to whole
+    milliseconds, truncated like the times of .osu hit objects. Sequences
+    are converted in one step and returned as an int array
     """
     if hop_length is None or hop_length <= 0:
         raise ValueError(
@@ -15,12 +20,16 @@ def frames_to_mls(frames, hop_length=hop_length, n_fft=n_fft):
         raise ValueError(
             'n_fft must be positive integer. Received {}'.format(n_fft))
 
-    if type(frames) != list and not isinstance(frames, Number):
+    if isinstance(frames, (list, tuple, np.ndarray)):
+        frames = np.asarray(frames)
+        if frames.dtype.kind not in 'iuf':
+            raise ValueError(
+                'frames must contain numbers. Received array of type {}'
+                .format(frames.dtype))
+    elif not isinstance(frames, Number):
         raise ValueError(
             'frames must be either list of floats or a number. Received object {} of type {}'.format(
                 frames, type(frames)))
-    elif type(frames) == float:
-        frames = [frames]
 
     times = frame_to_time(
         frames,
@@ -28,7 +37,31 @@ def frames_to_mls(frames, hop_length=hop_length, n_fft=n_fft):
         n_fft=n_fft
     ) * 1000
 
-    return times
+    if isinstance(times, np.ndarray):
+        return np.trunc(times).astype(np.int64)
+
+    return int(times)
+
+
+def frame_times(n_frames, hop_length=hop_length, n_fft=n_fft) -> np.ndarray:
+    """
+    Returns array of the time in milliseconds of every frame of a song with
+    `n_frames` frames, so hit objects can look their times up by frame index
+    """
+    return frames_to_mls(np.arange(n_frames), hop_length=hop_length,
+                         n_fft=n_fft)
+
+
+def mls_to_frames(mls, hop_length=hop_length, n_fft=n_fft, sr=22050):
+    """
+    Inverse of `frames_to_mls`. Returns the nearest frame index of each
+    time in milliseconds, as an int array for sequences
+    """
+    frames = np.rint(
+        (np.asarray(mls, dtype=float) * sr / 1000 - n_fft // 2) / hop_length
+    ).astype(np.int64)
+
+    return frames if frames.ndim else int(frames)
 
 
 """
@@ -45,6 +78,10 @@ def frame_to_samples(frame, hop_length=512, n_fft=None):
     if n_fft is not None:
         offset = int(n_fft // 2)
 
+    if isinstance(frame, np.ndarray):
+        # truncate towards zero like int()
+        return np.trunc(frame * hop_length + offset).astype(np.int64)
+
     return int(frame * hop_length + offset)
 
 
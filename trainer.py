@@ -0,0 +1,293 @@
+"""
+Rebuild the area path map from a corpus of beatmaps.
+
+Usage
+-----
+python -m aisu_circles.trainer corpus/ more_maps.osz --workers 8 \
+    --output area_path_map.json --table transitions.npy
+
+Arguments are .osu files, .osz archives or directories searched
+recursively for both. Hit objects are parsed line by line, bucketed into
+`markov.interval_frames` intervals, and the area after every pair of
+areas is recorded. Files are counted in chunks over a process pool and
+the partial counts merged in corpus order, so the output does not depend
+on the number of workers.
+
+--output writes the legacy JSON map (area pair -> list of observed next
+areas), loadable with `area_map.load`. --table writes the compiled
+(n_areas, n_areas, n_areas) count array `markov.TransitionTable` is built
+from. --model writes a `markov.AreaModel` of order --order, conditioning
+each area on up to that many previous areas, loadable with
+`markov.AreaModel.load`.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import zipfile
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator, List
+
+import numpy as np
+
+from . import markov, timing
+
+BEATMAP_EXTENSIONS = ('.osu', '.osz')
+SPINNER = 8
+
+
+class TransitionCounts:
+    """
+    Mergeable partial result of training: the areas observed after every
+    pair of areas, in corpus order
+    """
+
+    def __init__(self, order=markov.path_len):
+        self.order = order
+        self.observations = defaultdict(list)
+        self.ngrams = {}
+        self.n_files = 0
+        self.errors = []
+
+    def add_areas(self, areas: List[int]):
+        """
+        Record every transition in a song's sequence of interval areas.
+        Transitions through intervals without a hit (-1) are skipped
+        """
+        for i in range(len(areas) - markov.path_len):
+            path = areas[i:i + markov.path_len + 1]
+            if min(path) >= 0:
+                self.observations[markov.area_key(*path[:-1])].append(
+                    path[-1])
+
+        if self.order != markov.path_len:
+            self._add_ngrams(markov.ngram_counts([areas], self.order))
+
+    def merge(self, other: 'TransitionCounts'):
+        for key, next_areas in other.observations.items():
+            self.observations[key].extend(next_areas)
+        self._add_ngrams(other.ngrams)
+        self.n_files += other.n_files
+        self.errors.extend(other.errors)
+
+    def to_path_map(self) -> dict:
+        return {key: list(value) for key, value in self.observations.items()}
+
+    def counts(self) -> np.ndarray:
+        return markov.TransitionTable.from_path_map(self.to_path_map()).counts
+
+    def to_area_model(self) -> markov.AreaModel:
+        if self.order == markov.path_len:
+            return markov.AreaModel.from_path_map(self.to_path_map())
+
+        return markov.AreaModel.from_ngram_counts(self.ngrams, self.order)
+
+    def _add_ngrams(self, ngrams: dict):
+        for gram, count in ngrams.items():
+            self.ngrams[gram] = self.ngrams.get(gram, 0) + count
+
+
+def iter_hit_objects(lines) -> Iterator[tuple]:
+    """
+    Yields (x, y, time) of every hit circle and slider in the [HitObjects]
+    section of .osu file lines, without reading the rest of the file
+    """
+    in_hit_objects = False
+
+    for line in lines:
+        line = line.strip()
+
+        if line.startswith('['):
+            if in_hit_objects:
+                return
+            in_hit_objects = line == '[HitObjects]'
+            continue
+
+        if not in_hit_objects or not line:
+            continue
+
+        try:
+            x, y, time, type_ = (int(float(v)) for v in
+                                 line.split(',', 4)[:4])
+        except ValueError:
+            continue
+
+        if not type_ & SPINNER:
+            yield x, y, time
+
+
+def song_areas(hit_objects) -> List[int]:
+    """
+    Returns the area of the hit closest to the start of each interval of a
+    song, or -1 where no hit is close enough
+    """
+    hits = np.array(list(hit_objects), dtype=float).reshape(-1, 3)
+    frames = timing.mls_to_frames(hits[:, 2])
+    valid = frames >= 0
+    hits, frames = hits[valid], frames[valid]
+
+    if len(frames) == 0:
+        return []
+
+    # one hit per frame, the last one written wins
+    order = np.argsort(frames, kind='stable')
+    frames, hits = frames[order], hits[order]
+    last = np.append(frames[1:] != frames[:-1], True)
+    frames, hits = frames[last], hits[last]
+
+    # intervals run up to the last hit
+    closest = markov.nearest_interval_hits(
+        frames, frames[-1] + markov.interval_frames)
+    positions = np.full((len(closest), 2), -1.0)
+    found = closest >= 0
+    positions[found] = hits[np.searchsorted(frames, closest[found]), :2]
+
+    return markov.GRID.area_numbers(positions).tolist()
+
+
+def iter_beatmap_files(paths) -> Iterator[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(BEATMAP_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def iter_osu_streams(file_name) -> Iterator[io.TextIOBase]:
+    """
+    Yields an open text stream for every .osu file in `file_name`, which
+    is either a .osu file or a .osz archive
+    """
+    if file_name.lower().endswith('.osz'):
+        with zipfile.ZipFile(file_name) as archive:
+            for name in sorted(archive.namelist()):
+                if name.lower().endswith('.osu'):
+                    with archive.open(name) as f:
+                        yield io.TextIOWrapper(f, encoding='utf-8-sig',
+                                               errors='replace')
+    else:
+        with open(file_name, 'r', encoding='utf-8-sig',
+                  errors='replace') as f:
+            yield f
+
+
+def count_files(file_names, order=markov.path_len) -> TransitionCounts:
+    """
+    Returns the transition counts of a chunk of files. Runs in a worker
+    process
+    """
+    counts = TransitionCounts(order)
+
+    for file_name in file_names:
+        try:
+            for stream in iter_osu_streams(file_name):
+                counts.add_areas(song_areas(iter_hit_objects(stream)))
+                counts.n_files += 1
+        except (OSError, zipfile.BadZipFile, UnicodeDecodeError) as e:
+            counts.errors.append('{}: {}'.format(file_name, e))
+
+    return counts
+
+
+def _chunks(iterable, size) -> Iterator[list]:
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def train(paths, max_workers=None, chunk_size=64, progress=None,
+          order=markov.path_len) -> TransitionCounts:
+    """
+    Count transitions in every beatmap under `paths` over a process pool.
+    At most a few chunks per worker are in flight, so the corpus is
+    streamed rather than listed up front.
+
+    Params
+    ------
+    progress: optional callable(TransitionCounts) called after each chunk
+    with the counts merged so far
+    order: number of previous areas counted for `TransitionCounts.ngrams`
+    """
+    total = TransitionCounts(order)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        max_in_flight = 4 * (max_workers or os.cpu_count() or 1)
+        in_flight = deque()
+
+        for chunk in _chunks(iter_beatmap_files(paths), chunk_size):
+            in_flight.append(executor.submit(count_files, chunk, order))
+
+            while len(in_flight) >= max_in_flight:
+                total.merge(in_flight.popleft().result())
+                if progress is not None:
+                    progress(total)
+
+        while in_flight:
+            total.merge(in_flight.popleft().result())
+            if progress is not None:
+                progress(total)
+
+    return total
+
+
+def write_path_map(counts: TransitionCounts, file_name):
+    with open(file_name, 'w') as f:
+        json.dump(counts.to_path_map(), f)
+
+
+def _print_progress(counts: TransitionCounts):
+    print('{} beatmaps, {} errors'.format(counts.n_files, len(counts.errors)),
+          file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Rebuild the area path map from .osu and .osz files')
+    parser.add_argument('paths', nargs='+',
+                        help='.osu files, .osz archives or directories')
+    parser.add_argument('--output', default='area_path_map.json',
+                        help='legacy JSON path map to write')
+    parser.add_argument('--table', default=None,
+                        help='also write the compiled transition counts to '
+                             'this .npy file')
+    parser.add_argument('--model', default=None,
+                        help='also write a markov.AreaModel to this .npz '
+                             'file')
+    parser.add_argument('--order', type=int, default=markov.path_len,
+                        help='number of previous areas the --model '
+                             'conditions on')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: cpu count)')
+    parser.add_argument('--chunk-size', type=int, default=64,
+                        help='files counted per task')
+    args = parser.parse_args(argv)
+
+    if args.order < 1:
+        parser.error('--order must be at least 1')
+
+    counts = train(args.paths, args.workers, args.chunk_size,
+                   _print_progress, args.order)
+
+    for error in counts.errors:
+        print(error, file=sys.stderr)
+
+    write_path_map(counts, args.output)
+    if args.table is not None:
+        np.save(args.table, counts.counts())
+    if args.model is not None:
+        counts.to_area_model().save(args.model)
+
+    return 0 if counts.n_files else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,10 @@
 import os
-import json
 import glob
-from zipfile import ZipFile
-from . import definitions
+
+import numpy as np
+
+from . import area_map, definitions, instrumentation, osz
+from .cache import hit_objects_key, osu_file_key, path_map_digest
 from .serialize import Serializer
 from .predictor import SectionPredictor
 
@@ -28,9 +30,14 @@ def get_hard_diff_data():
     }
 
 
+DIFFICULTIES = {
+    'medium': get_medium_diff_data,
+    'hard': get_hard_diff_data
+}
+
+
 def load_path_map():
-    with open(definitions.AREA_MAP, 'r') as f:
-        return json.load(f)
+    return area_map.load()
 
 
 def bpm_to_beat_duration_mls(bpm):
@@ -43,56 +50,218 @@ def get_hit_objects(
         remove_extras=True,
         return_areas=False
 ):
-    print('loading probability matrix...')
     if remove_extras:
-        adjacent_hit_event = False
-        for i, x in enumerate(hit_events):
-            if adjacent_hit_event and x == 1:
-                hit_events[i] = 0
-            elif adjacent_hit_event:
-                adjacent_hit_event = False
-            elif x == 1:
-                adjacent_hit_event = True
+        remove_extra_hit_events(hit_events)
 
     return predictor.predict(return_areas=return_areas)
 
 
+def remove_extra_hit_events(hit_events):
+    """
+    Keep only the first hit event of each run of adjacent hit events,
+    in place
+    """
+    adjacent_hit_event = False
+    for i, x in enumerate(hit_events):
+        if adjacent_hit_event and x == 1:
+            hit_events[i] = 0
+        elif adjacent_hit_event:
+            adjacent_hit_event = False
+        elif x == 1:
+            adjacent_hit_event = True
+
+
+def remove_extra_stream_hit_events(hit_event_chunks):
+    """
+    `remove_extra_hit_events` for hit events arriving in chunks. Runs of
+    adjacent hit events are followed across chunk boundaries
+
+    Returns
+    -------
+    Generator of cleaned copies of the chunks
+    """
+    previous = 0
+    for chunk in hit_event_chunks:
+        chunk = np.array(chunk, dtype=np.int64)
+        if len(chunk) == 0:
+            continue
+
+        before = np.concatenate([[previous], chunk[:-1]])
+        previous = chunk[-1]
+        chunk[(chunk == 1) & (before == 1)] = 0
+
+        yield chunk
+
+
 def build_osu_files(hit_event_set, bpm, song_name, song_file_name,
                     osu_file_name):
-    hit_events = [hit_event_set['medium'], hit_event_set['hard']]
-    difficulty_data = [get_medium_diff_data(), get_hard_diff_data()]
+    path_map = load_path_map()
+
+    for difficulty in ('medium', 'hard'):
+        build_osu_file(
+            hit_event_set[difficulty],
+            DIFFICULTIES[difficulty](),
+            bpm,
+            song_name,
+            song_file_name,
+            osu_file_name,
+            path_map=path_map
+        )
 
-    for hit_events, difficulty_data in zip(hit_events, difficulty_data):
-        model_version = definitions.MODEL_VERSION
 
-        beats_duration = bpm_to_beat_duration_mls(bpm)
-        prob_mat = load_path_map()
-        predictor = SectionPredictor(prob_mat, hit_events, beats_duration,
-                                     difficulty_data['slider_multiplier'])
-        hit_objects = get_hit_objects(hit_events, predictor, return_areas=False)
+def build_osu_file(hit_events, difficulty_data, bpm, song_name,
+                   song_file_name, osu_file_name, path_map=None,
+                   random_seed=None, cache=None) -> str:
+    """
+    Generate and write the .osu file for a single difficulty. If a
+    cache.HitObjectCache is given and the seed is fixed, previously
+    generated files are written straight from the cache
 
-        print('Writing hit objects to .osu file...')
-        serializer = Serializer(
-            hit_objects,
+    Returns
+    -------
+    Name of the written file
+    """
+    if path_map is None:
+        path_map = load_path_map()
+
+    model_version = definitions.MODEL_VERSION
+
+    beats_duration = bpm_to_beat_duration_mls(bpm)
+    file_name_with_difficulty = osu_file_name.format(
+        difficulty_data['name']
+    )
+
+    osu_key = None
+    if cache is not None and random_seed is not None:
+        osu_key = osu_file_key(
+            hit_objects_key(hit_events, beats_duration,
+                            difficulty_data['slider_multiplier'],
+                            random_seed, path_map_digest(path_map)),
             model_version,
             song_file_name,
             song_name,
             beats_duration,
             difficulty_data
         )
+        file_contents = cache.get(osu_key)
 
-        file_name_with_difficulty = osu_file_name.format(
-            difficulty_data['name']
-        )
+        if file_contents is not None:
+            _write_text(file_name_with_difficulty, file_contents)
+            return file_name_with_difficulty
+
+    serializer = build_serializer(hit_events, difficulty_data, bpm,
+                                  song_name, song_file_name, path_map,
+                                  random_seed=random_seed, cache=cache)
+
+    if osu_key is not None:
+        file_contents = serializer.contents()
+        _write_text(file_name_with_difficulty, file_contents)
+        cache.put(osu_key, file_contents)
+    else:
         serializer.write(file_name_with_difficulty)
-        print('finished writing osu file to tmp')
+
+    return file_name_with_difficulty
+
+
+def build_serializer(hit_events, difficulty_data, bpm, song_name,
+                     song_file_name, path_map, random_seed=None,
+                     cache=None) -> Serializer:
+    """
+    Generate the hit objects for a single difficulty. `hit_events` is
+    left unchanged
+
+    Returns
+    -------
+    Serializer for the difficulty's .osu file
+    """
+    hit_events = np.array(hit_events, dtype=np.int64)
+    remove_extra_hit_events(hit_events)
+
+    beats_duration = bpm_to_beat_duration_mls(bpm)
+    predictor = SectionPredictor(path_map, hit_events, beats_duration,
+                                 difficulty_data['slider_multiplier'],
+                                 random_seed=random_seed, cache=cache)
+    hit_objects = predictor.predict_batch()
+
+    return Serializer(
+        hit_objects,
+        definitions.MODEL_VERSION,
+        song_file_name,
+        song_name,
+        beats_duration,
+        difficulty_data
+    )
+
+
+def build_stream_serializer(hit_event_chunks, difficulty_data, bpm,
+                            song_name, song_file_name, path_map,
+                            random_seed=None) -> Serializer:
+    """
+    Serializer generating a single difficulty's hit objects from hit events
+    arriving in chunks while it writes, so arbitrarily long songs are
+    written in bounded memory. The serializer can only be written once
+
+    Returns
+    -------
+    Serializer for the difficulty's .osu file
+    """
+    beats_duration = bpm_to_beat_duration_mls(bpm)
+    predictor = SectionPredictor(path_map, [], beats_duration,
+                                 difficulty_data['slider_multiplier'],
+                                 random_seed=random_seed)
+    hit_objects = predictor.predict_stream(
+        remove_extra_stream_hit_events(hit_event_chunks))
+
+    return Serializer(
+        hit_objects,
+        definitions.MODEL_VERSION,
+        song_file_name,
+        song_name,
+        beats_duration,
+        difficulty_data
+    )
+
+
+def _write_text(file_name, contents):
+    with open(file_name, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(contents)
 
 
 def zip_osz_file(osz_file, osu_files_dir):
-    with ZipFile(osz_file, 'w') as f:
-        files = glob.glob('{}/*'.format(osu_files_dir))
-        for file_name in files:
-            print('writing {} to osz archive'.format(file_name))
-            f.write(file_name, os.path.basename(file_name))
-    print('finished archiving.')
+    with instrumentation.stage('zipping') as stage, \
+            osz.OszWriter(osz_file) as writer:
+        for file_name in sorted(glob.glob('{}/*'.format(osu_files_dir))):
+            writer.add_file(os.path.basename(file_name), file_name)
+            stage.add()
+
+
+def build_osz_file(hit_event_set, bpm, song_name, song_file_name,
+                   audio=None, target=None, assets=None, random_seed=None,
+                   cache=None):
+    """
+    Generate every difficulty and package them with the audio and assets
+    into a .osz archive without writing intermediate .osu files.
+
+    Params
+    ------
+    audio: audio as bytes, file name or binary stream. Stored in the
+    archive as `song_file_name`
+    target: file name or binary stream, or None to build in memory
+
+    Returns
+    -------
+    Archive bytes if `target` is None, otherwise None
+    """
+    path_map = load_path_map()
+    serializers = [
+        build_serializer(hit_event_set[difficulty],
+                         DIFFICULTIES[difficulty](), bpm, song_name,
+                         song_file_name, path_map, random_seed=random_seed,
+                         cache=cache)
+        for difficulty in ('medium', 'hard')
+    ]
 
+    with instrumentation.stage('zipping') as stage:
+        stage.add(len(serializers))
+        return osz.build_osz(serializers, target=target, audio=audio,
+                             audio_name=song_file_name, assets=assets)